@@ -0,0 +1,103 @@
+"""
+Adaptive check frequency.
+
+Each product gets a weight from its recent price history: how often the
+price changes, how much it moves, and how close it is to the user's target.
+Its check interval is the tier's base interval scaled by the tier's mean
+weight over the product's weight, clamped to the tier bounds, so busy
+products are checked more often and quiet ones less, at roughly the same
+total fetch budget.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from config import (STANDARD_CHECK_INTERVAL, PREMIUM_CHECK_INTERVAL, STANDARD_INTERVAL_BOUNDS,
+                    PREMIUM_INTERVAL_BOUNDS, ADAPTIVE_HISTORY_DAYS)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse SQLite CURRENT_TIMESTAMP values (UTC)"""
+    return datetime.strptime(value[:19], TIMESTAMP_FORMAT)
+
+
+def format_timestamp(value: datetime) -> str:
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def tier_bounds(premium: bool):
+    """(base, lower, upper) check intervals in hours for a tier"""
+    if premium:
+        return (PREMIUM_CHECK_INTERVAL, *PREMIUM_INTERVAL_BOUNDS)
+    return (STANDARD_CHECK_INTERVAL, *STANDARD_INTERVAL_BOUNDS)
+
+
+def check_weight(history: List[Dict], current_price: float, target_price: Optional[float],
+                 premium: bool, now: Optional[datetime] = None) -> float:
+    """Relative check priority of a product; 1.0 means "behaves like the average product".
+
+    ``history`` is the product's recent price_history rows, oldest first.
+    """
+    now = now or utcnow()
+    base, _, _ = tier_bounds(premium)
+    prices = [row['price'] for row in history if row['price']]
+    if len(history) >= 2:
+        span_days = max((now - parse_timestamp(history[0]['recorded_at'])).total_seconds() / 86400, 1.0)
+    else:
+        span_days = 0.0
+
+    # Expected price changes per base interval
+    changes = sum(1 for previous, price in zip(prices, prices[1:]) if price != previous)
+    if span_days >= 3:
+        activity = 0.25 + changes / span_days * base / 24
+    else:
+        activity = 1.0  # too little history to judge
+
+    # Mean absolute relative move between consecutive observations
+    moves = [abs(price - previous) / previous for previous, price in zip(prices, prices[1:]) if previous]
+    volatility = sum(moves) / len(moves) if moves else 0.0
+
+    # Up to twice the weight as the price approaches the target from above
+    proximity = 1.0
+    if target_price and current_price and current_price > target_price:
+        gap = (current_price - target_price) / current_price
+        proximity = 1.0 + max(0.0, 1.0 - gap / 0.2)
+
+    return activity * (1.0 + 4.0 * min(volatility, 0.5)) * proximity
+
+
+def check_interval(weight: float, mean_weight: Optional[float], premium: bool) -> float:
+    """Hours until the next check for a product of the given weight"""
+    base, lower, upper = tier_bounds(premium)
+    if not weight or not mean_weight:
+        return float(base)
+    return min(upper, max(lower, base * mean_weight / weight))
+
+
+def next_check_at(hours: float, now: Optional[datetime] = None) -> str:
+    return format_timestamp((now or utcnow()) + timedelta(hours=hours))
+
+
+def plan_next_checks(products: List[Dict], history: Dict[int, List[Dict]],
+                     mean_weights: Dict[bool, float]) -> List[Dict]:
+    """Compute check_weight, check_interval and next_check_at for checked products"""
+    now = utcnow()
+    schedules = []
+    for product in products:
+        premium = bool(product['premium_features'])
+        weight = check_weight(history.get(product['id'], []), product['current_price'],
+                              product['target_price'], premium, now)
+        # Tiers without stats yet use this product's own weight, i.e. the base interval
+        hours = check_interval(weight, mean_weights.get(premium, weight), premium)
+        schedules.append({
+            'id': product['id'],
+            'next_check_at': next_check_at(hours, now),
+            'check_interval': hours,
+            'check_weight': weight,
+        })
+    return schedules
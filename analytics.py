@@ -0,0 +1,145 @@
+"""
+Batch price analytics.
+
+The whole price history is loaded as flat columns sorted by catalog key and
+time, so each catalog product's rows are one contiguous segment. A single
+pass over the columns computes, per catalog product: the current price, the
+all-time low, the 30 and 90-day low and mean, the median, the percent drop
+versus the median and a deal score. The results replace the product_stats
+table, where alerts and /history read them.
+
+NumPy does the pass with segment reductions when it is installed; otherwise
+the same figures are computed with a plain loop per product.
+
+rebuild_stats loads the history ANALYTICS_KEYS_PER_PAGE catalog products
+at a time, each page a short read, so the bot's writes interleave with
+the rebuild instead of waiting for one full-table read.
+"""
+import statistics
+import time
+from typing import Dict, List, Optional, Sequence
+
+from config import ANALYTICS_FULL_SCORE_DROP, ANALYTICS_KEYS_PER_PAGE
+
+try:
+    import numpy  # optional, vectorized analytics
+except ImportError:
+    numpy = None
+
+DAY = 86400
+DROP_WEIGHT = 0.6  # of the deal score; the rest is how close the price is to its 90-day low
+STAT_FIELDS = ('catalog_key', 'current_price', 'low_price', 'low_30d', 'mean_30d', 'low_90d', 'mean_90d',
+               'median_price', 'drop_vs_median', 'deal_score', 'samples')
+
+
+def deal_score(current: float, median: float, low_90d: Optional[float], high_90d: Optional[float]) -> float:
+    """0-100: the drop below the median price, and where the price sits in its 90-day range"""
+    drop = (median - current) / median * 100 if median > 0 else 0.0
+    drop_part = min(max(drop / ANALYTICS_FULL_SCORE_DROP, 0.0), 1.0)
+    if low_90d is not None and high_90d is not None and high_90d > low_90d:
+        low_part = min(max((high_90d - current) / (high_90d - low_90d), 0.0), 1.0)
+    else:
+        low_part = 0.0
+    return 100 * (DROP_WEIGHT * drop_part + (1 - DROP_WEIGHT) * low_part)
+
+
+def _compute_numpy(keys: Sequence[str], times: Sequence[float], prices: Sequence[float], now: float) -> List[Dict]:
+    keys = numpy.asarray(keys, dtype=object)
+    times = numpy.asarray(times, dtype=numpy.float64)
+    prices = numpy.asarray(prices, dtype=numpy.float64)
+    starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])
+    counts = numpy.diff(numpy.r_[starts, len(prices)])
+    current = prices[starts + counts - 1]
+    low = numpy.minimum.reduceat(prices, starts)
+
+    def window(days: int):
+        inside = times >= now - days * DAY
+        count = numpy.add.reduceat(inside.astype(numpy.int64), starts)
+        seen = count > 0
+        window_low = numpy.where(seen, numpy.minimum.reduceat(numpy.where(inside, prices, numpy.inf), starts), numpy.nan)
+        window_high = numpy.where(seen, numpy.maximum.reduceat(numpy.where(inside, prices, -numpy.inf), starts), numpy.nan)
+        total = numpy.add.reduceat(numpy.where(inside, prices, 0.0), starts)
+        mean = numpy.divide(total, count, out=numpy.full(len(starts), numpy.nan), where=seen)
+        return window_low, window_high, mean
+
+    low_30d, _, mean_30d = window(30)
+    low_90d, high_90d, mean_90d = window(90)
+    # Sort prices within each segment (segments keep their positions) with one argsort over
+    # segment + price scaled into [0, 0.5): much faster than a two-key lexsort, and prices
+    # too close to tell apart at that resolution make no difference to a median
+    segment = numpy.repeat(numpy.arange(len(starts)), counts)
+    scale = 2 * max(float(prices.max()), 0.0) or 1.0
+    ordered = prices[numpy.argsort(segment + numpy.maximum(prices, 0.0) / scale)]
+    median = (ordered[starts + (counts - 1) // 2] + ordered[starts + counts // 2]) / 2
+
+    drop = numpy.divide(median - current, median, out=numpy.zeros(len(starts)), where=median > 0) * 100
+    drop_part = numpy.clip(drop / ANALYTICS_FULL_SCORE_DROP, 0.0, 1.0)
+    spread = high_90d - low_90d
+    has_range = numpy.nan_to_num(spread) > 0
+    low_part = numpy.clip(numpy.divide(high_90d - current, spread, out=numpy.zeros(len(starts)), where=has_range),
+                          0.0, 1.0)
+    score = 100 * (DROP_WEIGHT * drop_part + (1 - DROP_WEIGHT) * low_part)
+
+    columns = [keys[starts], current, low, low_30d, mean_30d, low_90d, mean_90d, median, drop, score, counts]
+    # Windows a product has no prices in are NaN; stored as NULL
+    columns = [numpy.where(numpy.isnan(column), None, column) if column.dtype.kind == 'f' else column
+               for column in columns]
+    return [dict(zip(STAT_FIELDS, row)) for row in zip(*(column.tolist() for column in columns))]
+
+
+def _compute_python(keys: Sequence[str], times: Sequence[float], prices: Sequence[float], now: float) -> List[Dict]:
+    results = []
+    start = 0
+    for end in range(1, len(keys) + 1):
+        if end < len(keys) and keys[end] == keys[start]:
+            continue
+        segment = list(zip(times[start:end], prices[start:end]))
+        values = [price for _, price in segment]
+        last_30 = [price for at, price in segment if at >= now - 30 * DAY]
+        last_90 = [price for at, price in segment if at >= now - 90 * DAY]
+        current = values[-1]
+        median = statistics.median(values)
+        low_90d = min(last_90) if last_90 else None
+        high_90d = max(last_90) if last_90 else None
+        results.append({
+            'catalog_key': keys[start],
+            'current_price': current,
+            'low_price': min(values),
+            'low_30d': min(last_30) if last_30 else None,
+            'mean_30d': sum(last_30) / len(last_30) if last_30 else None,
+            'low_90d': low_90d,
+            'mean_90d': sum(last_90) / len(last_90) if last_90 else None,
+            'median_price': median,
+            'drop_vs_median': (median - current) / median * 100 if median > 0 else 0.0,
+            'deal_score': deal_score(current, median, low_90d, high_90d),
+            'samples': len(values),
+        })
+        start = end
+    return results
+
+
+def compute_stats(keys: Sequence[str], times: Sequence[float], prices: Sequence[float],
+                  now: Optional[float] = None, vectorized: bool = True) -> List[Dict]:
+    """Stats per catalog key from history columns sorted by key, then time (unix seconds)"""
+    if not keys:
+        return []
+    now = now or time.time()
+    if vectorized and numpy is not None:
+        return _compute_numpy(keys, times, prices, now)
+    return _compute_python(keys, times, prices, now)
+
+
+def rebuild_stats(database, keys_per_page: int = ANALYTICS_KEYS_PER_PAGE, now: Optional[float] = None) -> int:
+    """Recompute and replace product_stats on the calling thread; returns the products covered"""
+    now = now or time.time()
+    stats: List[Dict] = []
+    after = ''
+    while True:
+        columns = database.get_history_columns(after, keys_per_page)
+        if not columns['keys']:
+            break
+        # Pages end on key boundaries, so every product's rows are in one page
+        stats.extend(compute_stats(columns['keys'], columns['times'], columns['prices'], now))
+        after = columns['keys'][-1]
+    database.save_product_stats(stats)
+    return len(stats)
@@ -0,0 +1,283 @@
+"""
+Raw page archive and offline re-extraction.
+
+With ARCHIVE_ENABLED, every product page the scraper downloads is appended,
+compressed (zstd when the zstandard package is installed, zlib otherwise),
+to numbered segment files in ARCHIVE_DIR. Records are never rewritten;
+once there are more than ARCHIVE_MAX_SEGMENTS segments the oldest is
+deleted. The URL -> (segment, offset) index of the newest copy of each page
+is rebuilt at startup by walking the record headers.
+
+After fixing a broken selector, re-run the scrapers over the archive and
+store the prices the sweep failed to extract, without fetching anything:
+
+    python archive.py reextract --workers 4
+    python archive.py stats
+
+A running bot notices the backfill on its next product read (its hot set
+reloads when another process commits) and needs no restart. Backfilled
+prices send no alerts: see reextract.
+"""
+import argparse
+import logging
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import ARCHIVE_DIR, ARCHIVE_SEGMENT_MB, ARCHIVE_MAX_SEGMENTS
+from lazy import Lazy
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard  # optional, better ratio and speed than zlib
+except ImportError:
+    zstandard = None
+
+MAGIC = b'DFPA'
+# magic, codec, fetched_at (unix time), meta length, body length; meta is "<url>\n<site name>"
+RECORD_HEADER = struct.Struct('<4sBdHI')
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+SEGMENT_RE = re.compile(r'^segment-(\d{6})\.dat$')
+
+
+def compress(content: bytes) -> Tuple[int, bytes]:
+    if zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=3).compress(content)
+    return CODEC_ZLIB, zlib.compress(content, 6)
+
+
+def decompress(codec: int, body: bytes) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Archive record is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(body)
+    return zlib.decompress(body)
+
+
+class PageArchive:
+    """Append-only segmented store of compressed pages with an in-memory URL index"""
+
+    def __init__(self, directory: str = ARCHIVE_DIR, segment_bytes: int = ARCHIVE_SEGMENT_MB * 1024 * 1024,
+                 max_segments: int = ARCHIVE_MAX_SEGMENTS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.index: Dict[str, Tuple[int, int, float]] = {}  # url -> (segment, offset, fetched_at)
+        self._lock = threading.Lock()
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+        self.segments = self._list_segments()
+        self._valid_end = 0
+        for segment in self.segments:
+            self._valid_end = self._scan(segment)
+        self._segment = self.segments[-1] if self.segments else 0
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f'segment-{segment:06d}.dat')
+
+    def _list_segments(self) -> List[int]:
+        return sorted(int(match.group(1)) for match in map(SEGMENT_RE.match, os.listdir(self.directory)) if match)
+
+    def _scan(self, segment: int) -> int:
+        """Index a segment's records; returns the offset where its last whole record ends"""
+        path = self._path(segment)
+        size = os.path.getsize(path)
+        offset = 0
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                magic, _, fetched_at, meta_length, body_length = RECORD_HEADER.unpack(header)
+                meta = f.read(meta_length)
+                if magic != MAGIC or len(meta) < meta_length:
+                    break
+                end = offset + RECORD_HEADER.size + meta_length + body_length
+                if end > size:
+                    break
+                f.seek(end)
+                url = meta.decode('utf-8').split('\n', 1)[0]
+                self.index[url] = (segment, offset, fetched_at)
+                offset = end
+        if offset < size:
+            logger.warning(f"Ignoring unreadable tail of {path} after offset {offset}")
+        return offset
+
+    def put(self, url: str, site_name: str, content: bytes, fetched_at: Optional[float] = None):
+        """Append a fetched page; the newest copy of a URL is the one get() returns"""
+        fetched_at = fetched_at or time.time()
+        codec, body = compress(content)
+        meta = f"{url}\n{site_name}".encode('utf-8')
+        record = RECORD_HEADER.pack(MAGIC, codec, fetched_at, len(meta), len(body)) + meta + body
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                self._rotate()
+            offset = self._file.tell()
+            self._file.write(record)
+            self._file.flush()
+            self.index[url] = (self._segment, offset, fetched_at)
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._segment += 1
+        elif not self.segments or os.path.getsize(self._path(self._segment)) >= self.segment_bytes:
+            self._segment += 1
+        elif os.path.getsize(self._path(self._segment)) > self._valid_end:
+            # Only the writer repairs: cut a record torn by a crash before appending after it
+            logger.warning(f"Truncating torn record at {self._path(self._segment)}:{self._valid_end}")
+            with open(self._path(self._segment), 'r+b') as f:
+                f.truncate(self._valid_end)
+        if self._segment not in self.segments:
+            self.segments.append(self._segment)
+        self._file = open(self._path(self._segment), 'ab')
+        while len(self.segments) > self.max_segments:
+            oldest = self.segments.pop(0)
+            os.remove(self._path(oldest))
+            for url in [url for url, (segment, _, _) in self.index.items() if segment == oldest]:
+                del self.index[url]
+
+    def _read(self, segment: int, offset: int) -> Dict:
+        with open(self._path(segment), 'rb') as f:
+            f.seek(offset)
+            _, codec, fetched_at, meta_length, body_length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+            url, site_name = f.read(meta_length).decode('utf-8').split('\n', 1)
+            content = decompress(codec, f.read(body_length))
+        return {'url': url, 'site_name': site_name, 'fetched_at': fetched_at, 'content': content}
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Newest archived copy of a page: url, site_name, fetched_at (unix time) and content"""
+        location = self.index.get(url)
+        if location is None:
+            return None
+        try:
+            return self._read(location[0], location[1])
+        except FileNotFoundError:
+            return None  # the segment was rotated out meanwhile
+
+    def latest(self, urls: Optional[List[str]] = None) -> Iterator[Dict]:
+        """Newest copy of each (or each given) archived URL, in file order"""
+        wanted = None if urls is None else set(urls)
+        with self._lock:
+            locations = [(location, url) for url, location in self.index.items() if wanted is None or url in wanted]
+        for (segment, offset, _), url in sorted(locations):
+            try:
+                yield self._read(segment, offset)
+            except FileNotFoundError:
+                continue
+
+    def stats(self) -> Dict:
+        sizes = [os.path.getsize(self._path(segment)) for segment in self.segments]
+        return {'segments': len(self.segments), 'bytes': sum(sizes), 'urls': len(self.index)}
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# Global archive; only built (and ARCHIVE_DIR only created) when something archives or reads pages
+archive = Lazy(PageArchive)
+
+
+def parse_archived(page: Dict) -> Tuple[str, Optional[Dict], Optional[str]]:
+    """Run the current scraper over one archived page; (url, product info or None, failure cause)"""
+    from resilience import ScrapeError
+    from scraper import scraper
+    try:
+        return page['url'], scraper.parse_product_page(page['content'], page['url'], page['site_name']), None
+    except ScrapeError as e:
+        return page['url'], None, e.cause
+
+
+def reextract(page_archive: PageArchive, workers: int = 4, everything: bool = False,
+              dry_run: bool = False, batch_size: int = 256) -> Dict:
+    """Re-parse archived pages in parallel and store the prices the sweep missed.
+
+    By default only pages of tracked products fetched after the product's
+    last successful check are parsed; ``everything`` re-parses the whole
+    archive (e.g. to measure the selectors) but still only writes prices
+    for those pages.
+
+    Prices are written with Database.update_product_prices, which records
+    history and top drops but evaluates no alerts: this process can't
+    message users. Target and drop-threshold subscriptions stay armed, so a
+    backfilled price at or below a threshold alerts on the product's next
+    regular check if it still holds. The plain "price dropped" alert for
+    the backfilled change is not sent.
+    """
+    from datetime import datetime
+    from adaptive import format_timestamp
+    from db import db
+
+    by_url: Dict[str, List[Dict]] = {}
+    for product in db.get_all_tracked_products():
+        by_url.setdefault(product['url'], []).append(product)
+
+    def missed(page: Dict) -> List[Dict]:
+        fetched = format_timestamp(datetime.utcfromtimestamp(page['fetched_at']))
+        return [product for product in by_url.get(page['url'], ()) if (product['last_checked'] or '') < fetched]
+
+    wanted = None if everything else list(by_url)
+    counts = {'parsed': 0, 'failed': 0, 'backfilled': 0}
+    failures: Dict[str, int] = {}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pages = page_archive.latest(wanted)
+        while True:
+            batch = []
+            for page in pages:
+                if everything or missed(page):
+                    batch.append(page)
+                if len(batch) >= batch_size:
+                    break
+            if not batch:
+                break
+            updates = []
+            batch_pages = {page['url']: page for page in batch}
+            for url, info, cause in executor.map(parse_archived, batch, chunksize=16):
+                if info is None:
+                    counts['failed'] += 1
+                    failures[cause] = failures.get(cause, 0) + 1
+                    continue
+                counts['parsed'] += 1
+                for product in missed(batch_pages[url]):
+                    updates.append((product['id'], info['price'], info['currency']))
+            counts['backfilled'] += len(updates)
+            if updates and not dry_run:
+                db.update_product_prices(updates)
+    counts['seconds'] = time.perf_counter() - started
+    counts.update({f'failed_{cause}': count for cause, count in sorted(failures.items())})
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='DealFinder page archive')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('reextract', help='Re-run the scrapers over archived pages and backfill prices')
+    run.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    run.add_argument('--all', action='store_true', help='Re-parse every archived page, not just missed ones')
+    run.add_argument('--dry-run', action='store_true', help="Parse but don't write prices")
+    commands.add_parser('stats', help='Segments, size and URLs in the archive')
+    args = parser.parse_args(argv)
+
+    if args.command == 'stats':
+        results = archive.stats()
+    else:
+        results = reextract(archive, args.workers, args.all, args.dry_run)
+    for key, value in results.items():
+        print(f"{key}: {value:,.2f}" if isinstance(value, float) else f"{key}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import queue
+import threading
+from typing import List
+
+from config import DB_WORKERS, DB_MAX_PENDING, DB_BATCH_SIZE
+from db import db as default_db, Database
+from lazy import Lazy
+from metrics import registry, DB_QUEUE_DEPTH, DB_BATCHED_WRITES
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ('method', 'args', 'kwargs', 'loop', 'future')
+
+    def __init__(self, method: str, args, kwargs, loop, future):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.loop = loop
+        self.future = future
+
+
+class AsyncDatabase:
+    """Awaitable facade over Database.
+
+    ``await adb.get_user(user_id)`` queues the call for dedicated database
+    threads, so SQLite never blocks the event loop. The queue is bounded:
+    when DB_MAX_PENDING calls are waiting, callers wait for room. Workers
+    drain up to DB_BATCH_SIZE queued calls at a time and merge queued
+    update_product_price calls into one update_product_prices transaction.
+    """
+
+    # Methods whose queued calls are merged: method -> (batch method, argument tuple builder)
+    BATCHED = {
+        'update_product_price': ('update_product_prices', lambda product_id, new_price, currency: (product_id, new_price, currency)),
+    }
+
+    def __init__(self, database, workers: int = DB_WORKERS, max_pending: int = DB_MAX_PENDING,
+                 batch_size: int = DB_BATCH_SIZE):
+        self.database = database
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._threads = [
+            threading.Thread(target=self._worker, name=f'db-{index}', daemon=True)
+            for index in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        registry.add_collector(self.collect_metrics)
+
+    def collect_metrics(self):
+        DB_QUEUE_DEPTH.set(self._queue.qsize())
+
+    def __getattr__(self, name):
+        # Checked on the class so that looking up a method never builds the Database on the loop
+        if name.startswith('_') or not callable(getattr(Database, name, None)):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self.call(name, *args, **kwargs)
+        call.__name__ = name
+        return call
+
+    async def call(self, method: str, *args, **kwargs):
+        """Run ``Database.<method>(*args, **kwargs)`` on a database thread"""
+        loop = asyncio.get_running_loop()
+        item = _Call(method, args, kwargs, loop, loop.create_future())
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                break
+            except queue.Full:
+                # Backpressure: let the workers catch up without blocking the loop
+                await asyncio.sleep(0.005)
+        return await item.future
+
+    def _worker(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._execute(batch)
+
+    def _execute(self, batch: List[_Call]):
+        merged = {}
+        for item in batch:
+            if item.method in self.BATCHED:
+                merged.setdefault(item.method, []).append(item)
+            else:
+                self._run(item)
+        # Order is kept within a method; callers needing read-after-write await their own write first
+        for method, items in merged.items():
+            batch_method, build = self.BATCHED[method]
+            try:
+                getattr(self.database, batch_method)([build(*item.args, **item.kwargs) for item in items])
+            except Exception as e:
+                logger.error(f"Batched {method} of {len(items)} calls failed: {e}")
+                for item in items:
+                    self._resolve(item, exception=e)
+                continue
+            DB_BATCHED_WRITES.inc(len(items))
+            for item in items:
+                self._resolve(item, None)
+
+    def _run(self, item: _Call):
+        try:
+            result = getattr(self.database, item.method)(*item.args, **item.kwargs)
+        except Exception as e:
+            self._resolve(item, exception=e)
+        else:
+            self._resolve(item, result)
+
+    @staticmethod
+    def _resolve(item: _Call, result=None, exception: Exception = None):
+        def settle():
+            if item.future.done():
+                return  # the caller was cancelled
+            if exception is not None:
+                item.future.set_exception(exception)
+            else:
+                item.future.set_result(result)
+        try:
+            item.loop.call_soon_threadsafe(settle)
+        except RuntimeError:
+            pass  # the caller's event loop is already closed
+
+
+# Global async database facade
+adb = Lazy(lambda: AsyncDatabase(default_db))
@@ -0,0 +1,953 @@
+"""
+Sweep load generator and throughput benchmark.
+
+Fills a scratch deal_finder.db with synthetic users and products (Zipf
+popularity over URLs), serves the product pages from a local fake shop,
+mocks the Telegram Bot and runs the scheduler's due-check tick
+(check_due_products) end to end, with every product due.
+With --interactive, user lookups of unseen URLs run alongside the sweep
+and their latency, per-lane queue waits and hedged requests are reported;
+--slow-rate makes a share of pages straggle to exercise hedging.
+
+The stress command hammers Database.add_product from many threads and
+compares it with the old multi-connection add path, checking that no user
+ends up above max_products.
+
+The parse command times the current scrapers over the pages in a page
+archive, e.g. one recorded with sweep --archive DIR.
+
+The egress command fetches through local stand-in proxies (a healthy
+one, a slow one, one that gets blocked and one that is down) and checks
+that the egress pool steers traffic to the healthy proxy and quarantines
+the bad ones. A share of the shop's pages are unparseable (sold out, as
+after a layout change): those must never count against an egress, so the
+healthy proxy must never be quarantined.
+
+The analytics command fills a scratch database with synthetic price
+history, rebuilds product_stats from it and checks that the NumPy pass
+and the plain Python one agree.
+
+The startup command measures cold start in fresh interpreters: importing
+bot.py, opening the database (first run and with the schema already in
+place) and building the scraper.
+
+Usage:
+    python benchmark.py sweep --users 500 --urls 2000 --products 1500
+    python benchmark.py sweep --interactive 20 --interactive-gap-ms 50
+    python benchmark.py stress --threads 16 --users 50 --limit 5
+    python benchmark.py sweep --archive /tmp/pages && python benchmark.py parse --archive /tmp/pages
+    python benchmark.py egress --requests 300
+    python benchmark.py analytics --products 5000 --points 200
+    python benchmark.py startup --runs 3
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import math
+import os
+import random
+import resource
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+SITE_HOSTS = {
+    'amazon': ['www.amazon.com', 'www.amazon.co.uk', 'www.amazon.de'],
+    'aliexpress': ['www.aliexpress.com'],
+    'jumia': ['www.jumia.com.ng', 'www.jumia.co.ke'],
+    'konga': ['www.konga.com'],
+}
+
+PAGE_TEMPLATES = {
+    'amazon': (
+        '<html><head><title>{title}</title></head><body>'
+        '<span id="productTitle">{title}</span>'
+        '<span class="a-price"><span class="a-offscreen">{symbol}{price:.2f}</span></span>'
+        '<img id="landingImage" src="https://img.example/{key}.jpg"/>'
+        '</body></html>'
+    ),
+    'aliexpress': (
+        '<html><body><h1 class="product-title-text">{title}</h1>'
+        '<div class="product-price-value">US ${price:.2f}</div>'
+        '<div class="magnifier-image" src="https://img.example/{key}.jpg"></div>'
+        '</body></html>'
+    ),
+    'jumia': (
+        '<html><body><h1 class="title">{title}</h1>'
+        '<span class="price">{symbol} {price:,.2f}</span>'
+        '<div class="product-image"><img src="https://img.example/{key}.jpg"/></div>'
+        '</body></html>'
+    ),
+    'konga': (
+        '<html><body><h1 class="product-title">{title}</h1>'
+        '<div class="current-price">₦{price:,.2f}</div>'
+        '<div class="gallery-image"><img src="https://img.example/{key}.jpg"/></div>'
+        '</body></html>'
+    ),
+}
+
+BROKEN_PAGE = '<html><body><h1>This item is sold out</h1></body></html>'
+# Below this many requests the blocked proxy may never fail three times in a row
+EGRESS_VERDICT_MIN_REQUESTS = 200
+
+LD_JSON_TEMPLATE = (
+    '<script type="application/ld+json">'
+    '{{"@context":"https://schema.org","@type":"Product","name":"{title}",'
+    '"image":"https://img.example/{key}.jpg",'
+    '"offers":{{"@type":"Offer","price":"{price:.2f}","priceCurrency":"{code}"}}}}'
+    '</script>'
+)
+
+HOST_CURRENCIES = {
+    'www.amazon.co.uk': 'GBP',
+    'www.amazon.de': 'EUR',
+    'www.jumia.com.ng': 'NGN',
+    'www.jumia.co.ke': 'KES',
+    'www.konga.com': 'NGN',
+}
+
+HOST_SYMBOLS = {
+    'www.amazon.com': '$',
+    'www.amazon.co.uk': '£',
+    'www.amazon.de': '€',
+    'www.jumia.com.ng': '₦',
+    'www.jumia.co.ke': 'KSh',
+}
+
+
+def base_price(key: str) -> float:
+    """Deterministic baseline price for a synthetic product key"""
+    return 5 + (zlib.crc32(key.encode()) % 100000) / 100
+
+
+def site_for_host(host: str) -> str:
+    for site_name, hosts in SITE_HOSTS.items():
+        if host in hosts:
+            return site_name
+    return 'amazon'
+
+
+def make_url(index: int) -> str:
+    """Build a synthetic product URL that the real scraper accepts"""
+    rng = random.Random(index)
+    site_name = rng.choice(list(SITE_HOSTS))
+    host = rng.choice(SITE_HOSTS[site_name])
+    if site_name == 'amazon':
+        return f"https://{host}/dp/B{index:09d}"
+    if site_name == 'aliexpress':
+        return f"https://{host}/item/{1005000000000 + index}.html"
+    return f"https://{host}/product-{index}.html"
+
+
+class FakeShop:
+    """Local HTTP server that renders synthetic product pages"""
+
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 25,
+                 error_rate: float = 0.02, drop_rate: float = 0.2, structured_ratio: float = 0.5,
+                 seed: int = 1, slow_rate: float = 0.0, slow_ms: float = 2000, broken_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.structured_ratio = structured_ratio
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.broken_rate = broken_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        shop = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                shop.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            if self.random.random() < self.slow_rate:
+                delay += self.slow_ms / 1000  # a straggling edge node
+            failed = self.random.random() < self.error_rate
+            dropped = self.random.random() < self.drop_rate
+            broken = self.random.random() < self.broken_rate
+        time.sleep(delay)
+        if failed:
+            with self.lock:
+                self.errors += 1
+            request.send_response(503)
+            request.send_header('Content-Length', '0')
+            request.end_headers()
+            return
+        # Path is /<original host>/<original path>
+        host, _, path = request.path.lstrip('/').partition('/')
+        key = f"{host}/{path}"
+        site_name = site_for_host(host)
+        price = base_price(key)
+        if dropped:
+            price = round(price * random.uniform(0.8, 0.99), 2)
+        fields = {
+            'title': f"Synthetic product {path}",
+            'price': price,
+            'symbol': HOST_SYMBOLS.get(host, '$'),
+            'code': HOST_CURRENCIES.get(host, 'USD'),
+            'key': zlib.crc32(key.encode()),
+        }
+        if broken:
+            html = BROKEN_PAGE  # the page arrives but has no product on it
+        else:
+            html = PAGE_TEMPLATES[site_name].format(**fields)
+        # A share of pages carries JSON-LD, like real shops do
+        if not broken and fields['key'] % 100 < self.structured_ratio * 100:
+            html = html.replace('<body>', '<body>' + LD_JSON_TEMPLATE.format(**fields), 1)
+        body = html.encode('utf-8')
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/html; charset=utf-8')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def route_to_shop(session, port: int):
+    """Mount an adapter that sends every request to the local fake shop"""
+    from requests.adapters import HTTPAdapter
+
+    class LocalShopAdapter(HTTPAdapter):
+        def send(self, request, **kwargs):
+            parsed = urlparse(request.url)
+            request.url = f"http://127.0.0.1:{port}/{parsed.netloc}{parsed.path}"
+            return super().send(request, **kwargs)
+
+    adapter = LocalShopAdapter(pool_connections=32, pool_maxsize=32)
+    # Replace every mounted adapter, including the per-shop pools
+    for prefix in list(session.adapters) + ['http://', 'https://']:
+        session.mount(prefix, adapter)
+
+
+class StandInProxy:
+    """Local forward proxy standing in for one egress: relays to the fake shop, optionally slow or blocked"""
+
+    CAPTCHA_PAGE = b'<html><body><h4>Robot Check</h4><form action="/errors/validateCaptcha"></form></body></html>'
+
+    def __init__(self, delay_ms: float = 0, block_rate: float = 0.0, seed: int = 1):
+        self.delay_ms = delay_ms
+        self.block_rate = block_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                proxy.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        with self.lock:
+            self.requests += 1
+            blocked = self.random.random() < self.block_rate
+            captcha = self.random.random() < 0.5
+        time.sleep(self.delay_ms / 1000)
+        if blocked:
+            # Blocks show up either as a CAPTCHA page or as a 403
+            body = self.CAPTCHA_PAGE if captcha else b''
+            request.send_response(200 if captcha else 403)
+            request.send_header('Content-Length', str(len(body)))
+            request.end_headers()
+            request.wfile.write(body)
+            return
+        # Proxies receive the absolute URL: http://127.0.0.1:<shop>/<host>/<path>
+        target = urlparse(request.path)
+        connection = http.client.HTTPConnection(target.hostname, target.port, timeout=10)
+        try:
+            connection.request('GET', target.path)
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+        request.send_response(response.status)
+        request.send_header('Content-Type', response.getheader('Content-Type', 'text/html'))
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def closed_port_url() -> str:
+    """URL of a local port nothing listens on, standing in for a dead proxy"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+class MockBot:
+    """Stand-in for aiogram.Bot that only counts outgoing messages"""
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        self.sent += 1
+
+
+def zipf_indices(count: int, population: int, exponent: float, rng: random.Random) -> list:
+    """Draw URL indices following a Zipf popularity distribution"""
+    weights = [1 / (rank ** exponent) for rank in range(1, population + 1)]
+    return rng.choices(range(population), weights=weights, k=count)
+
+
+def populate(db_path: str, users: int, urls: int, products: int,
+             premium_ratio: float, target_ratio: float, exponent: float, seed: int):
+    """Fill a fresh database with synthetic users and tracked products"""
+    from db import Database
+
+    database = Database()
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        'INSERT INTO users (telegram_id, username, referral_code, max_products, premium_features) '
+        'VALUES (?, ?, ?, ?, ?)',
+        [
+            (user_id, f"user{user_id}", uuid.uuid4().hex[:8].upper(), 1000,
+             rng.random() < premium_ratio)
+            for user_id in range(1, users + 1)
+        ]
+    )
+    rows = []
+    for url_index in zipf_indices(products, urls, exponent, rng):
+        url = make_url(url_index)
+        parsed = urlparse(url)
+        price = base_price(f"{parsed.netloc}{parsed.path}")
+        target = round(price * 0.9, 2) if rng.random() < target_ratio else 0.0
+        site_name = site_for_host(parsed.netloc)
+        rows.append((
+            rng.randint(1, users), url, f"Synthetic product {parsed.path}", price, target,
+            '$', None, database.add_affiliate_tag(url, site_name), site_name
+        ))
+    conn.executemany(
+        'INSERT INTO products (user_id, url, title, current_price, target_price, currency, '
+        'image_url, affiliate_url, site_name) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        rows
+    )
+    conn.commit()
+    conn.close()
+    return len(set(row[1] for row in rows))
+
+
+def run_sweep(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='dealfinder-bench-')
+    db_path = os.path.join(workdir, 'deal_finder.db')
+    os.environ['DATABASE_PATH'] = db_path
+    # The fake shop is routed through a requests adapter, so stay on HTTP/1.1
+    os.environ['HTTP2_ENABLED'] = '0'
+    if args.archive:
+        os.environ['ARCHIVE_ENABLED'] = '1'
+        os.environ['ARCHIVE_DIR'] = args.archive
+
+    distinct_urls = populate(db_path, args.users, args.urls, args.products,
+                             args.premium_ratio, args.target_ratio, args.zipf, args.seed)
+
+    import scheduler
+    from config import MAX_CHECKS_PER_TICK
+    from db import db
+    from egress import RateLimiter
+    from scraper import scraper
+
+    shop = FakeShop(args.latency_ms, args.jitter_ms, args.error_rate,
+                    args.drop_rate, args.structured_ratio, args.seed, args.slow_rate, args.slow_ms).start()
+    for egress in scraper.egress.egresses:
+        route_to_shop(egress.transport.session, shop.port)
+        if not args.respect_rate_limits:
+            # The fake shop has no block threshold; measure raw pipeline throughput
+            egress.rate_limiters = {name: RateLimiter(0) for name in egress.rate_limiters}
+
+    writes = 0
+    # The async facade merges queued price updates into update_product_prices batches
+    update_product_prices = db.update_product_prices
+
+    def counting_update(updates):
+        nonlocal writes
+        writes += len(updates)
+        return update_product_prices(updates)
+
+    db.update_product_prices = counting_update
+    bot = MockBot(args.bot_latency_ms)
+
+    lookup_seconds = []
+
+    async def interactive_lookups():
+        from pipeline import pipeline
+        from lanes import INTERACTIVE
+        for index in range(args.interactive):
+            await asyncio.sleep(args.interactive_gap_ms / 1000)
+            started = time.perf_counter()
+            try:
+                await pipeline.fetch(make_url(args.urls + index), INTERACTIVE)
+            except Exception:
+                pass
+            lookup_seconds.append(time.perf_counter() - started)
+
+    compare_seconds = []
+
+    async def marketplace_lookups():
+        from pipeline import pipeline
+        domains = [host[len('www.'):] for host in SITE_HOSTS['amazon']]
+        for index in range(args.compare):
+            await asyncio.sleep(args.interactive_gap_ms / 1000)
+            started = time.perf_counter()
+            await pipeline.compare_marketplaces(f"https://www.amazon.com/dp/C{index:09d}", domains)
+            compare_seconds.append(time.perf_counter() - started)
+
+    async def sweep():
+        lookups = asyncio.gather(interactive_lookups(), marketplace_lookups())
+        # The rows inserted above have no next_check_at yet, so all of them are due; each
+        # tick takes at most MAX_CHECKS_PER_TICK, like the scheduler's interval job
+        for _ in range(-(-args.products // MAX_CHECKS_PER_TICK)):
+            await scheduler.check_due_products(bot)
+        await lookups
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    asyncio.run(sweep())
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    shop.stop()
+    pool = scraper.pool_stats()
+    connections = sum(host['connections'] for host in pool.values())
+
+    from metrics import FETCH_QUEUE_SECONDS, HEDGED_FETCHES
+    from lanes import LANES
+    lanes = {}
+    for winner in ('primary', 'hedge'):
+        lanes[f'hedges_won_by_{winner}'] = int(sum(HEDGED_FETCHES.value(site=site, winner=winner)
+                                                  for site in SITE_HOSTS))
+    for lane in LANES:
+        waited = FETCH_QUEUE_SECONDS.count(lane=lane)
+        lanes[f'queue_wait_ms_{lane}'] = FETCH_QUEUE_SECONDS.total(lane=lane) / waited * 1000 if waited else 0.0
+    if lookup_seconds:
+        lookup_seconds.sort()
+        lanes['interactive_p50_ms'] = lookup_seconds[len(lookup_seconds) // 2] * 1000
+        lanes['interactive_p90_ms'] = lookup_seconds[int(len(lookup_seconds) * 0.9)] * 1000
+        lanes['interactive_max_ms'] = lookup_seconds[-1] * 1000
+    if compare_seconds:
+        compare_seconds.sort()
+        lanes['compare_p50_ms'] = compare_seconds[len(compare_seconds) // 2] * 1000
+        lanes['compare_max_ms'] = compare_seconds[-1] * 1000
+
+    return {
+        'products': args.products,
+        'distinct_urls': distinct_urls,
+        'sweep_seconds': elapsed,
+        'fetches': shop.requests,
+        'fetch_errors': shop.errors,
+        'fetches_per_sec': shop.requests / elapsed if elapsed else 0.0,
+        'db_writes': writes,
+        'db_writes_per_sec': writes / elapsed if elapsed else 0.0,
+        'notifications': bot.sent,
+        'notifications_per_sec': bot.sent / elapsed if elapsed else 0.0,
+        'connections_opened': connections,
+        'connection_reuse': 1 - connections / shop.requests if shop.requests else 0.0,
+        'peak_traced_mb': peak / 1024 / 1024,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        **lanes,
+        'database': db_path,
+    }
+
+
+def legacy_add_product(database, user_id: int, url: str, price: float):
+    """The original add path: user, count and inserts in separate connections, for comparison"""
+    user = database.get_user(user_id)
+    if not user:
+        raise ValueError("User not found")
+    conn = sqlite3.connect(database.db_path)
+    count = conn.execute('SELECT COUNT(*) FROM products WHERE user_id = ?', (user_id,)).fetchone()[0]
+    conn.close()
+    if count >= user['max_products']:
+        raise ValueError("limit reached")
+    conn = sqlite3.connect(database.db_path)
+    cursor = conn.execute(
+        'INSERT INTO products (user_id, url, title, current_price, target_price, currency, site_name) '
+        'VALUES (?, ?, ?, ?, 0.0, ?, ?)', (user_id, url, 'Stress product', price, '$', 'amazon')
+    )
+    conn.execute('INSERT INTO price_history (product_id, price, currency) VALUES (?, ?, ?)',
+                 (cursor.lastrowid, price, '$'))
+    conn.commit()
+    conn.close()
+
+
+def run_add_stress(database, add, user_ids: list, threads: int, attempts: int) -> dict:
+    """Run ``add(user_id, url)`` from many threads at once and audit the result"""
+    counts = {'added': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(worker_id: int):
+        barrier.wait()
+        for attempt in range(attempts):
+            user_id = user_ids[(worker_id + attempt) % len(user_ids)]
+            url = f"https://www.amazon.com/dp/STRESS{worker_id:03d}{attempt:05d}"
+            try:
+                add(user_id, url)
+                outcome = 'added'
+            except ValueError:
+                outcome = 'rejected'
+            except sqlite3.Error:
+                outcome = 'errors'
+            with lock:
+                counts[outcome] += 1
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    conn = sqlite3.connect(database.db_path)
+    marks = ','.join('?' * len(user_ids))
+    rows = conn.execute(f'''
+        SELECT u.max_products, u.product_count, COUNT(p.id)
+        FROM users u LEFT JOIN products p ON p.user_id = u.telegram_id
+        WHERE u.telegram_id IN ({marks})
+        GROUP BY u.telegram_id
+    ''', user_ids).fetchall()
+    conn.close()
+    total = threads * attempts
+    return {
+        'attempts': total,
+        **counts,
+        'seconds': elapsed,
+        'attempts_per_sec': total / elapsed if elapsed else 0.0,
+        'users_over_limit': sum(1 for limit, _, actual in rows if actual > limit),
+        'count_mismatches': sum(1 for _, counter, actual in rows if counter != actual),
+    }
+
+
+def run_stress(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='dealfinder-stress-')
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'deal_finder.db')
+    from db import db
+
+    # Separate user ranges so both add paths start from empty quotas
+    legacy_users = list(range(1, args.users + 1))
+    atomic_users = list(range(args.users + 1, 2 * args.users + 1))
+    conn = sqlite3.connect(db.db_path)
+    conn.executemany(
+        'INSERT INTO users (telegram_id, username, referral_code, max_products) VALUES (?, ?, ?, ?)',
+        [(user_id, f"user{user_id}", uuid.uuid4().hex[:8].upper(), args.limit)
+         for user_id in legacy_users + atomic_users]
+    )
+    conn.commit()
+    conn.close()
+
+    def legacy(user_id, url):
+        legacy_add_product(db, user_id, url, 10.0)
+
+    def atomic(user_id, url):
+        db.add_product(user_id, url, 'Stress product', 10.0, '$', target_price=0.0, site_name='amazon')
+
+    return {
+        'legacy': run_add_stress(db, legacy, legacy_users, args.threads, args.attempts),
+        'atomic': run_add_stress(db, atomic, atomic_users, args.threads, args.attempts),
+    }
+
+
+def run_parse(args) -> dict:
+    from archive import PageArchive
+    from resilience import ScrapeError
+    from scraper import scraper
+
+    pages = list(PageArchive(args.archive).latest())[:args.limit or None]
+    if not pages:
+        raise SystemExit(f"No archived pages in {args.archive}")
+    failures = 0
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for page in pages:
+            try:
+                scraper.parse_product_page(page['content'], page['url'], page['site_name'])
+            except ScrapeError:
+                failures += 1
+    elapsed = time.perf_counter() - started
+    parsed = len(pages) * args.rounds
+    return {
+        'pages': len(pages),
+        'archived_bytes': sum(len(page['content']) for page in pages),
+        'parses': parsed,
+        'failures': failures,
+        'seconds': elapsed,
+        'pages_per_sec': parsed / elapsed if elapsed else 0.0,
+        'ms_per_page': elapsed / parsed * 1000,
+    }
+
+
+def run_egress(args) -> dict:
+    # The fake shop is routed through a requests adapter, so stay on HTTP/1.1
+    os.environ['HTTP2_ENABLED'] = '0'
+    from concurrent.futures import ThreadPoolExecutor
+    from egress import EgressPool, RateLimiter
+    from resilience import ScrapeError
+    from scraper import ProductScraper
+
+    shop = FakeShop(args.latency_ms, args.jitter_ms, 0.0, 0.0, 0.5, args.seed, broken_rate=args.broken_rate).start()
+    stand_ins = {
+        'healthy': StandInProxy(seed=args.seed).start(),
+        'slow': StandInProxy(delay_ms=args.slow_ms, seed=args.seed).start(),
+        'blocked': StandInProxy(block_rate=args.block_rate, seed=args.seed).start(),
+    }
+    roles = {proxy.url: role for role, proxy in stand_ins.items()}
+    dead = closed_port_url()
+    roles[dead] = 'dead'
+    lock = threading.Lock()
+
+    scraper = ProductScraper()
+    scraper.egress = EgressPool(list(roles), direct=False)
+    for egress in scraper.egress.egresses:
+        route_to_shop(egress.transport.session, shop.port)
+        egress.rate_limiters = {name: RateLimiter(0) for name in egress.rate_limiters}
+    # Count quarantines as they happen: a quarantine can expire, or be forgiven, before the run ends
+    quarantines = {role: 0 for role in roles.values()}
+    record = scraper.egress.record
+
+    def counting_record(egress, site_name, outcome, seconds):
+        health = egress.health[site_name]
+        before = health.quarantined_until
+        record(egress, site_name, outcome, seconds)
+        if health.quarantined_until != before and health.quarantined_until:
+            with lock:
+                quarantines[roles[egress.proxy]] += 1
+
+    scraper.egress.record = counting_record
+
+    outcomes = {'ok': 0, 'failed': 0}
+
+    def fetch(index):
+        try:
+            scraper.extract_product_info(make_url(index), use_cache=False)
+            result = 'ok'
+        except ScrapeError:
+            result = 'failed'
+        with lock:
+            outcomes[result] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(fetch, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    shop.stop()
+    for proxy in stand_ins.values():
+        proxy.stop()
+
+    from metrics import EGRESS_REQUESTS
+    results = {
+        'requests': args.requests,
+        'succeeded': outcomes['ok'],
+        'failed': outcomes['failed'],
+        'seconds': elapsed,
+    }
+    now = time.monotonic()
+    for egress in scraper.egress.egresses:
+        role = roles[egress.proxy]
+        results[f'{role}_requests'] = int(sum(EGRESS_REQUESTS.value(egress=egress.name, outcome=outcome)
+                                              for outcome in ('ok', 'error', 'blocked')))
+        results[f'{role}_mean_score'] = sum(health.score for health in egress.health.values()) / len(egress.health)
+        results[f'{role}_sites_quarantined'] = sum(1 for health in egress.health.values()
+                                                   if health.quarantined_until > now)
+        results[f'{role}_quarantines'] = quarantines[role]
+    results['healthy_share'] = results['healthy_requests'] / args.requests
+    # None: too few requests to expect the blocked proxy to have been caught
+    results['bad_egresses_quarantined'] = (quarantines['dead'] > 0 and quarantines['blocked'] > 0
+                                           if args.requests >= EGRESS_VERDICT_MIN_REQUESTS else None)
+    return results
+
+
+STARTUP_PROBE = '''
+import json, time
+started = time.perf_counter()
+import bot
+imported = time.perf_counter()
+from db import db
+db.hot_set
+db_ready = time.perf_counter()
+bot.scraper.session
+scraper_ready = time.perf_counter()
+print(json.dumps({
+    'import_bot_ms': (imported - started) * 1000,
+    'db_init_ms': (db_ready - imported) * 1000,
+    'scraper_init_ms': (scraper_ready - db_ready) * 1000,
+}))
+'''
+
+
+def run_analytics(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='dealfinder-analytics-')
+    db_path = os.path.join(workdir, 'deal_finder.db')
+    os.environ['DATABASE_PATH'] = db_path
+    import analytics
+    from db import Database
+
+    database = Database()
+
+    rng = random.Random(args.seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users (telegram_id, max_products) VALUES (1, ?)", (args.products,))
+    conn.executemany(
+        "INSERT INTO products (id, user_id, url, title, current_price, currency, site_name, catalog_key) "
+        "VALUES (?, 1, ?, 'Analytics product', 0, '$', 'amazon', ?)",
+        [(index, f"https://www.amazon.com/dp/A{index:09d}", f"bench:{index}") for index in range(1, args.products + 1)]
+    )
+    history = []
+    for index in range(1, args.products + 1):
+        price = base_price(f"bench:{index}")
+        for point in range(args.points):
+            price = max(1.0, price * (1 + rng.gauss(0, 0.03)))
+            days_ago = (args.points - point) * args.days / args.points
+            history.append((index, round(price, 2), f'-{days_ago:.4f} days'))
+    conn.executemany("INSERT INTO price_history (product_id, price, currency, recorded_at) "
+                     "VALUES (?, ?, '$', datetime('now', ?))", history)
+    conn.commit()
+    conn.close()
+
+    started = time.perf_counter()
+    columns = database.get_history_columns()
+    load_seconds = time.perf_counter() - started
+    args_ = (columns['keys'], columns['times'], columns['prices'], time.time())
+    started = time.perf_counter()
+    python_stats = analytics.compute_stats(*args_, vectorized=False)
+    python_seconds = time.perf_counter() - started
+    results = {
+        'history_rows': len(columns['keys']),
+        'products': len(python_stats),
+        'load_seconds': load_seconds,
+        'python_seconds': python_seconds,
+    }
+    stats = python_stats
+    if analytics.numpy is not None:
+        started = time.perf_counter()
+        stats = analytics.compute_stats(*args_)
+        results['numpy_seconds'] = time.perf_counter() - started
+        results['speedup'] = python_seconds / results['numpy_seconds'] if results['numpy_seconds'] else 0.0
+        mismatches = 0
+        for vectorized, plain in zip(stats, python_stats):
+            for field in analytics.STAT_FIELDS:
+                a, b = vectorized[field], plain[field]
+                if (a is None) != (b is None) or (isinstance(a, float) and not math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)):
+                    mismatches += 1
+                elif not isinstance(a, float) and a != b:
+                    mismatches += 1
+        results['mismatches'] = mismatches
+    else:
+        results['numpy_seconds'] = 'numpy not installed'
+    started = time.perf_counter()
+    database.save_product_stats(stats)
+    results['save_seconds'] = time.perf_counter() - started
+    # What the scheduler runs: load, compute and save, a page of catalog keys at a time
+    started = time.perf_counter()
+    results['paged_products'] = analytics.rebuild_stats(database)
+    results['paged_rebuild_seconds'] = time.perf_counter() - started
+    results['database'] = db_path
+    return results
+
+
+def probe_startup(db_path: str) -> dict:
+    """Import bot.py in a fresh interpreter; returns timings and bot's direct import costs"""
+    env = dict(os.environ, DATABASE_PATH=db_path, BOT_TOKEN=os.environ.get('BOT_TOKEN', '123456:benchmark'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_PROBE],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    imports, children = {}, {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"; nesting is shown by
+        # indentation and a module's imports are listed before the module itself
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative) / 1000
+        elif depth == 0:
+            if name.strip() == 'bot':
+                imports = children
+            children = {}
+    return {'timings': timings, 'imports': imports}
+
+
+def run_startup(args) -> dict:
+    db_path = os.path.join(tempfile.mkdtemp(prefix='dealfinder-startup-'), 'deal_finder.db')
+    cold = probe_startup(db_path)
+    warm = [probe_startup(db_path) for _ in range(args.runs)]
+
+    def mean(key):
+        return sum(run['timings'][key] for run in warm) / len(warm)
+
+    results = {
+        'import_bot_ms': mean('import_bot_ms'),
+        'db_init_cold_ms': cold['timings']['db_init_ms'],
+        'db_init_warm_ms': mean('db_init_ms'),
+        'scraper_init_ms': mean('scraper_init_ms'),
+    }
+    slowest = sorted(warm[-1]['imports'].items(), key=lambda item: item[1], reverse=True)[:args.top]
+    for name, ms in slowest:
+        results[f"import {name} (ms)"] = float(ms)
+    return results
+
+
+def print_report(title: str, results: dict):
+    print(f"\n{title}")
+    print('-' * len(title))
+    width = max(len(key) for key in results)
+    for key, value in results.items():
+        if isinstance(value, float):
+            value = f"{value:,.2f}"
+        print(f"{key:<{width}}  {value}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='DealFinder Bot benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sweep = commands.add_parser('sweep', help='End-to-end price check sweep')
+    sweep.add_argument('--users', type=int, default=200)
+    sweep.add_argument('--urls', type=int, default=500, help='Size of the URL catalog')
+    sweep.add_argument('--products', type=int, default=600, help='Tracked product rows')
+    sweep.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for URL popularity')
+    sweep.add_argument('--premium-ratio', type=float, default=0.3)
+    sweep.add_argument('--target-ratio', type=float, default=0.5)
+    sweep.add_argument('--latency-ms', type=float, default=50)
+    sweep.add_argument('--jitter-ms', type=float, default=25)
+    sweep.add_argument('--error-rate', type=float, default=0.02)
+    sweep.add_argument('--drop-rate', type=float, default=0.2, help='Share of pages served at a lower price')
+    sweep.add_argument('--structured-ratio', type=float, default=0.5, help='Share of pages with JSON-LD')
+    sweep.add_argument('--slow-rate', type=float, default=0.0, help='Share of pages delayed by --slow-ms')
+    sweep.add_argument('--slow-ms', type=float, default=2000)
+    sweep.add_argument('--bot-latency-ms', type=float, default=0)
+    sweep.add_argument('--respect-rate-limits', action='store_true', help="Keep each site's configured rate limit")
+    sweep.add_argument('--interactive', type=int, default=0, help='User lookups to run during the sweep')
+    sweep.add_argument('--interactive-gap-ms', type=float, default=20, help='Pause before each user lookup')
+    sweep.add_argument('--compare', type=int, default=0,
+                       help='Cross-marketplace Amazon lookups (one ASIN on every Amazon host) to run during the sweep')
+    sweep.add_argument('--archive', help='Record fetched pages to a page archive in this directory')
+    sweep.add_argument('--seed', type=int, default=1)
+
+    parse = commands.add_parser('parse', help='Parse throughput over archived pages')
+    parse.add_argument('--archive', required=True, help='Page archive directory')
+    parse.add_argument('--limit', type=int, default=0, help='Use at most this many pages (0 = all)')
+    parse.add_argument('--rounds', type=int, default=3)
+
+    stress = commands.add_parser('stress', help='Concurrent add_product quota stress test')
+    stress.add_argument('--threads', type=int, default=16)
+    stress.add_argument('--users', type=int, default=50)
+    stress.add_argument('--limit', type=int, default=5, help='max_products per user')
+    stress.add_argument('--attempts', type=int, default=100, help='Adds attempted per thread')
+
+    egress = commands.add_parser('egress', help='Egress pool routing against local stand-in proxies')
+    egress.add_argument('--requests', type=int, default=300)
+    egress.add_argument('--threads', type=int, default=8)
+    egress.add_argument('--latency-ms', type=float, default=20)
+    egress.add_argument('--jitter-ms', type=float, default=5)
+    egress.add_argument('--slow-ms', type=float, default=400, help='Extra delay added by the slow proxy')
+    egress.add_argument('--block-rate', type=float, default=0.6, help='Share of requests the blocked proxy fails')
+    egress.add_argument('--broken-rate', type=float, default=0.3,
+                        help='Share of shop pages with no product on them (parse errors)')
+    egress.add_argument('--seed', type=int, default=1)
+
+    analytics = commands.add_parser('analytics', help='Batch price analytics over synthetic history')
+    analytics.add_argument('--products', type=int, default=5000)
+    analytics.add_argument('--points', type=int, default=200, help='Price history rows per product')
+    analytics.add_argument('--days', type=float, default=180, help='Span of each product\'s history')
+    analytics.add_argument('--seed', type=int, default=1)
+
+    startup = commands.add_parser('startup', help='Cold start: import, DB init and scraper init times')
+    startup.add_argument('--runs', type=int, default=3, help='Warm runs to average')
+    startup.add_argument('--top', type=int, default=8, help='Slowest direct imports of bot.py to list')
+
+    args = parser.parse_args(argv)
+    if args.command == 'sweep':
+        print_report('Sweep benchmark', run_sweep(args))
+    elif args.command == 'parse':
+        print_report('Parse benchmark', run_parse(args))
+    elif args.command == 'egress':
+        results = run_egress(args)
+        print_report('Egress pool', results)
+        if results['healthy_quarantines']:
+            print('\nFAIL: the healthy proxy was quarantined (parse errors counted against it?)')
+            return 1
+        if results['bad_egresses_quarantined'] is None:
+            print(f'\nNot judging quarantines of the bad proxies below {EGRESS_VERDICT_MIN_REQUESTS} requests')
+        elif not results['bad_egresses_quarantined']:
+            print('\nFAIL: the dead or blocked proxy was never quarantined')
+            return 1
+    elif args.command == 'analytics':
+        results = run_analytics(args)
+        print_report('Price analytics', results)
+        if results.get('mismatches'):
+            print('\nFAIL: the NumPy and Python analytics disagree')
+            return 1
+    elif args.command == 'startup':
+        print_report('Startup benchmark', run_startup(args))
+    elif args.command == 'stress':
+        results = run_stress(args)
+        print_report('Legacy add_product', results['legacy'])
+        print_report('Atomic add_product', results['atomic'])
+        atomic = results['atomic']
+        if atomic['users_over_limit'] or atomic['count_mismatches']:
+            print('\nFAIL: add_product exceeded max_products or product_count drifted')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,28 @@
 import asyncio
+import functools
+import html
 import logging
+import re
+import time
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, BotCommand, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN, WELCOME_MESSAGE, HELP_MESSAGE
-from db import db
+from config import (BOT_TOKEN, WELCOME_MESSAGE, HELP_MESSAGE, METRICS_HOST, METRICS_PORT, PRODUCTS_PER_PAGE,
+                    BULK_IMPORT_MAX_URLS, BULK_IMPORT_MAX_FILE_BYTES, BULK_IMPORT_CATALOG_MAX_AGE,
+                    BULK_IMPORT_PROGRESS_INTERVAL, AMAZON_COMPARE_MARKETPLACES, DEALS_SHOWN, TOP_DROPS_MAX_AGE_DAYS,
+                    SEARCH_RESULTS_PER_PAGE, ADMIN_IDS, HISTORY_ROWS_SHOWN)
+from async_db import adb
 from scraper import scraper, clean_product_url
+from pipeline import pipeline
+from sites import sites
+from lanes import INTERACTIVE, PREMIUM, STANDARD
 from scheduler import start_scheduler
+from metrics import HANDLER_SECONDS, HANDLER_ERRORS, start_metrics_server
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,11 +36,104 @@ bot = Bot(token=BOT_TOKEN)
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+async def metrics_middleware(handler, event, data):
+    """Time every message and callback handler"""
+    handler_object = data.get('handler')
+    name = handler_object.callback.__name__ if handler_object else 'unknown'
+    started = time.perf_counter()
+    try:
+        return await handler(event, data)
+    except Exception:
+        HANDLER_ERRORS.inc(handler=name)
+        raise
+    finally:
+        HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+
+dp.message.middleware(metrics_middleware)
+dp.callback_query.middleware(metrics_middleware)
+
 # FSM States
 class ProductStates(StatesGroup):
     waiting_for_target_price = State()
 
-# Inline keyboard helpers
+# Static keyboards and templates, built once at import
+TRACK_CHOICE_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(text="✅ Start Tracking", callback_data="track_now"),
+            InlineKeyboardButton(text="🎯 Set Target Price", callback_data="track_target")
+        ]
+    ]
+)
+COMPARE_CHOICE_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=TRACK_CHOICE_KEYBOARD.inline_keyboard + [
+        [InlineKeyboardButton(text="🌍 Compare Amazon stores", callback_data="compare_stores")]
+    ]
+)
+
+BOT_COMMANDS = [
+    BotCommand(command="start", description="Get started with DealFinder Bot"),
+    BotCommand(command="help", description="How to use the bot"),
+    BotCommand(command="myproducts", description="View your tracked products"),
+    BotCommand(command="remove", description="Remove a tracked product"),
+    BotCommand(command="referral", description="Get your referral link and stats"),
+    BotCommand(command="limits", description="Check your tracking limits"),
+    BotCommand(command="history", description="View price history for products"),
+    BotCommand(command="deals", description="Today's biggest price drops"),
+    BotCommand(command="search", description="Find your tracked products by title"),
+]
+
+START_MESSAGE = (
+    "<b>🤖 Welcome to DealFinder Bot!</b>\n\n"
+    "Track prices and get alerts for your favorite products on <b>Amazon, AliExpress, Jumia, and Konga</b>.\n\n"
+    "<b>How it works:</b>\n"
+    "• Paste a product link to start tracking\n"
+    "• Set a target price (optional)\n"
+    "• Get notified when the price drops!\n\n"
+    "<b>Commands:</b>\n"
+    "/myproducts - View your tracked products\n"
+    "/remove - Remove a tracked product\n"
+    "/referral - Get your referral link\n"
+    "/limits - Check your tracking limits\n"
+    "/history - View price history\n"
+    "/deals - Today's biggest price drops\n"
+    "/search - Find your tracked products by title\n"
+    "/help - How to use the bot\n\n"
+    "<i>Invite friends to unlock more product slots and premium features!</i>"
+)
+
+REFERRAL_TEMPLATE = (
+    "🎁 <b>Your Referral Stats</b>\n\n"
+    "📊 Referrals: {referral_count}\n"
+    "📦 Product Slots: {max_products}\n"
+    "⭐ Premium Features: {premium}\n\n"
+    "🔗 <b>Your Referral Link:</b>\n"
+    "<code>https://t.me/{bot_username}?start={referral_code}</code>\n\n"
+    "💡 Share this link with friends to unlock more product slots!"
+)
+
+LIMITS_TEMPLATE = (
+    "📊 <b>Your Tracking Limits</b>\n\n"
+    "📦 Current Products: {current_count}\n"
+    "🔢 Maximum Products: {max_products}\n"
+    "⭐ Premium Features: {premium}\n\n"
+    "🎁 <b>How to unlock more:</b>\n"
+    "• Each referral = +1 product slot\n"
+    "• Premium users get faster price checks\n\n"
+    "Use /referral to get your referral link!"
+)
+
+# Product links in free text and uploaded .txt/.csv files
+URL_RE = re.compile(r'https?://[^\s,;"\'<>]+')
+
+# Bot username, fetched once by warm_up()
+bot_username = None
+
+def short_title(title: str, length: int = 30) -> str:
+    return title[:length] + "..." if len(title) > length else title
+
+# Inline keyboard helpers; keyboards are immutable once built, so they are cached
+@functools.lru_cache(maxsize=4096)
 def get_product_keyboard(product_id: int, affiliate_url: str) -> InlineKeyboardMarkup:
     """Create inline keyboard for product actions"""
     keyboard = [
@@ -41,38 +146,99 @@ def get_product_keyboard(product_id: int, affiliate_url: str) -> InlineKeyboardM
 
 def get_remove_keyboard(products: list) -> InlineKeyboardMarkup:
     """Create inline keyboard for removing products"""
-    keyboard = []
-    for product in products:
-        # Truncate title if too long
-        title = product['title'][:30] + "..." if len(product['title']) > 30 else product['title']
-        keyboard.append([
-            InlineKeyboardButton(
-                text=f"🗑 {title}",
-                callback_data=f"remove_{product['id']}"
-            )
-        ])
-    
+    return _remove_keyboard(tuple((product['id'], product['title']) for product in products))
+
+@functools.lru_cache(maxsize=1024)
+def _remove_keyboard(items: tuple) -> InlineKeyboardMarkup:
+    keyboard = [
+        [InlineKeyboardButton(text=f"🗑 {short_title(title)}", callback_data=f"remove_{product_id}")]
+        for product_id, title in items
+    ]
     keyboard.append([InlineKeyboardButton(text="❌ Cancel", callback_data="cancel_remove")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-async def set_bot_commands(bot: Bot):
-    commands = [
-        BotCommand(command="start", description="Get started with DealFinder Bot"),
-        BotCommand(command="help", description="How to use the bot"),
-        BotCommand(command="myproducts", description="View your tracked products"),
-        BotCommand(command="remove", description="Remove a tracked product"),
-        BotCommand(command="referral", description="Get your referral link and stats"),
-        BotCommand(command="limits", description="Check your tracking limits"),
-        BotCommand(command="history", description="View price history for products"),
-    ]
-    await bot.set_my_commands(commands)
+def get_history_keyboard(products: list) -> InlineKeyboardMarkup:
+    """Create inline keyboard for picking a product's price history"""
+    return _history_keyboard(tuple((product['id'], product['title']) for product in products))
+
+@functools.lru_cache(maxsize=1024)
+def _history_keyboard(items: tuple) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=short_title(title), callback_data=f"history_{product_id}")]
+            for product_id, title in items
+        ]
+    )
+
+# Rendered /myproducts pages per user: list of (text, keyboard)
+product_list_pages = {}
+
+def invalidate_product_list(event: str, record):
+    """Drop a user's cached /myproducts pages when one of their products changes"""
+    if record is None:
+        product_list_pages.clear()  # the whole hot set was reloaded
+    else:
+        product_list_pages.pop(record.user_id, None)
+
+def render_product_list(user: dict, products: list) -> list:
+    """Render a user's products as pages of (text, keyboard), PRODUCTS_PER_PAGE per page"""
+    page_count = max(1, -(-len(products) // PRODUCTS_PER_PAGE))
+    pages = []
+    for page in range(page_count):
+        start = page * PRODUCTS_PER_PAGE
+        lines = [
+            f"📦 <b>Your Tracked Products</b> ({len(products)}/{user['max_products']})",
+            "🎁 Refer friends to unlock more slots!",
+        ]
+        keyboard = []
+        for number, product in enumerate(products[start:start + PRODUCTS_PER_PAGE], start + 1):
+            title = html.escape(product['title'][:80] + "..." if len(product['title']) > 80 else product['title'])
+            price_text = f"{product['currency']}{product['current_price']:,.2f}"
+            target_text = f" · 🎯 {product['currency']}{product['target_price']:,.2f}" if product['target_price'] else ""
+            if product['drop_percent']:
+                target_text += f" · 📉 {product['drop_percent']:g}%"
+            lines.append(
+                f"\n<b>{number}. {title}</b>\n"
+                f"💰 {price_text}{target_text}\n"
+                f"🕒 Added: {product['created_at'][:10]}"
+            )
+            keyboard.append([
+                InlineKeyboardButton(text=f"🔍 {number}. View", url=product['affiliate_url']),
+                InlineKeyboardButton(text="📈 History", callback_data=f"history_{product['id']}"),
+                InlineKeyboardButton(text="🗑 Stop", callback_data=f"remove_{product['id']}")
+            ])
+        if page_count > 1:
+            keyboard.append([
+                InlineKeyboardButton(text="◀️", callback_data=f"products_page_{(page - 1) % page_count}"),
+                InlineKeyboardButton(text=f"{page + 1}/{page_count}", callback_data=f"products_page_{page}"),
+                InlineKeyboardButton(text="▶️", callback_data=f"products_page_{(page + 1) % page_count}")
+            ])
+        pages.append(("\n".join(lines), InlineKeyboardMarkup(inline_keyboard=keyboard)))
+    return pages
+
+async def get_product_list_pages(user_id: int) -> list:
+    """Cached /myproducts pages; None if the user doesn't exist"""
+    pages = product_list_pages.get(user_id)
+    if pages is None:
+        user = await adb.get_user(user_id)
+        if not user:
+            return None
+        pages = render_product_list(user, await adb.get_user_products(user_id))
+        product_list_pages[user_id] = pages
+    return pages
+
+async def warm_up(bot: Bot):
+    """Open the database, register commands and cache the bot's identity before taking updates"""
+    global bot_username
+    adb.database.hot_set.subscribe(invalidate_product_list)
+    await bot.set_my_commands(BOT_COMMANDS)
+    bot_username = (await bot.me()).username
 
 # In-memory store for last bot message per user
 user_last_bot_message = {}
 
 async def send_or_edit(user_id, text, parse_mode="HTML", reply_markup=None):
     """Edit the last bot message for the user, or send a new one if not possible."""
-    from aiogram.exceptions import TelegramBadRequest
     message_id = user_last_bot_message.get(user_id)
     try:
         if message_id:
@@ -108,36 +274,21 @@ async def cmd_start(message: types.Message):
     referred_by = None
     if message.text.startswith('/start '):
         referral_code = message.text.split()[1]
-        referrer = db.get_user_by_referral_code(referral_code)
+        referrer = await adb.get_user_by_referral_code(referral_code)
         if referrer and referrer['telegram_id'] != user_id:
             referred_by = referrer['telegram_id']
     
     # Create or get user
     # Only pass referred_by if not None
     if referred_by is not None:
-        referral_code = db.create_user(user_id, username, referred_by)
+        referral_code = await adb.create_user(user_id, username, referred_by)
+        # The referrer's slot count changed
+        product_list_pages.pop(referred_by, None)
     else:
-        referral_code = db.create_user(user_id, username)
+        referral_code = await adb.create_user(user_id, username)
     
     # Send welcome message
-    # Professional welcome message
-    welcome_text = (
-        "<b>🤖 Welcome to DealFinder Bot!</b>\n\n"
-        "Track prices and get alerts for your favorite products on <b>Amazon, AliExpress, Jumia, and Konga</b>.\n\n"
-        "<b>How it works:</b>\n"
-        "• Paste a product link to start tracking\n"
-        "• Set a target price (optional)\n"
-        "• Get notified when the price drops!\n\n"
-        "<b>Commands:</b>\n"
-        "/myproducts - View your tracked products\n"
-        "/remove - Remove a tracked product\n"
-        "/referral - Get your referral link\n"
-        "/limits - Check your tracking limits\n"
-        "/history - View price history\n"
-        "/help - How to use the bot\n\n"
-        "<i>Invite friends to unlock more product slots and premium features!</i>"
-    )
-    await send_or_edit(user_id, welcome_text)
+    await send_or_edit(user_id, START_MESSAGE)
     
     # If user was referred, send thank you message
     if referred_by:
@@ -158,40 +309,23 @@ async def cmd_help(message: types.Message):
 async def cmd_myproducts(message: types.Message):
     """Handle /myproducts command"""
     user_id = message.from_user.id
-    products = db.get_user_products(user_id)
-    
-    if not products:
+    if not await adb.get_user_product_count(user_id):
         await send_or_edit(user_id, "📦 You're not tracking any products yet.\nSend me a product link to get started!")
         return
     
-    user = db.get_user(user_id)
-    if not user:
+    pages = await get_product_list_pages(user_id)
+    if pages is None:
         await send_or_edit(user_id, "❌ User not found. Please use /start first.")
         return
-    header = (
-        f"📦 <b>Your Tracked Products</b> ({len(products)}/{user['max_products']})\n\n"
-        f"🎁 Refer friends to unlock more slots!"
-    )
-    await send_or_edit(user_id, header)
-    
-    for product in products:
-        price_text = f"{product['currency']}{product['current_price']:,.2f}"
-        target_text = f"\n🎯 Target: {product['currency']}{product['target_price']:,.2f}" if product['target_price'] else ""
-        
-        text = (
-            f"📦 <b>{product['title']}</b>\n"
-            f"💰 Current Price: {price_text}{target_text}\n"
-            f"🕒 Added: {product['created_at'][:10]}"
-        )
-        
-        keyboard = get_product_keyboard(product['id'], product['affiliate_url'])
-        await send_or_edit(user_id, text, reply_markup=keyboard)
+    # The whole list goes out as one message; pages are flipped with the inline keyboard
+    text, keyboard = pages[0]
+    await send_or_edit(user_id, text, reply_markup=keyboard)
 
 @dp.message(Command("remove"))
 async def cmd_remove(message: types.Message):
     """Handle /remove command"""
     user_id = message.from_user.id
-    products = db.get_user_products(user_id)
+    products = await adb.get_user_products(user_id)
     
     if not products:
         await send_or_edit(user_id, "📦 You're not tracking any products to remove.")
@@ -204,28 +338,23 @@ async def cmd_remove(message: types.Message):
 async def cmd_referral(message: types.Message):
     """Handle /referral command"""
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await adb.get_user(user_id)
     
     if not user:
         await send_or_edit(user_id, "❌ User not found. Please use /start first.")
         return
     
-    stats = db.get_referral_stats(user_id)
+    stats = await adb.get_referral_stats(user_id)
     if not stats:
         await send_or_edit(user_id, "❌ Could not load referral stats.")
         return
     
-    bot_username = (await bot.me()).username
-    referral_link = f"https://t.me/{bot_username}?start={user['referral_code']}"
-    
-    text = (
-        f"🎁 <b>Your Referral Stats</b>\n\n"
-        f"📊 Referrals: {stats['referral_count']}\n"
-        f"📦 Product Slots: {stats['max_products']}\n"
-        f"⭐ Premium Features: {'Yes' if stats['premium_features'] else 'No'}\n\n"
-        f"🔗 <b>Your Referral Link:</b>\n"
-        f"<code>{referral_link}</code>\n\n"
-        f"💡 Share this link with friends to unlock more product slots!"
+    text = REFERRAL_TEMPLATE.format(
+        referral_count=stats['referral_count'],
+        max_products=stats['max_products'],
+        premium='Yes' if stats['premium_features'] else 'No',
+        bot_username=bot_username or (await bot.me()).username,
+        referral_code=user['referral_code']
     )
     
     await send_or_edit(user_id, text)
@@ -234,23 +363,18 @@ async def cmd_referral(message: types.Message):
 async def cmd_limits(message: types.Message):
     """Handle /limits command"""
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await adb.get_user(user_id)
     
     if not user:
         await send_or_edit(user_id, "❌ User not found. Please use /start first.")
         return
     
-    current_count = db.get_user_product_count(user_id)
+    current_count = await adb.get_user_product_count(user_id)
     
-    text = (
-        f"📊 <b>Your Tracking Limits</b>\n\n"
-        f"📦 Current Products: {current_count}\n"
-        f"🔢 Maximum Products: {user['max_products']}\n"
-        f"⭐ Premium Features: {'Yes' if user['premium_features'] else 'No'}\n\n"
-        f"🎁 <b>How to unlock more:</b>\n"
-        f"• Each referral = +1 product slot\n"
-        f"• Premium users get faster price checks\n\n"
-        f"Use /referral to get your referral link!"
+    text = LIMITS_TEMPLATE.format(
+        current_count=current_count,
+        max_products=user['max_products'],
+        premium='Yes' if user['premium_features'] else 'No'
     )
     
     await send_or_edit(user_id, text)
@@ -259,31 +383,84 @@ async def cmd_limits(message: types.Message):
 async def cmd_history(message: types.Message):
     """Handle /history command"""
     user_id = message.from_user.id
-    products = db.get_user_products(user_id)
+    products = await adb.get_user_products(user_id)
     if not products:
         await send_or_edit(user_id, "📦 You're not tracking any products yet.")
         return
     # Show product list as inline buttons
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text=product['title'][:30] + ("..." if len(product['title']) > 30 else ""), callback_data=f"history_{product['id']}")]
-            for product in products
-        ]
-    )
+    keyboard = get_history_keyboard(products)
     await send_or_edit(user_id, "📈 <b>Select a product to view its price history:</b>", reply_markup=keyboard)
 
+@dp.message(Command("deals"))
+async def cmd_deals(message: types.Message):
+    """Show the biggest recent price drops across everything the bot tracks"""
+    user_id = message.from_user.id
+    deals = await adb.get_top_drops(DEALS_SHOWN, TOP_DROPS_MAX_AGE_DAYS)
+    if not deals:
+        await send_or_edit(user_id, "🛍 No big price drops right now. Check back later!")
+        return
+    lines = ["🔥 <b>Today's Best Deals</b>\n"]
+    for deal in deals:
+        currency = deal['currency']
+        lines.append(
+            f"• <a href=\"{deal['affiliate_url']}\">{html.escape(short_title(deal['title'], 50))}</a>\n"
+            f"   <b>{currency}{deal['new_price']:,.2f}</b> (was {currency}{deal['old_price']:,.2f}, "
+            f"-{deal['drop_percent']:.0f}%)"
+        )
+    await send_or_edit(user_id, "\n".join(lines))
+
+async def render_search(user_id: int, terms: str, page: int):
+    """One page of /search results as (text, keyboard); admins search every user's products"""
+    scope = None if user_id in ADMIN_IDS else user_id
+    total, results = await adb.search_products(terms, scope, SEARCH_RESULTS_PER_PAGE, page * SEARCH_RESULTS_PER_PAGE)
+    if not total:
+        return f"🔎 No products match <b>{html.escape(terms)}</b>.", None
+    page_count = (total + SEARCH_RESULTS_PER_PAGE - 1) // SEARCH_RESULTS_PER_PAGE
+    lines = [f"🔎 <b>{total} result{'s' if total != 1 else ''} for \"{html.escape(terms)}\"</b>\n"]
+    for product in results:
+        trackers = f" · {product['trackers']} tracking" if scope is None else ""
+        lines.append(
+            f"• <a href=\"{product['affiliate_url'] or product['url']}\">{html.escape(short_title(product['title'], 50))}</a>\n"
+            f"   {product['currency']}{product['current_price']:,.2f}{trackers}"
+        )
+    keyboard = None
+    if page_count > 1:
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="◀️", callback_data=f"search_page_{(page - 1) % page_count}"),
+            InlineKeyboardButton(text=f"{page + 1}/{page_count}", callback_data=f"search_page_{page}"),
+            InlineKeyboardButton(text="▶️", callback_data=f"search_page_{(page + 1) % page_count}")
+        ]])
+    return "\n".join(lines), keyboard
+
+@dp.message(Command("search"))
+async def cmd_search(message: types.Message, command: CommandObject, state: FSMContext):
+    """Full-text search over product titles, best match first"""
+    user_id = message.from_user.id
+    terms = (command.args or '').strip()
+    if not terms:
+        await send_or_edit(user_id, "🔎 Send <code>/search</code> followed by words from a product title, "
+                                    "e.g. <code>/search galaxy a14</code>")
+        return
+    # Kept for the page buttons, whose callback data is too short for the query
+    await state.update_data(search_terms=terms)
+    text, keyboard = await render_search(user_id, terms, 0)
+    await send_or_edit(user_id, text, reply_markup=keyboard)
+
 # URL handling
 @dp.message(F.text.contains("http"))
 async def handle_url(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await adb.get_user(user_id)
     if not user:
         await send_or_edit(user_id, "❌ Please use /start first to initialize your account.")
         return
     text = message.text
-    urls = [word for word in text.split() if word.startswith(('http://', 'https://'))]
+    urls = list(dict.fromkeys(word for word in text.split() if word.startswith(('http://', 'https://'))))
     if not urls:
         return
+    if len(urls) > 1:
+        await import_urls(user_id, user, urls)
+        return
     url = urls[0]
     try:
         is_supported, site_name = scraper.is_supported_site(url)
@@ -298,9 +475,16 @@ async def handle_url(message: types.Message, state: FSMContext):
             return
         # Clean the URL
         clean_url = clean_product_url(url, site_name)
-        # Extract product information
-        await send_or_edit(user_id, "🔍 Extracting product information...")
-        product_info = scraper.extract_product_info(clean_url)
+        # A product someone already tracks and that was checked recently needs no fetch
+        product = await adb.match_catalog(clean_url, BULK_IMPORT_CATALOG_MAX_AGE)
+        if product:
+            product_info = {'title': product['title'], 'price': product['current_price'],
+                            'currency': product['currency'], 'image_url': product['image_url'],
+                            'site_name': product['site_name']}
+        else:
+            # Extract product information
+            await send_or_edit(user_id, "🔍 Extracting product information...")
+            product_info = await pipeline.fetch(clean_url, INTERACTIVE)
         # Store product info in state for button callbacks
         await state.update_data(
             url=clean_url,
@@ -318,14 +502,10 @@ async def handle_url(message: types.Message, state: FSMContext):
             f"<a href=\"{clean_url}\">🔗 View Product</a>\n\n"
             f"How would you like to track this product?"
         )
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="✅ Start Tracking", callback_data="track_now"),
-                    InlineKeyboardButton(text="🎯 Set Target Price", callback_data="track_target")
-                ]
-            ]
-        )
+        if product_info['site_name'] == 'amazon' and AMAZON_COMPARE_MARKETPLACES:
+            keyboard = COMPARE_CHOICE_KEYBOARD
+        else:
+            keyboard = TRACK_CHOICE_KEYBOARD
         await send_or_edit(user_id, product_text, reply_markup=keyboard)
         # Clear last bot message so next response is always new after this flow
         user_last_bot_message.pop(user_id, None)
@@ -335,12 +515,120 @@ async def handle_url(message: types.Message, state: FSMContext):
         logger.error(f"Error processing URL: {e}")
         await send_or_edit(user_id, "❌ Sorry, I couldn't process this product. Please try again later.")
 
+@dp.message(F.document)
+async def handle_import_file(message: types.Message):
+    """Bulk import the product links in an uploaded .txt or .csv file"""
+    user_id = message.from_user.id
+    user = await adb.get_user(user_id)
+    if not user:
+        await send_or_edit(user_id, "❌ Please use /start first to initialize your account.")
+        return
+    document = message.document
+    if not (document.file_name or '').lower().endswith(('.txt', '.csv')):
+        await send_or_edit(user_id, "❌ Please upload a .txt or .csv file with your product links.")
+        return
+    if document.file_size and document.file_size > BULK_IMPORT_MAX_FILE_BYTES:
+        await send_or_edit(user_id, f"❌ That file is too large. The limit is {BULK_IMPORT_MAX_FILE_BYTES // 1024} KB.")
+        return
+    try:
+        content = (await bot.download(document)).read().decode('utf-8', 'replace')
+    except Exception as e:
+        logger.error(f"Error downloading import file: {e}")
+        await send_or_edit(user_id, "❌ Sorry, I couldn't read that file. Please try again later.")
+        return
+    urls = list(dict.fromkeys(URL_RE.findall(content)))
+    if not urls:
+        await send_or_edit(user_id, "❌ I couldn't find any product links in that file.")
+        return
+    await import_urls(user_id, user, urls)
+
+async def import_urls(user_id: int, user: dict, urls: list):
+    """Canonicalize, dedupe, fetch what isn't known yet and add everything in one quota-checked batch"""
+    try:
+        skipped = urls[BULK_IMPORT_MAX_URLS:]
+        urls = urls[:BULK_IMPORT_MAX_URLS]
+        # Canonical URL -> site; unsupported links are only counted
+        canonical = {}
+        unsupported = 0
+        for url in urls:
+            is_supported, site_name = scraper.is_supported_site(url)
+            if is_supported:
+                canonical.setdefault(clean_product_url(url, site_name), site_name)
+            else:
+                unsupported += 1
+        tracked = {product['url'] for product in await adb.get_user_products(user_id)}
+        new_urls = [url for url in canonical if url not in tracked]
+        already_tracked = len(canonical) - len(new_urls)
+        slots = max(0, user['max_products'] - await adb.get_user_product_count(user_id))
+        over_limit = len(new_urls[slots:])
+        new_urls = new_urls[:slots]
+        
+        # Products someone already tracks and that were checked recently need no fetch
+        catalog = await adb.get_catalog_products(new_urls, BULK_IMPORT_CATALOG_MAX_AGE)
+        infos = {
+            url: {'title': product['title'], 'price': product['current_price'], 'currency': product['currency'],
+                  'image_url': product['image_url'], 'site_name': product['site_name']}
+            for url, product in catalog.items()
+        }
+        to_fetch = [url for url in new_urls if url not in infos]
+        failed = []
+        # The user's sweep lane: a big upload neither holds the slots kept for other users' pastes
+        # nor lets a standard user jump ahead of the standard sweep
+        lane = PREMIUM if user['premium_features'] else STANDARD
+        
+        async def fetch(url):
+            try:
+                return url, await pipeline.fetch(url, lane)
+            except Exception as e:
+                return url, e
+        
+        progress = f"📥 <b>Importing {len(new_urls)} products...</b>\n"
+        await send_or_edit(user_id, progress + f"🔍 Fetched 0/{len(to_fetch)}")
+        last_update = time.monotonic()
+        for done, task in enumerate(asyncio.as_completed([fetch(url) for url in to_fetch]), 1):
+            url, result = await task
+            if isinstance(result, Exception):
+                failed.append(url)
+            else:
+                infos[url] = result
+            if time.monotonic() - last_update >= BULK_IMPORT_PROGRESS_INTERVAL:
+                last_update = time.monotonic()
+                await send_or_edit(user_id, progress + f"🔍 Fetched {done}/{len(to_fetch)}")
+        
+        added = await adb.add_products(user_id, [
+            {'url': url, 'title': infos[url]['title'], 'current_price': infos[url]['price'],
+             'currency': infos[url]['currency'], 'image_url': infos[url]['image_url'],
+             'target_price': 0.0, 'site_name': infos[url]['site_name']}
+            for url in new_urls if url in infos
+        ])
+        # Slots can be taken by a concurrent add between the count and the batch insert
+        over_limit += len([url for url in new_urls if url in infos]) - len(added)
+        
+        lines = [f"✅ <b>Import finished:</b> {len(added)} product{'s' if len(added) != 1 else ''} added"]
+        if already_tracked:
+            lines.append(f"⏭ Already tracked: {already_tracked}")
+        if failed:
+            lines.append(f"⚠️ Couldn't read: {len(failed)}")
+        if unsupported:
+            lines.append(f"🚫 Unsupported sites: {unsupported}")
+        if over_limit:
+            lines.append(f"🔒 Over your limit of {user['max_products']}: {over_limit} (refer friends to unlock more slots!)")
+        if skipped:
+            lines.append(f"✂️ Only the first {BULK_IMPORT_MAX_URLS} links are imported; {len(skipped)} ignored")
+        if added:
+            lines.append("\n🔔 You'll be notified when prices drop! Use /myproducts to see them.")
+        await send_or_edit(user_id, "\n".join(lines))
+        user_last_bot_message.pop(user_id, None)
+    except Exception as e:
+        logger.error(f"Error importing products: {e}")
+        await send_or_edit(user_id, "❌ Sorry, I couldn't import these products. Please try again later.")
+
 @dp.callback_query(F.data == "track_now")
 async def handle_track_now(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     data = await state.get_data()
     try:
-        product_id = db.add_product(
+        product_id = await adb.add_product(
             user_id=user_id,
             url=data['url'],
             title=data['title'],
@@ -357,8 +645,7 @@ async def handle_track_now(callback: CallbackQuery, state: FSMContext):
             f"💰 Current Price: {price_text}\n\n"
             f"🔔 You'll be notified when the price drops!"
         )
-        products = db.get_user_products(user_id)
-        product = next((p for p in products if p['id'] == product_id), None)
+        product = await adb.get_product(product_id, user_id)
         if product:
             keyboard = get_product_keyboard(product['id'], product['affiliate_url'])
             await send_or_edit(user_id, response_text, reply_markup=keyboard)
@@ -376,6 +663,30 @@ async def handle_track_now(callback: CallbackQuery, state: FSMContext):
         await state.clear()
         user_last_bot_message.pop(user_id, None)
 
+@dp.callback_query(F.data == "compare_stores")
+async def handle_compare_stores(callback: CallbackQuery, state: FSMContext):
+    """Look the pasted product up on every configured Amazon marketplace at once"""
+    user_id = callback.from_user.id
+    data = await state.get_data()
+    if not data.get('url'):
+        await send_or_edit(user_id, "❌ Please paste the product link again.")
+        return
+    await send_or_edit(user_id, f"🌍 Checking {len(AMAZON_COMPARE_MARKETPLACES)} Amazon stores...")
+    offers = await pipeline.compare_marketplaces(data['url'], AMAZON_COMPARE_MARKETPLACES, INTERACTIVE)
+    if not offers:
+        await send_or_edit(user_id, "❌ No other Amazon store has this product right now.",
+                           reply_markup=TRACK_CHOICE_KEYBOARD)
+        return
+    lines = [f"🌍 <b>{data['title']}</b> across Amazon stores:\n"]
+    for rank, offer in enumerate(offers):
+        marker = "🏆" if rank == 0 else "•"
+        usd = f" (≈ ${offer['usd']:,.2f})" if offer['usd'] is not None and offer['currency'] != '$' else ""
+        link = sites.get(offer['site_name']).affiliate_url(offer['url'])
+        lines.append(f"{marker} <a href=\"{link}\">{offer['domain']}</a>: {offer['currency']}{offer['price']:,.2f}{usd}")
+    lines.append("\n<i>Conversions are approximate.</i> Track the store you pasted?")
+    await send_or_edit(user_id, "\n".join(lines), reply_markup=TRACK_CHOICE_KEYBOARD)
+    user_last_bot_message.pop(user_id, None)
+
 @dp.callback_query(F.data == "track_target")
 async def handle_track_target(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
@@ -385,7 +696,7 @@ async def handle_track_target(callback: CallbackQuery, state: FSMContext):
         f"📦 <b>{data['title']}</b>\n"
         f"💰 Current Price: {price_text}\n\n"
         f"🎯 <b>Enter your target price below:</b>\n"
-        f"(e.g., {data['currency']}10.00)"
+        f"(e.g., {data['currency']}10.00, or 10% to be notified on a 10% drop)"
     )
     await send_or_edit(user_id, prompt)
     await state.set_state(ProductStates.waiting_for_target_price)
@@ -400,48 +711,45 @@ async def handle_target_price(message: types.Message, state: FSMContext):
     data = await state.get_data()
     
     target_price = None
+    drop_percent = None
     if text != 'skip':
-        try:
-            # Extract price from text
-            import re
-            price_match = re.search(r'[\d,]+\.?\d*', text.replace(',', ''))
-            if price_match:
+        # "10%" means notify on a 10% drop, anything else is a target price
+        percent_match = re.fullmatch(r'-?\s*(\d+(?:\.\d+)?)\s*%', text)
+        price_match = re.search(r'[\d,]+\.?\d*', text.replace(',', ''))
+        if percent_match:
+            drop_percent = float(percent_match.group(1))
+            if not 0 < drop_percent < 100:
+                await send_or_edit(user_id, "❌ The drop percentage must be between 0 and 100.")
+                return
+        elif price_match:
+            try:
                 target_price = float(price_match.group().replace(',', ''))
-            else:
-                await send_or_edit(user_id, "❌ Invalid price format. Please enter a number or 'skip'.")
+            except ValueError:
+                await send_or_edit(user_id, "❌ Invalid price format. Please enter a number, a percentage or 'skip'.")
                 return
-        except ValueError:
-            await send_or_edit(user_id, "❌ Invalid price format. Please enter a number or 'skip'.")
+        else:
+            await send_or_edit(user_id, "❌ Invalid price format. Please enter a number, a percentage or 'skip'.")
             return
     
     try:
         # Add product to database
-        if target_price is not None:
-            product_id = db.add_product(
-                user_id=user_id,
-                url=data['url'],
-                title=data['title'],
-                current_price=data['price'],
-                currency=data['currency'],
-                image_url=data['image_url'],
-                target_price=target_price,
-                site_name=data['site_name']
-            )
-        else:
-            product_id = db.add_product(
-                user_id=user_id,
-                url=data['url'],
-                title=data['title'],
-                current_price=data['price'],
-                currency=data['currency'],
-                image_url=data['image_url'],
-                target_price=0.0,
-                site_name=data['site_name']
-            )
+        product_id = await adb.add_product(
+            user_id=user_id,
+            url=data['url'],
+            title=data['title'],
+            current_price=data['price'],
+            currency=data['currency'],
+            image_url=data['image_url'],
+            target_price=target_price if target_price is not None else 0.0,
+            site_name=data['site_name'],
+            drop_percent=drop_percent
+        )
         
         # Format response
         price_text = f"{data['currency']}{data['price']:,.2f}"
         target_text = f"\n🎯 Target Price: {data['currency']}{target_price:,.2f}" if target_price else ""
+        if drop_percent:
+            target_text = f"\n📉 Alert on a {drop_percent:g}% drop"
         
         response_text = (
             f"✅ <b>Tracking Started!</b>\n\n"
@@ -451,8 +759,7 @@ async def handle_target_price(message: types.Message, state: FSMContext):
         )
         
         # Get product for keyboard
-        products = db.get_user_products(user_id)
-        product = next((p for p in products if p['id'] == product_id), None)
+        product = await adb.get_product(product_id, user_id)
         
         if product:
             keyboard = get_product_keyboard(product['id'], product['affiliate_url'])
@@ -476,6 +783,36 @@ async def handle_target_price(message: types.Message, state: FSMContext):
         user_last_bot_message.pop(user_id, None)
 
 # Callback query handlers
+@dp.callback_query(F.data.startswith('search_page_'))
+async def handle_search_page(callback: CallbackQuery, state: FSMContext):
+    """Flip /search result pages in place"""
+    terms = (await state.get_data()).get('search_terms')
+    if not terms:
+        await callback.answer("Please run /search again.")
+        return
+    text, keyboard = await render_search(callback.from_user.id, terms, int(callback.data.rsplit('_', 1)[1]))
+    try:
+        await callback.message.edit_text(text, parse_mode="HTML", reply_markup=keyboard)
+    except TelegramBadRequest:
+        pass  # Same page again: message is not modified
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith('products_page_'))
+async def handle_products_page(callback: CallbackQuery):
+    """Flip /myproducts pages in place"""
+    user_id = callback.from_user.id
+    pages = await get_product_list_pages(user_id)
+    if not pages:
+        await callback.answer("❌ User not found. Please use /start first.")
+        return
+    page = min(int(callback.data.rsplit('_', 1)[1]), len(pages) - 1)
+    text, keyboard = pages[page]
+    try:
+        await callback.message.edit_text(text, parse_mode="HTML", reply_markup=keyboard)
+    except TelegramBadRequest:
+        pass  # Same page again: message is not modified
+    await callback.answer()
+
 @dp.callback_query(lambda c: c.data.startswith('remove_'))
 async def handle_remove_callback(callback: types.CallbackQuery):
     """Handle remove product callback"""
@@ -490,7 +827,7 @@ async def handle_remove_callback(callback: types.CallbackQuery):
         product_id = int(callback.data.split('_')[1])
         
         # Remove product
-        success = db.remove_product(product_id, user_id)
+        success = await adb.remove_product(product_id, user_id)
         
         if success:
             await send_or_edit(user_id, "✅ Product removed from tracking!")
@@ -504,21 +841,24 @@ async def handle_history_callback(callback: types.CallbackQuery):
     user_id = callback.from_user.id
     product_id = int(callback.data.split('_')[1])
     # Get product and check ownership
-    products = db.get_user_products(user_id)
-    product = next((p for p in products if p['id'] == product_id), None)
+    product = await adb.get_product(product_id, user_id)
     if not product:
         await send_or_edit(user_id, "❌ Product not found or you don't have permission.")
         return
     # Get price history
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT price, currency, recorded_at FROM price_history WHERE product_id = ? ORDER BY recorded_at DESC', (product_id,))
-    history = cursor.fetchall()
-    conn.close()
+    history = await adb.get_price_history(product_id, HISTORY_ROWS_SHOWN)
     if not history:
         await send_or_edit(user_id, "No price history found for this product.")
         return
-    text = f"📈 <b>Price History for:</b>\n<b>{product['title']}</b>\n\n"
+    text = f"📈 <b>Price History for:</b>\n<b>{html.escape(product['title'])}</b>\n\n"
+    stats = await adb.get_product_stats(product_id)
+    if stats and stats['low_90d'] is not None:
+        currency = product['currency']
+        text += (
+            f"📉 Lowest in 90 days: {currency}{stats['low_90d']:,.2f} · "
+            f"lowest ever: {currency}{stats['low_price']:,.2f}\n"
+            f"📊 Median: {currency}{stats['median_price']:,.2f} · deal score {stats['deal_score']:.0f}/100\n\n"
+        )
     for row in history:
         date = row['recorded_at'][:10]
         price = f"{row['currency']}{row['price']:,.2f}"
@@ -526,10 +866,12 @@ async def handle_history_callback(callback: types.CallbackQuery):
     await send_or_edit(user_id, text, parse_mode="HTML")
 
 async def main():
-    # Set bot command menu
-    await set_bot_commands(bot)
+    # Expose /metrics for scraping
+    start_metrics_server(METRICS_PORT, METRICS_HOST)
+    # Set bot command menu and cache bot metadata
+    await warm_up(bot)
     # Start the scheduler
-    start_scheduler(bot)
+    await start_scheduler(bot)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
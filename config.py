@@ -9,40 +9,252 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 # Don't raise error immediately - let the bot handle it gracefully
 
 # Database Configuration
-DATABASE_PATH = "deal_finder.db"
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'deal_finder.db')
+
+# Async database facade: queries run on dedicated threads, fed by a bounded queue
+DB_WORKERS = 1          # one writer thread keeps each user's requests in order
+DB_MAX_PENDING = 1000   # queued queries before callers are made to wait
+DB_BATCH_SIZE = 64      # queued price updates written in one transaction
 
 # Supported E-commerce Sites
+# Each entry is pure data compiled into a SiteSpec by sites.py:
+#   domains            - hostnames (subdomains such as www. match by suffix)
+#   selectors          - CSS selector fallback chains for title, price and image
+#   currency           - default currency symbol
+#   currency_by_domain - currency symbol per marketplace domain (wins over sniffing)
+#   currency_symbols   - symbols sniffed from the price text, longest first
+#   canonical_url      - 'asin' (keep the marketplace and /dp/<ASIN>) or 'strip_query'
+#   rate_limit         - max requests per second to the site (0 = unlimited)
+#   rate_limit_scope   - 'site' (one budget for all domains) or 'domain' (per marketplace)
+#   pool_size          - keep-alive connections per host (default HTTP_POOL_MAXSIZE)
+#   cache_ttl          - seconds a scraped result is reused
+#   embedded_state     - optional JSON state blob: regex ending where the JSON starts + key paths
+#   product_id         - regex whose group 1 is the shop's product ID in the URL path
+#   product_id_scope   - 'site' (one ID space for all domains) or 'domain' (IDs are per store)
 SUPPORTED_SITES = {
     'amazon': {
         'domains': ['amazon.com', 'amazon.co.uk', 'amazon.de', 'amazon.fr', 'amazon.it', 'amazon.es', 'amazon.ca', 'amazon.com.au', 'amazon.in', 'amazon.com.br', 'amazon.com.mx', 'amazon.co.jp'],
         'affiliate_tag': '&tag=webcodelab-20',  # Replace with your Amazon Associates tag
-        'currency_symbols': ['$', '€', '£', '₹', '¥', 'R$', 'MX$', 'A$']
+        'currency_symbols': ['$', '€', '£', '₹', '¥', 'R$', 'MX$', 'A$'],
+        'currency': '$',
+        'currency_by_domain': {
+            'amazon.com': '$', 'amazon.co.uk': '£', 'amazon.de': '€', 'amazon.fr': '€', 'amazon.it': '€',
+            'amazon.es': '€', 'amazon.ca': 'C$', 'amazon.com.au': 'A$', 'amazon.in': '₹', 'amazon.com.br': 'R$',
+            'amazon.com.mx': 'MX$', 'amazon.co.jp': '¥',
+        },
+        'selectors': {
+            'title': ['#productTitle', 'h1.a-size-large', 'h1.a-size-base-plus', '.a-size-large.product-title-word-break'],
+            'price': ['.a-price-whole', '.a-price .a-offscreen', '#priceblock_ourprice', '#priceblock_dealprice', '.a-price-range .a-offscreen'],
+            'image': ['#landingImage', '#imgBlkFront', '.a-dynamic-image', 'img[data-old-hires]'],
+        },
+        'canonical_url': 'asin',
+        'product_id': r'/(?:dp|gp/product)/([A-Z0-9]{10})',
+        'product_id_scope': 'domain',  # an ASIN on amazon.de is a different offer than on amazon.com
+        'rate_limit': 2.0,
+        'rate_limit_scope': 'domain',
+        'pool_size': 20,
+        'cache_ttl': 900,
     },
     'aliexpress': {
         'domains': ['aliexpress.com', 'aliexpress.ru'],
         'affiliate_tag': '&aff_platform=link-c-tool&src=go',  # Replace with your AliExpress affiliate link
-        'currency_symbols': ['$', '€', '¥']
+        'currency_symbols': ['$', '€', 'CN¥', '¥'],
+        'currency': '$',
+        'selectors': {
+            'title': ['.product-title', 'h1.product-title-text', '.product-title-text'],
+            'price': ['.product-price-current', '.product-price-value', '.price-current'],
+            'image': ['.images-view-item img', '.product-image img', '.magnifier-image'],
+        },
+        'canonical_url': 'strip_query',
+        'product_id': r'/(?:item|i)/(\d+)\.html',  # desktop and mobile item pages
+        'rate_limit': 2.0,
+        'pool_size': 20,
+        'cache_ttl': 900,
+        'embedded_state': {
+            'pattern': r'window\.runParams\s*=\s*\{\s*data\s*:\s*',
+            'title': [['titleModule', 'subject'], ['productInfoComponent', 'subject']],
+            'price': [
+                ['priceModule', 'minActivityAmount', 'value'],
+                ['priceModule', 'minAmount', 'value'],
+                ['priceComponent', 'discountPrice', 'minActivityAmount', 'value'],
+            ],
+            'currency': [
+                ['priceModule', 'minActivityAmount', 'currency'],
+                ['priceModule', 'minAmount', 'currency'],
+                ['webEnv', 'currency'],
+            ],
+            'image': [['imageModule', 'imagePathList', 0], ['imageComponent', 'imagePathList', 0]],
+        },
     },
     'jumia': {
         'domains': ['jumia.com.ng', 'jumia.co.ke', 'jumia.com.gh', 'jumia.co.ug', 'jumia.com.tn', 'jumia.dz', 'jumia.ma', 'jumia.com.eg', 'jumia.com.ci', 'jumia.sn', 'jumia.cm', 'jumia.bf', 'jumia.ne', 'jumia.ml', 'jumia.mr', 'jumia.td', 'jumia.cf', 'jumia.cg', 'jumia.cd', 'jumia.ga', 'jumia.gq', 'jumia.st', 'jumia.gm', 'jumia.gw', 'jumia.gn', 'jumia.sl', 'jumia.lr', 'jumia.tg', 'jumia.bj', 'jumia.tg'],
         'affiliate_tag': '?aff_id=webcodelab-20',  # Your Jumia affiliate ID
-        'currency_symbols': ['₦', 'KSh', 'GH₵', 'USh', 'TND', 'DZD', 'MAD', 'EGP', 'XOF', 'XAF', 'CDF', 'XAF', 'XOF', 'XOF', 'XOF', 'XAF', 'XAF', 'XAF', 'CDF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF']
+        'currency_symbols': ['₦', 'KSh', 'GH₵', 'USh', 'TND', 'DZD', 'MAD', 'EGP', 'XOF', 'XAF', 'CDF', 'XAF', 'XOF', 'XOF', 'XOF', 'XAF', 'XAF', 'XAF', 'CDF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF', 'XAF'],
+        'currency': '₦',
+        'currency_by_domain': {
+            'jumia.com.ng': '₦', 'jumia.co.ke': 'KSh', 'jumia.com.gh': 'GH₵', 'jumia.co.ug': 'USh',
+            'jumia.com.tn': 'TND', 'jumia.dz': 'DZD', 'jumia.ma': 'MAD', 'jumia.com.eg': 'EGP',
+            'jumia.com.ci': 'XOF', 'jumia.sn': 'XOF', 'jumia.cm': 'XAF', 'jumia.bf': 'XOF', 'jumia.ne': 'XOF',
+            'jumia.ml': 'XOF', 'jumia.td': 'XAF', 'jumia.cf': 'XAF', 'jumia.cg': 'XAF', 'jumia.cd': 'CDF',
+            'jumia.ga': 'XAF', 'jumia.gq': 'XAF', 'jumia.gw': 'XOF', 'jumia.tg': 'XOF', 'jumia.bj': 'XOF',
+        },
+        'selectors': {
+            'title': ['h1[data-name="product-title"]', '.product-title', 'h1.title'],
+            'price': ['.price', '.product-price', '.price-current', '[data-price]'],
+            'image': ['.image-gallery-slide img', '.product-image img', '.gallery-image'],
+        },
+        'canonical_url': 'strip_query',
+        'product_id': r'-(\d+)\.html$',  # the slug before it varies, the number doesn't
+        'product_id_scope': 'domain',
+        'rate_limit': 4.0,
+        'cache_ttl': 900,
+        'embedded_state': {
+            'pattern': r'dataLayer\s*=\s*',
+            'title': [[0, 'ecommerce', 'detail', 'products', 0, 'name'], [0, 'product', 'name']],
+            'price': [[0, 'ecommerce', 'detail', 'products', 0, 'price'], [0, 'product', 'price']],
+            'currency': [[0, 'ecommerce', 'currencyCode'], [0, 'currency']],
+            'image': [[0, 'ecommerce', 'detail', 'products', 0, 'image'], [0, 'product', 'image']],
+        },
     },
     'konga': {
         'domains': ['konga.com'],
         'affiliate_tag': '?utm_source=YOUR_KONGA_TAG',  # Replace with your Konga affiliate tag
-        'currency_symbols': ['₦']
+        'currency_symbols': ['₦'],
+        'currency': '₦',
+        'selectors': {
+            'title': ['.product-name', 'h1.product-title', '.product-details h1'],
+            'price': ['.price', '.product-price', '.current-price', '[data-price]'],
+            'image': ['.product-image img', '.gallery-image img', '.main-image'],
+        },
+        'canonical_url': 'strip_query',
+        'product_id': r'/product/[^/]*?-(\d+)/?$',
+        'rate_limit': 4.0,
+        'cache_ttl': 900,
     }
 }
 
+# ISO 4217 codes (as found in structured data) to the symbols used in messages
+CURRENCY_SYMBOLS = {
+    'USD': '$', 'EUR': '€', 'GBP': '£', 'INR': '₹', 'JPY': '¥', 'CNY': 'CN¥',
+    'BRL': 'R$', 'MXN': 'MX$', 'AUD': 'A$', 'CAD': 'C$',
+    'NGN': '₦', 'KES': 'KSh', 'GHS': 'GH₵', 'UGX': 'USh',
+}
+
 # Product Limits
 DEFAULT_MAX_PRODUCTS = 3
+PRODUCTS_PER_PAGE = 5  # products per /myproducts page
+SEARCH_RESULTS_PER_PAGE = 5  # results per /search page
+HISTORY_ROWS_SHOWN = 30  # latest prices listed by /history; product_stats sums up the rest
+# Telegram user IDs whose /search covers every user's products, not just their own
+ADMIN_IDS = {int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip()}
+
+# Bulk import (several links in one message, or an uploaded .txt/.csv file)
+BULK_IMPORT_MAX_URLS = 100
+BULK_IMPORT_MAX_FILE_BYTES = 512 * 1024
+BULK_IMPORT_CATALOG_MAX_AGE = 6  # hours; reuse another user's copy of a product checked this recently
+BULK_IMPORT_PROGRESS_INTERVAL = 1.0  # seconds between progress message edits
 REFERRAL_BONUS_PRODUCTS = 1
 
 # Check Intervals (in hours)
 STANDARD_CHECK_INTERVAL = 18  # 18 hours for free users
 PREMIUM_CHECK_INTERVAL = 8    # 8 hours for users with referrals
 
+# Adaptive scheduling: each product's interval moves within its tier's (min, max) hours
+# depending on how often and how much its price changes and how close it is to the target
+STANDARD_INTERVAL_BOUNDS = (6, 48)
+PREMIUM_INTERVAL_BOUNDS = (2, 24)
+ADAPTIVE_HISTORY_DAYS = 30    # price history window used to score products
+ADAPTIVE_TICK_MINUTES = 10    # how often the scheduler looks for due products
+MAX_CHECKS_PER_TICK = 2000
+
+# Batch price analytics (analytics.py): lows, means, median and deal score per catalog product
+ANALYTICS_INTERVAL_MINUTES = 60   # how often product_stats is rebuilt from the price history
+ANALYTICS_KEYS_PER_PAGE = 2000   # catalog products' history loaded per read while rebuilding
+ANALYTICS_FULL_SCORE_DROP = 30.0  # % below the median price that earns the drop part of the deal score in full
+
+# Selector hit-rate profiling
+SELECTOR_STATS_DECAY = 0.98       # weight kept by past hits on each new evaluation
+SELECTOR_REVALIDATE_EVERY = 50    # pages between full-chain re-validations per site/region/field
+
+# HTTP transport for the scraper
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '15'))
+HTTP_POOL_HOSTS = 32     # hosts kept in the connection pool manager
+HTTP_POOL_MAXSIZE = 10   # keep-alive connections per host (override per site with 'pool_size')
+HTTP2_ENABLED = os.getenv('HTTP2_ENABLED', '1') == '1'  # only used when httpx[http2] is installed
+DNS_CACHE_TTL = 300      # seconds, 0 disables the in-process DNS cache
+
+# Egress pool: proxies to fetch through, each with its own connections, cookies and rate limits
+EGRESS_PROXIES = [proxy.strip() for proxy in os.getenv('EGRESS_PROXIES', '').split(',') if proxy.strip()]
+EGRESS_DIRECT = os.getenv('EGRESS_DIRECT', '1') == '1'  # also fetch without a proxy (always, if none are set)
+EGRESS_HEALTH_DECAY = 0.9         # weight kept by past outcomes on each new one
+EGRESS_LATENCY_REFERENCE = 1.0    # seconds; an egress this slow gets half the weight of an instant one
+EGRESS_MIN_WEIGHT = 0.02          # poor but unquarantined egresses still see a little traffic
+EGRESS_QUARANTINE_AFTER = 3       # consecutive failures or blocks towards one site
+EGRESS_QUARANTINE_SECONDS = 300   # doubled on each repeat quarantine
+EGRESS_QUARANTINE_MAX = 3600
+
+# Sweep workers, retries and per-site circuit breakers
+SWEEP_CONCURRENCY = int(os.getenv('SWEEP_CONCURRENCY', '8'))  # product pages fetched in parallel
+FETCH_RETRIES = 2                 # extra attempts for transient failures within a sweep
+RETRY_BASE_DELAY = 1.0            # seconds, doubled per attempt with full jitter
+RETRY_MAX_DELAY = 10.0
+BREAKER_FAILURE_THRESHOLD = 5     # consecutive failures that open a site's breaker
+BREAKER_COOLDOWN = 300            # seconds before a half-open probe; skipped products are rechecked then
+BLOCK_MARKERS = [b'captcha', b'robot check', b'/errors/validatecaptcha', b'punish?x5secdata', b'access denied']
+
+# Fetch priority lanes: weighted fair share of fetch slots while lanes are backlogged
+FETCH_LANE_WEIGHTS = {'interactive': 8, 'premium': 3, 'standard': 1}
+INTERACTIVE_RESERVED_SLOTS = 2    # fetch slots only a user's own lookups may use
+INTERACTIVE_RATE_SHARE = 0.2      # share of each site's rate_limit kept for user lookups
+
+# Hedged user lookups: a second request once the first is slower than the site's usual tail
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', '1') == '1'
+HEDGE_QUANTILE = 0.9              # hedge after the site's p90 fetch latency
+HEDGE_DEFAULT_DELAY = 2.0         # seconds, until a site has HEDGE_MIN_SAMPLES latencies
+HEDGE_MIN_DELAY = 0.1             # never hedge sooner than this
+HEDGE_MIN_SAMPLES = 20
+HEDGE_BUDGET_RATIO = 0.1          # at most one hedge per 10 interactive fetches...
+HEDGE_BUDGET_BURST = 3            # ...after a burst of this many
+LATENCY_WINDOW = 200              # recent fetches per site the quantile is taken over
+
+# Raw page archive: fetched pages kept compressed on disk for offline re-extraction (archive.py)
+ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', '0') == '1'
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'page_archive')
+ARCHIVE_SEGMENT_MB = 64           # segment file size before starting the next one
+ARCHIVE_MAX_SEGMENTS = 16         # the oldest segment is deleted beyond this
+
+# Near-duplicate detection for URLs without a product ID (dedup.py)
+DEDUP_TITLE_SIMILARITY = 0.8      # estimated Jaccard similarity of title shingles to call two products one
+DEDUP_PRICE_TOLERANCE = 0.3       # ...if their prices are also within this fraction of each other
+
+# Cross-marketplace Amazon lookup: the same ASIN fetched on these stores at once, cheapest first
+AMAZON_COMPARE_MARKETPLACES = [
+    domain for domain in os.getenv(
+        'AMAZON_COMPARE_MARKETPLACES', 'amazon.com,amazon.co.uk,amazon.de,amazon.fr,amazon.it,amazon.es,amazon.ca'
+    ).split(',') if domain
+]  # set to empty to hide the "Compare Amazon stores" button
+# Approximate USD value of one unit of each currency, only used to rank offers in different currencies.
+# Keyed by the symbols prices are stored with (CURRENCY_SYMBOLS), so each symbol must mean one currency
+CURRENCY_USD_RATES = {
+    '$': 1.0, '£': 1.27, '€': 1.08, 'C$': 0.73, 'A$': 0.66, '₹': 0.012, 'R$': 0.18, 'MX$': 0.055, '¥': 0.0067,
+    'CN¥': 0.14,
+}
+
+# "Top drops" board behind /deals, kept up to date by every price update (deals.py)
+TOP_DROPS_SIZE = 100              # catalog products kept on the board
+TOP_DROPS_MIN_PERCENT = 5.0       # smaller drops don't make the board
+TOP_DROPS_HALF_LIFE_HOURS = 24    # a drop's score halves every day
+TOP_DROPS_MAX_AGE_DAYS = 7        # /deals hides drops older than this
+DEALS_SHOWN = 10                  # deals listed by /deals
+
+# Scraped results are reused for each site's cache_ttl, up to this many URLs
+SCRAPE_CACHE_MAX_ENTRIES = 5000
+
+# Metrics endpoint (set METRICS_PORT=0 to disable)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
 # User Agent for web scraping
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 
@@ -85,6 +297,8 @@ HELP_MESSAGE = """
 /remove - Remove a tracked product
 /referral - Get your referral link and stats
 /limits - Check your tracking limits
+/deals - Today's biggest price drops
+/search &lt;words&gt; - Find your tracked products by title
 
 🔗 **Adding Products:**
 Simply send me a product link from:
@@ -93,8 +307,12 @@ Simply send me a product link from:
 • Jumia
 • Konga
 
+📥 **Bulk Import:**
+Send several links in one message, or upload a .txt or .csv file with your links, and I'll track them all at once.
+
 💰 **Target Prices:**
 When you add a product, you can set a target price. I'll notify you when the price drops to or below your target!
+Or send a percentage like 10% and I'll notify you once the price has dropped that much.
 
 🎁 **Referral System:**
 • Share your referral link with friends
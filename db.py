@@ -1,25 +1,102 @@
+import functools
+import re
 import sqlite3
+import threading
+import time
 import uuid
 from datetime import datetime
 from typing import List, Dict, Optional, Tuple
-from config import DATABASE_PATH
+from config import DATABASE_PATH, STANDARD_CHECK_INTERVAL, PREMIUM_CHECK_INTERVAL, TOP_DROPS_SIZE
+from metrics import DB_QUERY_SECONDS
+from hotset import ProductIndex
+from dedup import TitleIndex, catalog_key, id_key
+from deals import drop_percent, drop_priority
+from lazy import Lazy
+
+_WORD = re.compile(r'\w+')
+
+
+def fts_query(terms: str, max_terms: int = 10) -> str:
+    """FTS5 query matching every word of free text as a prefix (each quoted, so no operator syntax gets through)"""
+    words = _WORD.findall(terms.lower())[:max_terms]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+# Bump whenever init_database changes; databases already at this version skip the DDL
+SCHEMA_VERSION = 6
+
+def timed_query(func):
+    """Record the latency of a Database method"""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with DB_QUERY_SECONDS.time(method=func.__name__):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+class _Connection(sqlite3.Connection):
+    """Connection that reports its commits, so the Database can tell them from other writers'"""
+    on_commit = None
+
+    def commit(self):
+        if self.on_commit is None:
+            return super().commit()
+        self.on_commit(super().commit)
 
 class Database:
     def __init__(self):
         self.db_path = DATABASE_PATH
+        # In-memory copy of the products table for hot read paths, loaded on first use
+        self.hot_set = ProductIndex()
+        # Title MinHash index for catalog keys of URLs without a product ID, loaded on first use
+        self.titles = TitleIndex()
+        self.hot_set.subscribe(self.titles.on_product_event)
+        # PRAGMA data_version as of the hot set's last sync; only meaningful on _watch
+        self._watch = None
+        self._watch_lock = threading.Lock()
+        self._data_version = None
+        self._changed_elsewhere = False
         self.init_database()
     
     def get_connection(self):
         """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, factory=_Connection)
         conn.row_factory = sqlite3.Row  # Enable column access by name
+        conn.on_commit = self._commit
         return conn
     
+    def _read_data_version(self) -> int:
+        """Changes whenever another connection, in any process, commits; call with _watch_lock held"""
+        if self._watch is None:
+            self._watch = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._watch.execute('PRAGMA data_version').fetchone()[0]
+    
+    def _commit(self, commit):
+        """Commit one of our own connections without mistaking it for an outside write"""
+        with self._watch_lock:
+            if self._data_version is None:
+                commit()
+                return
+            if self._read_data_version() != self._data_version:
+                self._changed_elsewhere = True
+            commit()
+            self._data_version = self._read_data_version()
+    
+    def _hot_set_stale(self) -> bool:
+        """Whether another process (or a connection not from get_connection) wrote since the last sync"""
+        with self._watch_lock:
+            if self._data_version is None:
+                return False
+            return self._changed_elsewhere or self._read_data_version() != self._data_version
+    
     def init_database(self):
         """Initialize database tables"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        if cursor.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+            conn.close()
+            return
+        
         # Users table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -66,9 +143,184 @@ class Database:
             )
         ''')
         
+        # Adaptive check scheduling (added after the first release)
+        self._add_column_if_missing(cursor, 'products', 'next_check_at', 'TIMESTAMP')
+        self._add_column_if_missing(cursor, 'products', 'check_interval', 'REAL')
+        self._add_column_if_missing(cursor, 'products', 'check_weight', 'REAL')
+        # Existing rows: first adaptive check one tier interval after the last one
+        cursor.execute('''
+            UPDATE products
+            SET next_check_at = datetime(last_checked, '+' || (
+                SELECT CASE WHEN u.premium_features THEN ? ELSE ? END
+                FROM users u WHERE u.telegram_id = products.user_id
+            ) || ' hours')
+            WHERE next_check_at IS NULL
+        ''', (PREMIUM_CHECK_INTERVAL, STANDARD_CHECK_INTERVAL))
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_next_check ON products(next_check_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_history_product ON price_history(product_id, recorded_at)')
+        
+        # Alert thresholds: a target price and/or a "notify on X% drop" trigger price.
+        # Armed thresholds fire once when the price falls to them and re-arm when it rises back above.
+        if self._add_column_if_missing(cursor, 'products', 'target_armed', 'INTEGER DEFAULT 1'):
+            cursor.execute('UPDATE products SET target_armed = (current_price > target_price)')
+        self._add_column_if_missing(cursor, 'products', 'drop_percent', 'REAL')
+        self._add_column_if_missing(cursor, 'products', 'drop_alert_price', 'REAL')
+        self._add_column_if_missing(cursor, 'products', 'drop_armed', 'INTEGER DEFAULT 1')
+        # Range scans over (url, armed, threshold) find every crossed subscription in O(log n + k)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_target ON products(url, target_armed, target_price)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_drop ON products(url, drop_armed, drop_alert_price)')
+        
+        # Per-user product counter for atomic quota checks in add_product
+        if self._add_column_if_missing(cursor, 'users', 'product_count', 'INTEGER DEFAULT 0'):
+            cursor.execute('''
+                UPDATE users SET product_count = (
+                    SELECT COUNT(*) FROM products WHERE products.user_id = users.telegram_id
+                )
+            ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_count_insert AFTER INSERT ON products
+            BEGIN
+                UPDATE users SET product_count = product_count + 1 WHERE telegram_id = NEW.user_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_count_delete AFTER DELETE ON products
+            BEGIN
+                UPDATE users SET product_count = product_count - 1 WHERE telegram_id = OLD.user_id;
+            END
+        ''')
+        
+        # One catalog key per real product, shared by every URL and user tracking it
+        if self._add_column_if_missing(cursor, 'products', 'catalog_key', 'TEXT'):
+            titles = TitleIndex()
+            for row in cursor.execute('SELECT * FROM products ORDER BY id').fetchall():
+                product = dict(row)
+                product['catalog_key'] = catalog_key(titles, row['url'], row['site_name'], row['title'],
+                                                     row['currency'], row['current_price'])
+                cursor.execute('UPDATE products SET catalog_key = ? WHERE id = ?', (product['catalog_key'], row['id']))
+                titles.add(product)
+        # Amazon keys name the marketplace too: amazon:<ASIN> -> amazon:<domain>:<ASIN>
+        for row in cursor.execute(
+            "SELECT id, url FROM products WHERE site_name = 'amazon' AND catalog_key NOT LIKE 'amazon:%:%'"
+        ).fetchall():
+            cursor.execute('UPDATE products SET catalog_key = ? WHERE id = ?', (id_key(row['url']), row['id']))
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_catalog_key ON products(catalog_key)')
+        
+        # Selector hit-rate stats for the scraper
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS selector_stats (
+                site TEXT NOT NULL,
+                region TEXT NOT NULL,
+                field TEXT NOT NULL,
+                selector TEXT NOT NULL,
+                hits REAL DEFAULT 0,
+                evaluations REAL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (site, region, field, selector)
+            )
+        ''')
+        
+        # Price analytics per catalog product, rebuilt in batch by analytics.py
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS product_stats (
+                catalog_key TEXT PRIMARY KEY,
+                current_price REAL,
+                low_price REAL,
+                low_30d REAL,
+                mean_30d REAL,
+                low_90d REAL,
+                mean_90d REAL,
+                median_price REAL,
+                drop_vs_median REAL,
+                deal_score REAL,
+                samples INTEGER,
+                computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Best recent price drops per catalog product, kept by every price update
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS top_drops (
+                catalog_key TEXT PRIMARY KEY,
+                product_id INTEGER,
+                title TEXT,
+                currency TEXT,
+                affiliate_url TEXT,
+                old_price REAL,
+                new_price REAL,
+                drop_percent REAL,
+                priority REAL,
+                dropped_at TIMESTAMP
+            )
+        ''')
+        
+        # Full-text index over product titles, kept in sync with products by triggers
+        fts_exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        ).fetchone()
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                title, content='products', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products
+            BEGIN
+                INSERT INTO products_fts (rowid, title) VALUES (NEW.id, NEW.title);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products
+            BEGIN
+                INSERT INTO products_fts (products_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF title ON products
+            BEGIN
+                INSERT INTO products_fts (products_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+                INSERT INTO products_fts (rowid, title) VALUES (NEW.id, NEW.title);
+            END
+        ''')
+        if not fts_exists:
+            cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+        
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
         conn.commit()
         conn.close()
     
+    def _products(self) -> ProductIndex:
+        """The loaded hot set; every product write below goes through to it, and outside
+        writes (see hotset.py) make it reload"""
+        if not self.hot_set.loaded or self._hot_set_stale():
+            # Own commits wait for the reload, so none can fall between the scan and the swap
+            with self._watch_lock:
+                version = self._read_data_version()
+                conn = self.get_connection()
+                cursor = conn.cursor()
+                products = cursor.execute('SELECT * FROM products').fetchall()
+                users = cursor.execute('SELECT telegram_id, premium_features FROM users').fetchall()
+                conn.close()
+                self.hot_set.load(products, users)
+                self._data_version = version
+                self._changed_elsewhere = False
+        return self.hot_set
+    
+    def _titles(self) -> TitleIndex:
+        """The loaded title index; kept current by the hot set's 'added' events"""
+        if not self.titles.loaded:
+            self.titles.load(self._products().all_products())
+        return self.titles
+    
+    def _add_column_if_missing(self, cursor, table: str, column: str, definition: str) -> bool:
+        """Add a column to an existing table (SQLite has no ADD COLUMN IF NOT EXISTS); True if added"""
+        columns = {row['name'] for row in cursor.execute(f'PRAGMA table_info({table})')}
+        if column in columns:
+            return False
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+    
+    @timed_query
     def create_user(self, telegram_id: int, username: str = None, referred_by: int = None) -> str:
         """Create a new user and return their referral code"""
         conn = self.get_connection()
@@ -94,6 +346,9 @@ class Database:
                 ''', (referred_by,))
             
             conn.commit()
+            self.hot_set.premium_changed(telegram_id, False)
+            if referred_by:
+                self.hot_set.premium_changed(referred_by, True)
             return referral_code
             
         except sqlite3.IntegrityError:
@@ -104,6 +359,7 @@ class Database:
         finally:
             conn.close()
     
+    @timed_query
     def get_user(self, telegram_id: int) -> Optional[Dict]:
         """Get user by telegram ID"""
         conn = self.get_connection()
@@ -118,6 +374,7 @@ class Database:
         
         return dict(result) if result else None
     
+    @timed_query
     def get_user_by_referral_code(self, referral_code: str) -> Optional[Dict]:
         """Get user by referral code"""
         conn = self.get_connection()
@@ -132,73 +389,195 @@ class Database:
         
         return dict(result) if result else None
     
-    def add_product(self, user_id: int, url: str, title: str, current_price: float, 
-                   currency: str, image_url: str = None, target_price: float = None, 
-                   site_name: str = None) -> int:
-        """Add a new product to track"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Check if user has reached their product limit
-        user = self.get_user(user_id)
-        if not user:
-            raise ValueError("User not found")
-        
-        current_count = self.get_user_product_count(user_id)
-        if current_count >= user['max_products']:
-            raise ValueError(f"You can only track {user['max_products']} products. Refer friends to unlock more slots!")
-        
+    def _insert_product(self, cursor, user_id: int, url: str, title: str, current_price: float,
+                        currency: str, image_url: str = None, target_price: float = None,
+                        site_name: str = None, drop_percent: float = None):
+        """Insert a product and its first price_history row if the user is under quota; returns the row or None"""
         # Add affiliate tag to URL
         affiliate_url = self.add_affiliate_tag(url, site_name)
+        key = catalog_key(self._titles(), url, site_name, title, currency, current_price)
+        
+        # "Notify on X% drop" fires at a fixed price below today's
+        drop_alert_price = current_price * (1 - drop_percent / 100) if drop_percent else None
         
+        # The quota check and the insert are one statement, so concurrent adds can't
+        # overshoot max_products; product_count is maintained by triggers. The first
+        # check is one tier interval from now; the scheduler adapts it afterwards.
         cursor.execute('''
             INSERT INTO products (user_id, url, title, current_price, target_price, 
-                                currency, image_url, affiliate_url, site_name)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, url, title, current_price, target_price, currency, 
-              image_url, affiliate_url, site_name))
-        
-        product_id = cursor.lastrowid
+                                currency, image_url, affiliate_url, site_name,
+                                next_check_at, check_interval, drop_percent, drop_alert_price, catalog_key)
+            SELECT telegram_id, :url, :title, :price, :target_price, :currency, :image_url,
+                   :affiliate_url, :site_name,
+                   datetime('now', '+' || (CASE WHEN premium_features THEN :premium ELSE :standard END) || ' hours'),
+                   CASE WHEN premium_features THEN :premium ELSE :standard END,
+                   :drop_percent, :drop_alert_price, :catalog_key
+            FROM users
+            WHERE telegram_id = :user_id AND product_count < max_products
+            RETURNING *
+        ''', {
+            'user_id': user_id, 'url': url, 'title': title, 'price': current_price,
+            'target_price': target_price, 'currency': currency, 'image_url': image_url,
+            'affiliate_url': affiliate_url, 'site_name': site_name, 'drop_percent': drop_percent,
+            'drop_alert_price': drop_alert_price, 'catalog_key': key,
+            'premium': PREMIUM_CHECK_INTERVAL, 'standard': STANDARD_CHECK_INTERVAL,
+        })
+        row = cursor.fetchone()
+        if row is None:
+            return None
         
         # Add to price history
         cursor.execute('''
             INSERT INTO price_history (product_id, price, currency)
             VALUES (?, ?, ?)
-        ''', (product_id, current_price, currency))
+        ''', (row['id'], current_price, currency))
+        return row
+    
+    @timed_query
+    def add_product(self, user_id: int, url: str, title: str, current_price: float, 
+                   currency: str, image_url: str = None, target_price: float = None, 
+                   site_name: str = None, drop_percent: float = None) -> int:
+        """Add a new product to track, enforcing the user's product limit in the same transaction"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
         
-        conn.commit()
-        conn.close()
+        try:
+            row = self._insert_product(cursor, user_id, url, title, current_price, currency,
+                                       image_url, target_price, site_name, drop_percent)
+            if row is None:
+                # Nothing inserted: find out why
+                cursor.execute('SELECT max_products FROM users WHERE telegram_id = ?', (user_id,))
+                user = cursor.fetchone()
+                if not user:
+                    raise ValueError("User not found")
+                raise ValueError(f"You can only track {user['max_products']} products. Refer friends to unlock more slots!")
+            conn.commit()
+        finally:
+            conn.close()
+        self.hot_set.added(row)
         
-        return product_id
+        return row['id']
     
-    def get_user_products(self, user_id: int) -> List[Dict]:
-        """Get all products tracked by a user"""
+    @timed_query
+    def add_products(self, user_id: int, products: List[Dict]) -> List[int]:
+        """Add many products in one transaction, stopping at the user's product limit.
+        
+        ``products`` are dicts of add_product keyword arguments; returns the ids of
+        the ones inserted, in order.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        rows = []
+        try:
+            for product in products:
+                row = self._insert_product(cursor, user_id, **product)
+                if row is None:
+                    break
+                rows.append(row)
+            conn.commit()
+        finally:
+            conn.close()
+        for row in rows:
+            self.hot_set.added(row)
+        
+        return [row['id'] for row in rows]
+    
+    @timed_query
+    def get_catalog_products(self, urls: List[str], max_age_hours: float) -> Dict[str, Dict]:
+        """Freshest tracked copy of each URL checked within ``max_age_hours``, by URL"""
+        return self._products().by_urls(urls, max_age_hours)
+    
+    @timed_query
+    def match_catalog(self, url: str, max_age_hours: float) -> Optional[Dict]:
+        """A tracked product checked within ``max_age_hours`` that a newly pasted URL is, if any.
+        
+        Only the exact URL or the shop's product ID count: titles and slugs
+        are shared by a listing's variants (size, colour) with other prices.
+        """
+        found = self._products().by_urls([url], max_age_hours)
+        if found:
+            return found[url]
+        key = id_key(url)
+        if not key:
+            return None
         conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT * FROM products WHERE user_id = ? ORDER BY created_at DESC
-        ''', (user_id,))
+            SELECT * FROM products
+            WHERE catalog_key = ? AND COALESCE(last_checked, created_at) >= datetime('now', ?)
+            ORDER BY COALESCE(last_checked, created_at) DESC LIMIT 1
+        ''', (key, f'-{max_age_hours} hours'))
+        row = cursor.fetchone()
         
-        results = cursor.fetchall()
         conn.close()
-        
-        return [dict(row) for row in results]
+        return dict(row) if row else None
     
-    def get_user_product_count(self, user_id: int) -> int:
-        """Get count of products tracked by a user"""
+    @timed_query
+    def search_products(self, terms: str, user_id: Optional[int] = None, limit: int = 10,
+                        offset: int = 0) -> Tuple[int, List[Dict]]:
+        """Products whose titles match ``terms``, best match first, and how many there are.
+        
+        With ``user_id`` only that user's products; otherwise one row per catalog
+        product across all users, with ``trackers`` counting its copies.
+        """
+        query = fts_query(terms)
+        if not query:
+            return 0, []
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT COUNT(*) as count FROM products WHERE user_id = ?
-        ''', (user_id,))
+        params = {'query': query, 'user_id': user_id, 'limit': limit, 'offset': offset}
+        if user_id is not None:
+            total = cursor.execute('''
+                SELECT COUNT(*) FROM products_fts JOIN products p ON p.id = products_fts.rowid
+                WHERE products_fts MATCH :query AND p.user_id = :user_id
+            ''', params).fetchone()[0]
+            cursor.execute('''
+                SELECT p.*, 1 AS trackers FROM products_fts JOIN products p ON p.id = products_fts.rowid
+                WHERE products_fts MATCH :query AND p.user_id = :user_id
+                ORDER BY products_fts.rank, p.id
+                LIMIT :limit OFFSET :offset
+            ''', params)
+        else:
+            total = cursor.execute('''
+                SELECT COUNT(DISTINCT COALESCE(p.catalog_key, p.id))
+                FROM products_fts JOIN products p ON p.id = products_fts.rowid
+                WHERE products_fts MATCH :query
+            ''', params).fetchone()[0]
+            # FTS5's rank column is bm25(); bare columns next to MIN() come from the row
+            # with the minimum, i.e. each catalog product's best match
+            cursor.execute('''
+                SELECT p.*, MIN(products_fts.rank) AS score, COUNT(*) AS trackers
+                FROM products_fts JOIN products p ON p.id = products_fts.rowid
+                WHERE products_fts MATCH :query
+                GROUP BY COALESCE(p.catalog_key, p.id)
+                ORDER BY score, p.id
+                LIMIT :limit OFFSET :offset
+            ''', params)
         
-        result = cursor.fetchone()
+        results = cursor.fetchall()
         conn.close()
         
-        return result['count'] if result else 0
+        return total, [dict(row) for row in results]
     
+    @timed_query
+    def get_user_products(self, user_id: int) -> List[Dict]:
+        """Get all products tracked by a user"""
+        return self._products().user_products(user_id)
+    
+    @timed_query
+    def get_product(self, product_id: int, user_id: int = None) -> Optional[Dict]:
+        """Get one product, or None if it doesn't exist or isn't owned by ``user_id``"""
+        return self._products().get(product_id, user_id)
+    
+    @timed_query
+    def get_user_product_count(self, user_id: int) -> int:
+        """Get count of products tracked by a user"""
+        return self._products().user_product_count(user_id)
+    
+    @timed_query
     def remove_product(self, product_id: int, user_id: int) -> bool:
         """Remove a product (only if owned by the user)"""
         conn = self.get_connection()
@@ -216,11 +595,19 @@ class Database:
         
         conn.commit()
         conn.close()
+        if deleted:
+            self.hot_set.removed(product_id)
         
         return deleted
     
+    @timed_query
     def get_all_tracked_products(self) -> List[Dict]:
         """Get all products for price checking"""
+        return self._products().all_products()
+    
+    @timed_query
+    def get_due_products(self, limit: int) -> List[Dict]:
+        """Get products whose next check is due, most overdue first"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -228,18 +615,122 @@ class Database:
             SELECT p.*, u.telegram_id, u.premium_features 
             FROM products p 
             JOIN users u ON p.user_id = u.telegram_id
-        ''')
+            WHERE p.next_check_at IS NULL OR p.next_check_at <= datetime('now')
+            ORDER BY p.next_check_at
+            LIMIT ?
+        ''', (limit,))
         
         results = cursor.fetchall()
         conn.close()
         
         return [dict(row) for row in results]
     
+    @timed_query
+    def get_recent_price_history(self, product_ids: List[int], days: int) -> Dict[int, List[Dict]]:
+        """Get price history of the last ``days`` for many products, oldest first"""
+        history = {product_id: [] for product_id in product_ids}
+        if not product_ids:
+            return history
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(product_ids), 500):
+            chunk = product_ids[start:start + 500]
+            cursor.execute(f'''
+                SELECT product_id, price, recorded_at FROM price_history
+                WHERE product_id IN ({','.join('?' * len(chunk))})
+                  AND recorded_at >= datetime('now', ?)
+                ORDER BY product_id, recorded_at
+            ''', (*chunk, f'-{days} days'))
+            for row in cursor.fetchall():
+                history[row['product_id']].append(dict(row))
+        
+        conn.close()
+        return history
+    
+    @timed_query
+    def get_average_check_weight(self) -> Dict[bool, float]:
+        """Mean adaptive check weight per tier (premium -> weight)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT u.premium_features AS premium, AVG(p.check_weight) AS weight
+            FROM products p JOIN users u ON p.user_id = u.telegram_id
+            WHERE p.check_weight IS NOT NULL
+            GROUP BY u.premium_features
+        ''')
+        
+        results = cursor.fetchall()
+        conn.close()
+        
+        return {bool(row['premium']): row['weight'] for row in results}
+    
+    @timed_query
+    def schedule_checks(self, schedules: List[Dict]):
+        """Store next check times: dicts with id, next_check_at and optional check_interval/check_weight"""
+        if not schedules:
+            return
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.executemany('''
+            UPDATE products
+            SET next_check_at = :next_check_at,
+                check_interval = COALESCE(:check_interval, check_interval),
+                check_weight = COALESCE(:check_weight, check_weight)
+            WHERE id = :id
+        ''', [
+            {'check_interval': None, 'check_weight': None, **schedule} for schedule in schedules
+        ])
+        
+        conn.commit()
+        conn.close()
+    
+    @timed_query
+    def claim_crossed_alerts(self, url: str, new_price: float) -> List[Dict]:
+        """Disarm and return every subscription to ``url`` whose target or drop threshold
+        ``new_price`` has reached, and re-arm the ones the price has risen back above"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT id, user_id, title, currency, affiliate_url, target_price AS threshold,
+                   NULL AS drop_percent, 'target_reached' AS kind
+            FROM products
+            WHERE url = ? AND target_armed = 1 AND target_price >= ?
+            UNION ALL
+            SELECT id, user_id, title, currency, affiliate_url, drop_alert_price AS threshold,
+                   drop_percent, 'drop_threshold' AS kind
+            FROM products
+            WHERE url = ? AND drop_armed = 1 AND drop_alert_price >= ?
+        ''', (url, new_price, url, new_price))
+        crossed = [dict(row) for row in cursor.fetchall()]
+        
+        # Each statement is a single range scan on its (url, armed, threshold) index
+        for column, armed in (('target_price', 'target_armed'), ('drop_alert_price', 'drop_armed')):
+            cursor.execute(f'''
+                UPDATE products SET {armed} = 0
+                WHERE url = ? AND {armed} = 1 AND {column} >= ?
+            ''', (url, new_price))
+            cursor.execute(f'''
+                UPDATE products SET {armed} = 1
+                WHERE url = ? AND {armed} = 0 AND {column} < ?
+            ''', (url, new_price))
+        
+        conn.commit()
+        conn.close()
+        
+        return crossed
+    
+    @timed_query
     def update_product_price(self, product_id: int, new_price: float, currency: str):
         """Update product price and add to history"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        self._record_drops(cursor, [(product_id, new_price, currency)])
         # Update current price
         cursor.execute('''
             UPDATE products 
@@ -255,21 +746,269 @@ class Database:
         
         conn.commit()
         conn.close()
+        self.hot_set.price_updated(product_id, new_price, currency)
     
-    def add_affiliate_tag(self, url: str, site_name: str) -> str:
-        """Add affiliate tag to URL based on site"""
-        from config import SUPPORTED_SITES
+    @timed_query
+    def update_product_prices(self, updates: List[Tuple[int, float, str]]):
+        """Batch form of update_product_price: (product_id, new_price, currency) tuples in one transaction"""
+        if not updates:
+            return
+        conn = self.get_connection()
+        cursor = conn.cursor()
         
-        if not site_name or site_name not in SUPPORTED_SITES:
-            return url
+        self._record_drops(cursor, updates)
+        cursor.executemany('''
+            UPDATE products 
+            SET current_price = ?, currency = ?, last_checked = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', [(new_price, currency, product_id) for product_id, new_price, currency in updates])
+        cursor.executemany('''
+            INSERT INTO price_history (product_id, price, currency)
+            VALUES (?, ?, ?)
+        ''', updates)
         
-        affiliate_tag = SUPPORTED_SITES[site_name]['affiliate_tag']
+        conn.commit()
+        conn.close()
+        for product_id, new_price, currency in updates:
+            self.hot_set.price_updated(product_id, new_price, currency)
+    
+    def _record_drops(self, cursor, updates: List[Tuple[int, float, str]]):
+        """Offer price updates to the top_drops board, before they are applied and in the same transaction.
         
-        if '?' in url:
-            return url + affiliate_tag
-        else:
-            return url + affiliate_tag.replace('&', '?')
+        A drop below a listed deal's price extends that deal (measured from its
+        original price); a price above it ends the deal.
+        """
+        ids = list(dict.fromkeys(product_id for product_id, _, _ in updates))
+        products = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor.execute(f'''
+                SELECT id, catalog_key, title, current_price, currency, affiliate_url FROM products
+                WHERE id IN ({','.join('?' * len(chunk))})
+            ''', chunk)
+            products.update((row['id'], row) for row in cursor.fetchall())
+        keys = list(dict.fromkeys(row['catalog_key'] or f"product:{row['id']}" for row in products.values()))
+        board = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            cursor.execute(f'''
+                SELECT * FROM top_drops WHERE catalog_key IN ({','.join('?' * len(chunk))})
+            ''', chunk)
+            board.update((row['catalog_key'], dict(row)) for row in cursor.fetchall())
+        
+        now = time.time()
+        dropped_at = datetime.utcfromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')
+        changed, ended = {}, set()
+        for product_id, new_price, currency in updates:
+            product = products.get(product_id)
+            if product is None:
+                continue
+            key = product['catalog_key'] or f"product:{product_id}"
+            deal = board.get(key)
+            if deal and (new_price > deal['new_price'] or deal['currency'] != currency):
+                del board[key]
+                changed.pop(key, None)
+                ended.add(key)
+                deal = None
+            if deal and new_price == deal['new_price']:
+                continue  # still the listed deal; re-scoring it would undo its decay
+            # From the product's last price, or from the listed deal's original price
+            best = None
+            starts = [product['current_price']] if product['currency'] == currency else []
+            if deal:
+                starts.append(deal['old_price'])
+            for old_price in starts:
+                priority = drop_priority(old_price, new_price, currency, now)
+                if priority is not None and (best is None or priority > best[0]):
+                    best = (priority, old_price)
+            if best is None:
+                continue
+            board[key] = changed[key] = {
+                'catalog_key': key, 'product_id': product_id, 'title': product['title'], 'currency': currency,
+                'affiliate_url': product['affiliate_url'], 'old_price': best[1], 'new_price': new_price,
+                'drop_percent': drop_percent(best[1], new_price), 'priority': best[0], 'dropped_at': dropped_at,
+            }
+            ended.discard(key)
+        
+        if ended:
+            cursor.executemany('DELETE FROM top_drops WHERE catalog_key = ?', [(key,) for key in ended])
+        if changed:
+            cursor.executemany('''
+                INSERT OR REPLACE INTO top_drops (catalog_key, product_id, title, currency, affiliate_url,
+                                                  old_price, new_price, drop_percent, priority, dropped_at)
+                VALUES (:catalog_key, :product_id, :title, :currency, :affiliate_url,
+                        :old_price, :new_price, :drop_percent, :priority, :dropped_at)
+            ''', list(changed.values()))
+            cursor.execute('''
+                DELETE FROM top_drops WHERE catalog_key NOT IN (
+                    SELECT catalog_key FROM top_drops ORDER BY priority DESC LIMIT ?
+                )
+            ''', (TOP_DROPS_SIZE,))
+    
+    @timed_query
+    def get_top_drops(self, limit: int, max_age_days: int) -> List[Dict]:
+        """Best current price drops across the catalog, best first"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT * FROM top_drops
+            WHERE dropped_at >= datetime('now', ?)
+            ORDER BY priority DESC
+            LIMIT ?
+        ''', (f'-{max_age_days} days', limit))
+        
+        results = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in results]
+    
+    @timed_query
+    def get_price_history(self, product_id: int, limit: int = 30) -> List[Dict]:
+        """Get a product's latest ``limit`` price history rows, newest first, including what
+        other users tracking the same catalog product have recorded"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        # Products checked together write identical rows, hence DISTINCT
+        cursor.execute('''
+            SELECT DISTINCT price, currency, recorded_at FROM price_history
+            WHERE product_id = :id OR product_id IN (
+                SELECT id FROM products
+                WHERE catalog_key = (SELECT catalog_key FROM products WHERE id = :id)
+            )
+            ORDER BY recorded_at DESC
+            LIMIT :limit
+        ''', {'id': product_id, 'limit': limit})
+        
+        results = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in results]
+    
+    @timed_query
+    def get_history_columns(self, after_key: str = '', max_keys: Optional[int] = None) -> Dict[str, List]:
+        """Price history as columns (catalog_key, time in unix seconds, price), sorted by key and time.
+        
+        Paged by catalog key: only keys after ``after_key``, at most ``max_keys`` of them.
+        """
+        conn = self.get_connection()
+        conn.row_factory = None  # plain tuples: this can be millions of rows
+        cursor = conn.cursor()
+        
+        # Products checked together write identical rows, hence the grouping; ties in time keep insert order
+        cursor.execute('''
+            SELECT p.catalog_key, (julianday(h.recorded_at) - 2440587.5) * 86400.0 AS at, h.price
+            FROM price_history h JOIN products p ON p.id = h.product_id
+            WHERE h.price IS NOT NULL AND p.catalog_key IN (
+                SELECT DISTINCT catalog_key FROM products
+                WHERE catalog_key > :after ORDER BY catalog_key LIMIT :max_keys
+            )
+            GROUP BY p.catalog_key, h.recorded_at, h.price
+            ORDER BY p.catalog_key, at, MIN(h.id)
+        ''', {'after': after_key, 'max_keys': -1 if max_keys is None else max_keys})
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        keys, times, prices = (list(column) for column in zip(*rows)) if rows else ([], [], [])
+        return {'keys': keys, 'times': times, 'prices': prices}
+    
+    @timed_query
+    def save_product_stats(self, rows: List[Dict]):
+        """Replace the product_stats table with a freshly computed one"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('DELETE FROM product_stats')
+        cursor.executemany('''
+            INSERT INTO product_stats (catalog_key, current_price, low_price, low_30d, mean_30d, low_90d,
+                                       mean_90d, median_price, drop_vs_median, deal_score, samples)
+            VALUES (:catalog_key, :current_price, :low_price, :low_30d, :mean_30d, :low_90d,
+                    :mean_90d, :median_price, :drop_vs_median, :deal_score, :samples)
+        ''', rows)
+        
+        conn.commit()
+        conn.close()
+    
+    @timed_query
+    def get_product_stats(self, product_id: int) -> Optional[Dict]:
+        """Analytics of a product's catalog entity, if computed yet"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT s.* FROM product_stats s JOIN products p ON p.catalog_key = s.catalog_key
+            WHERE p.id = ?
+        ''', (product_id,))
+        
+        result = cursor.fetchone()
+        conn.close()
+        
+        return dict(result) if result else None
+    
+    @timed_query
+    def get_catalog_stats(self, catalog_keys: List[str]) -> Dict[str, Dict]:
+        """Analytics of many catalog entities, by catalog key"""
+        stats = {}
+        if not catalog_keys:
+            return stats
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(catalog_keys), 500):
+            chunk = catalog_keys[start:start + 500]
+            cursor.execute(f'''
+                SELECT * FROM product_stats WHERE catalog_key IN ({','.join('?' * len(chunk))})
+            ''', chunk)
+            for row in cursor.fetchall():
+                stats[row['catalog_key']] = dict(row)
+        
+        conn.close()
+        return stats
+    
+    @timed_query
+    def get_selector_stats(self) -> List[Dict]:
+        """Get persisted selector hit-rate stats"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT site, region, field, selector, hits, evaluations FROM selector_stats')
+        
+        results = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in results]
+    
+    @timed_query
+    def save_selector_stats(self, rows: List[Dict]):
+        """Upsert selector hit-rate stats"""
+        if not rows:
+            return
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.executemany('''
+            INSERT INTO selector_stats (site, region, field, selector, hits, evaluations)
+            VALUES (:site, :region, :field, :selector, :hits, :evaluations)
+            ON CONFLICT (site, region, field, selector) DO UPDATE SET
+                hits = excluded.hits,
+                evaluations = excluded.evaluations,
+                updated_at = CURRENT_TIMESTAMP
+        ''', rows)
+        
+        conn.commit()
+        conn.close()
+    
+    def add_affiliate_tag(self, url: str, site_name: str) -> str:
+        """Add affiliate tag to URL based on site"""
+        from sites import sites
+        
+        spec = sites.get(site_name) if site_name else None
+        return spec.affiliate_url(url) if spec else url
     
+    @timed_query
     def get_referral_stats(self, user_id: int) -> Dict:
         """Get user's referral statistics"""
         conn = self.get_connection()
@@ -304,4 +1043,4 @@ class Database:
         }
 
 # Global database instance
-db = Database() 
+db = Lazy(Database)
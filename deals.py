@@ -0,0 +1,40 @@
+"""
+Scoring for the "top drops" board behind /deals.
+
+Every price update that lowers a product's price by at least
+TOP_DROPS_MIN_PERCENT is offered to the board, in the same transaction
+(Database.update_product_price/update_product_prices), which keeps the
+best TOP_DROPS_SIZE catalog products. A drop's weight is its percent drop,
+boosted logarithmically by its size in USD (CURRENCY_USD_RATES; drops in
+other currencies only count their percent), and halves every
+TOP_DROPS_HALF_LIFE_HOURS.
+
+Instead of rescoring the board as time passes, entries store a forward
+decayed priority, ln(weight) + t / tau: the order of two stored priorities
+is the order of their decayed weights at any later time, so reading the
+best deals is a plain ORDER BY over at most TOP_DROPS_SIZE rows.
+"""
+import math
+import time
+from typing import Optional
+
+from config import CURRENCY_USD_RATES, TOP_DROPS_MIN_PERCENT, TOP_DROPS_HALF_LIFE_HOURS
+
+TAU = TOP_DROPS_HALF_LIFE_HOURS * 3600 / math.log(2)
+
+
+def drop_percent(old_price: Optional[float], new_price: float) -> float:
+    if not old_price or old_price <= 0 or new_price >= old_price:
+        return 0.0
+    return (old_price - new_price) / old_price * 100
+
+
+def drop_priority(old_price: Optional[float], new_price: float, currency: str,
+                  at: Optional[float] = None) -> Optional[float]:
+    """Board priority of a price change, or None if it isn't a big enough drop"""
+    percent = drop_percent(old_price, new_price)
+    if percent < TOP_DROPS_MIN_PERCENT:
+        return None
+    usd = (old_price - new_price) * CURRENCY_USD_RATES.get(currency, 0.0)
+    weight = percent * (1 + math.log10(1 + usd))
+    return math.log(weight) + (at or time.time()) / TAU
@@ -0,0 +1,132 @@
+"""
+Catalog keys: one key per real product, however many URLs reach it.
+
+A URL carrying the shop's product ID (ASIN, AliExpress item number, Jumia
+or Konga ID) is keyed by that ID. Other URLs are matched on their title
+against the products already tracked on the same shop and currency: titles
+are cut into character shingles, summarized by MinHash signatures and
+bucketed with LSH banding, so a lookup only compares against likely
+matches. A candidate is accepted when the estimated similarity reaches
+DEDUP_TITLE_SIMILARITY, the numbers in both titles (sizes, model numbers)
+are identical and the prices are within DEDUP_PRICE_TOLERANCE. Anything
+unmatched gets a key of its own derived from its URL.
+"""
+import hashlib
+import random
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import DEDUP_TITLE_SIMILARITY, DEDUP_PRICE_TOLERANCE
+from sites import sites
+
+PERMUTATIONS = 64
+BANDS = 16  # of PERMUTATIONS // BANDS rows each
+SHINGLE_SIZE = 5
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)  # fixed so signatures are stable across restarts
+_COEFFICIENTS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(PERMUTATIONS)]
+_NON_WORD = re.compile(r'[\W_]+')
+_NUMBER = re.compile(r'\d+')
+
+
+def normalize_title(title: str) -> str:
+    return _NON_WORD.sub(' ', (title or '').lower()).strip()
+
+
+def minhash(title: str) -> Tuple[int, ...]:
+    """MinHash signature of a title's character shingles"""
+    text = normalize_title(title)
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+    return tuple(min((a * value + b) % _PRIME for value in hashes) for a, b in _COEFFICIENTS)
+
+
+def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(first, second) if x == y) / PERMUTATIONS
+
+
+def url_key(url: str, site_name: str) -> str:
+    """Key for a product known only by its URL"""
+    return f"{site_name}:url:{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}"
+
+
+def id_key(url: str) -> Optional[str]:
+    """Key from the shop's product ID in the URL, if it has one"""
+    spec, domain = sites.match(url)
+    return spec.product_key(url, domain) if spec else None
+
+
+class TitleIndex:
+    """MinHash LSH index of tracked product titles, per shop and currency"""
+
+    def __init__(self):
+        self.loaded = False
+        self._entries: Dict[str, Tuple[Tuple[int, ...], frozenset, Optional[float]]] = {}
+        self._buckets: Dict[Tuple, set] = {}
+        self._lock = threading.Lock()
+
+    def load(self, products: Iterable[Dict]):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            for product in products:
+                self._add(product)
+            self.loaded = True
+
+    def on_product_event(self, event: str, record):
+        """Hot set listener: index products as they are added, start over when it reloads"""
+        if event == 'reloaded':
+            self.loaded = False  # rebuilt from the reloaded hot set on next use
+        elif event == 'added' and self.loaded:
+            self.add(record.as_dict())
+
+    def add(self, product: Dict):
+        """Index a products row (dict with catalog_key, title, site_name, currency, current_price)"""
+        with self._lock:
+            self._add(product)
+
+    def _add(self, product: Dict):
+        key = product.get('catalog_key')
+        if not key or key in self._entries or not product.get('title'):
+            return
+        signature = minhash(product['title'])
+        numbers = frozenset(_NUMBER.findall(normalize_title(product['title'])))
+        self._entries[key] = (signature, numbers, product.get('current_price'))
+        for band in self._bands(product['site_name'], product['currency'], signature):
+            self._buckets.setdefault(band, set()).add(key)
+
+    @staticmethod
+    def _bands(site_name: str, currency: str, signature: Tuple[int, ...]) -> List[Tuple]:
+        rows = PERMUTATIONS // BANDS
+        return [(site_name, currency, band, signature[band * rows:(band + 1) * rows]) for band in range(BANDS)]
+
+    def match(self, site_name: str, currency: str, title: str, price: Optional[float] = None) -> Optional[str]:
+        """Catalog key of an already tracked product that is the same as this one, if any"""
+        if not title:
+            return None
+        signature = minhash(title)
+        numbers = frozenset(_NUMBER.findall(normalize_title(title)))
+        best, best_score = None, DEDUP_TITLE_SIMILARITY
+        with self._lock:
+            candidates = set()
+            for band in self._bands(site_name, currency, signature):
+                candidates.update(self._buckets.get(band, ()))
+            for key in candidates:
+                other, other_numbers, other_price = self._entries[key]
+                if other_numbers != numbers:
+                    continue  # "128GB" vs "256GB" is not a near-duplicate
+                if price and other_price and abs(price - other_price) > DEDUP_PRICE_TOLERANCE * max(price, other_price):
+                    continue
+                score = similarity(signature, other)
+                if score >= best_score:
+                    best, best_score = key, score
+        return best
+
+
+def catalog_key(index: TitleIndex, url: str, site_name: str, title: str, currency: str,
+                price: Optional[float] = None) -> str:
+    """Catalog key for a product: shop product ID, else a matching tracked title, else its own"""
+    return id_key(url) or index.match(site_name, currency, title, price) or url_key(url, site_name)
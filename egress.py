@@ -0,0 +1,186 @@
+"""
+Egress pool for page fetches.
+
+Every egress (a proxy, or the direct connection) has its own Transport,
+so its own connection pools and cookie jar, and its own per-site (or,
+for sites with rate_limit_scope 'domain', per-marketplace) rate limiters:
+each IP gets the full rate budget a site tolerates. Health is
+tracked per egress and site from success rate, latency and block
+detections; requests go to a weighted random egress and one that keeps
+failing for a site is quarantined for that site, for longer each time.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from config import (INTERACTIVE_RATE_SHARE, EGRESS_PROXIES, EGRESS_DIRECT, EGRESS_HEALTH_DECAY,
+                    EGRESS_LATENCY_REFERENCE, EGRESS_MIN_WEIGHT, EGRESS_QUARANTINE_AFTER,
+                    EGRESS_QUARANTINE_SECONDS, EGRESS_QUARANTINE_MAX)
+from metrics import registry, EGRESS_REQUESTS, EGRESS_SCORE, EGRESS_QUARANTINED
+from sites import sites
+from transport import Transport
+
+logger = logging.getLogger(__name__)
+
+OK = 'ok'
+ERROR = 'error'
+BLOCKED = 'blocked'
+
+
+class RateLimiter:
+    """Spaces out requests to one site to at most ``rate`` per second.
+
+    ``reserved`` is the share of the rate kept for interactive requests: they
+    take the next slot of either spacing, while sweeps only use the rest, so
+    a user's lookup never queues behind slots a sweep has already claimed.
+    """
+
+    def __init__(self, rate: float, reserved: float = 0.0):
+        if rate <= 0:
+            self.intervals = {False: 0.0, True: 0.0}
+        elif 0 < reserved < 1:
+            self.intervals = {False: 1.0 / (rate * (1 - reserved)), True: 1.0 / (rate * reserved)}
+        else:
+            self.intervals = {False: 1.0 / rate, True: 1.0 / rate}
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._shared = self.intervals[False] == self.intervals[True]
+        self._next_slot = {False: 0.0, True: 0.0}
+        self._lock = threading.Lock()
+
+    def reserve(self, interactive: bool = False, max_delay: Optional[float] = None) -> Optional[float]:
+        """Claim the next slot and return the seconds until it; None, claiming nothing, if beyond ``max_delay``"""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            lane = False
+            if interactive and not self._shared and self._next_slot[True] <= self._next_slot[False]:
+                lane = True
+            slot = max(now, self._next_slot[lane])
+            if max_delay is not None and slot - now > max_delay:
+                return None
+            self._next_slot[lane] = slot + self.intervals[lane]
+        return slot - now
+
+    def wait(self, interactive: bool = False):
+        delay = self.reserve(interactive)
+        if delay:
+            time.sleep(delay)
+
+
+class EgressHealth:
+    """Decayed outcome averages of one egress towards one site"""
+
+    __slots__ = ('success', 'blocks', 'latency', 'failures', 'quarantined_until', 'quarantines')
+
+    def __init__(self):
+        self.reset()
+        self.quarantined_until = 0.0
+        self.quarantines = 0
+
+    def reset(self):
+        self.success = 1.0
+        self.blocks = 0.0
+        self.latency = 0.0
+        self.failures = 0
+
+    @property
+    def score(self) -> float:
+        """Routing weight: success rate, discounted for blocks and for latency"""
+        speed = EGRESS_LATENCY_REFERENCE / (EGRESS_LATENCY_REFERENCE + self.latency)
+        return max(EGRESS_MIN_WEIGHT, self.success * (1.0 - self.blocks) * speed)
+
+    def record(self, outcome: str, seconds: float, decay: float = EGRESS_HEALTH_DECAY) -> bool:
+        """Fold in one request outcome; returns True when the egress should be quarantined"""
+        self.success = decay * self.success + (1 - decay) * (outcome == OK)
+        self.blocks = decay * self.blocks + (1 - decay) * (outcome == BLOCKED)
+        if outcome == OK:
+            self.latency = decay * self.latency + (1 - decay) * seconds if self.latency else seconds
+            self.failures = 0
+            self.quarantines = 0
+            return False
+        self.failures += 1
+        return self.failures >= EGRESS_QUARANTINE_AFTER
+
+
+class Egress:
+    """One way out: a proxy URL, or None for a direct connection"""
+
+    def __init__(self, proxy: Optional[str], pool_sizes: Optional[Dict[str, int]] = None):
+        self.proxy = proxy
+        if proxy:
+            parsed = urlparse(proxy)
+            self.name = f"{parsed.hostname}:{parsed.port}" if parsed.port else parsed.hostname
+        else:
+            self.name = 'direct'
+        self.transport = Transport(pool_sizes=pool_sizes, proxy=proxy)
+        self.rate_limiters = {
+            key: RateLimiter(spec.rate_limit, INTERACTIVE_RATE_SHARE) for spec in sites for key in spec.rate_limit_keys()
+        }
+        self.health: Dict[str, EgressHealth] = {spec.name: EgressHealth() for spec in sites}
+
+    def __repr__(self):
+        return f"Egress({self.name})"
+
+    def rate_limiter(self, url: str) -> RateLimiter:
+        """The limiter this egress spaces requests for ``url`` with"""
+        spec, domain = sites.match(url)
+        return self.rate_limiters[spec.rate_limit_key(domain)]
+
+
+class EgressPool:
+    """Weighted, health-scored choice between egresses, with quarantine"""
+
+    def __init__(self, proxies: List[str] = EGRESS_PROXIES, direct: bool = EGRESS_DIRECT,
+                 pool_sizes: Optional[Dict[str, int]] = None):
+        self.egresses = [Egress(proxy, pool_sizes) for proxy in proxies]
+        if direct or not self.egresses:
+            self.egresses.insert(0, Egress(None, pool_sizes))
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        registry.add_collector(self.collect_metrics)
+
+    def collect_metrics(self):
+        now = time.monotonic()
+        for egress in self.egresses:
+            for site_name, health in egress.health.items():
+                EGRESS_SCORE.set(health.score, egress=egress.name, site=site_name)
+                EGRESS_QUARANTINED.set(int(health.quarantined_until > now), egress=egress.name, site=site_name)
+
+    def choose(self, site_name: str, avoid: Optional[Egress] = None) -> Egress:
+        """Pick an egress for a request to ``site_name``, preferring one other than ``avoid``"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [egress for egress in self.egresses if egress is not avoid] or list(self.egresses)
+            ready = []
+            for egress in candidates:
+                health = egress.health[site_name]
+                if health.quarantined_until and health.quarantined_until <= now:
+                    # Back on probation with a clean record; failing again quarantines it for longer
+                    health.quarantined_until = 0.0
+                    health.reset()
+                if not health.quarantined_until:
+                    ready.append(egress)
+            if not ready:
+                # Everything is quarantined for this site: use whichever comes back first
+                return min(candidates, key=lambda egress: egress.health[site_name].quarantined_until)
+            if len(ready) == 1:
+                return ready[0]
+            weights = [egress.health[site_name].score for egress in ready]
+            return self._random.choices(ready, weights)[0]
+
+    def record(self, egress: Egress, site_name: str, outcome: str, seconds: float):
+        """Update an egress's health after a request; quarantines it after repeated failures"""
+        EGRESS_REQUESTS.inc(egress=egress.name, outcome=outcome)
+        with self._lock:
+            health = egress.health[site_name]
+            # With a single egress there is nothing to fail over to
+            if health.record(outcome, seconds) and len(self.egresses) > 1:
+                hold = min(EGRESS_QUARANTINE_MAX, EGRESS_QUARANTINE_SECONDS * 2 ** health.quarantines)
+                health.quarantined_until = time.monotonic() + hold
+                health.quarantines += 1
+                health.failures = 0
+                logger.warning(f"Egress {egress.name} quarantined for {site_name} for {hold:.0f}s")
@@ -0,0 +1,175 @@
+"""
+In-memory copy of the products table for the hot read paths.
+
+The index assumes a single writer: it only learns about changes through the
+Database write-through hooks of its own process. Anything else that writes
+products (archive.py reextract, a second bot process, the benchmark's
+direct inserts, manual SQL) leaves it stale. Database catches that cheaply:
+before serving a read it compares the database's PRAGMA data_version with
+the value after its own last commit and reloads the whole index when another
+connection has committed since.
+
+Records hold what the reads here need. target_armed, drop_armed,
+drop_alert_price, next_check_at, check_interval and check_weight are not
+kept; callers that need them (alert claims, due checks, scheduling) read
+them with SQL.
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+from metrics import registry, HOT_SET_PRODUCTS
+
+
+class ProductRecord:
+    """Compact in-memory copy of a products row"""
+
+    __slots__ = ('id', 'user_id', 'url', 'title', 'current_price', 'target_price', 'currency', 'image_url',
+                 'affiliate_url', 'site_name', 'created_at', 'last_checked', 'drop_percent', 'catalog_key')
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            setattr(self, name, row[name])
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ProductIndex:
+    """Tracked products indexed by id and by user, kept in sync by Database write-through hooks.
+
+    Listeners registered with ``subscribe`` are called as ``listener(event, record)``
+    after every change, with event 'added', 'removed' or 'price', and with
+    ('reloaded', None) when the whole index was replaced.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._by_id: Dict[int, ProductRecord] = {}
+        self._by_user: Dict[int, Dict[int, ProductRecord]] = {}
+        self._by_url: Dict[str, Dict[int, ProductRecord]] = {}
+        self._premium: Dict[int, bool] = {}
+        self._listeners: List[Callable] = []
+        self._lock = threading.RLock()
+        registry.add_collector(self.collect_metrics)
+
+    def collect_metrics(self):
+        HOT_SET_PRODUCTS.set(len(self._by_id))
+
+    def subscribe(self, listener: Callable):
+        self._listeners.append(listener)
+
+    def _notify(self, event: str, record: ProductRecord):
+        for listener in self._listeners:
+            listener(event, record)
+
+    def load(self, products: Iterable, users: Iterable):
+        """Replace the index contents with full table scans of products and users"""
+        reloaded = self.loaded
+        # Fill fresh maps and swap them in, so lock-free reads never see a half-built index
+        maps = ({}, {}, {})
+        for row in products:
+            self._insert(ProductRecord(row), maps)
+        premium = {row['telegram_id']: bool(row['premium_features']) for row in users}
+        with self._lock:
+            self._by_id, self._by_user, self._by_url = maps
+            self._premium = premium
+            self.loaded = True
+        if reloaded:
+            self._notify('reloaded', None)
+
+    def _insert(self, record: ProductRecord, maps: Optional[tuple] = None):
+        by_id, by_user, by_url = maps or (self._by_id, self._by_user, self._by_url)
+        by_id[record.id] = record
+        by_user.setdefault(record.user_id, {})[record.id] = record
+        by_url.setdefault(record.url, {})[record.id] = record
+
+    # Write-through hooks; before the first load there is nothing to keep in sync
+
+    def added(self, row):
+        if not self.loaded:
+            return
+        with self._lock:
+            record = ProductRecord(row)
+            self._insert(record)
+        self._notify('added', record)
+
+    def removed(self, product_id: int):
+        if not self.loaded:
+            return
+        with self._lock:
+            record = self._by_id.pop(product_id, None)
+            if record is None:
+                return
+            for index, key in ((self._by_user, record.user_id), (self._by_url, record.url)):
+                bucket = index.get(key)
+                if bucket is not None:
+                    bucket.pop(product_id, None)
+                    if not bucket:
+                        del index[key]
+        self._notify('removed', record)
+
+    def price_updated(self, product_id: int, price: float, currency: str):
+        if not self.loaded:
+            return
+        with self._lock:
+            record = self._by_id.get(product_id)
+            if record is None:
+                return
+            record.current_price = price
+            record.currency = currency
+            record.last_checked = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        self._notify('price', record)
+
+    def premium_changed(self, user_id: int, premium: bool):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._premium[user_id] = premium
+
+    # Reads
+
+    def get(self, product_id: int, user_id: Optional[int] = None) -> Optional[Dict]:
+        record = self._by_id.get(product_id)
+        if record is None or (user_id is not None and record.user_id != user_id):
+            return None
+        return record.as_dict()
+
+    def user_products(self, user_id: int) -> List[Dict]:
+        """A user's products, newest first"""
+        with self._lock:
+            records = list(self._by_user.get(user_id, {}).values())
+        records.sort(key=lambda record: (record.created_at or '', record.id), reverse=True)
+        return [record.as_dict() for record in records]
+
+    def user_product_count(self, user_id: int) -> int:
+        return len(self._by_user.get(user_id, ()))
+
+    def by_urls(self, urls: Iterable[str], max_age_hours: float) -> Dict[str, Dict]:
+        """Most recently checked record per URL, skipping copies older than ``max_age_hours``"""
+        cutoff = (datetime.now(timezone.utc) - timedelta(hours=max_age_hours)).strftime('%Y-%m-%d %H:%M:%S')
+        found = {}
+        with self._lock:
+            for url in urls:
+                records = self._by_url.get(url)
+                if not records:
+                    continue
+                freshest = max(records.values(), key=lambda record: record.last_checked or '')
+                if (freshest.last_checked or '') >= cutoff:
+                    found[url] = freshest.as_dict()
+        return found
+
+    def all_products(self) -> List[Dict]:
+        """Every product with its owner's telegram_id and premium_features, like the SQL join"""
+        with self._lock:
+            records = list(self._by_id.values())
+            premium = dict(self._premium)
+        products = []
+        for record in records:
+            if record.user_id not in premium:
+                continue
+            product = record.as_dict()
+            product['telegram_id'] = record.user_id
+            product['premium_features'] = premium[record.user_id]
+            products.append(product)
+        return products
@@ -0,0 +1,122 @@
+"""
+Priority lanes for page fetches.
+
+Fetches for a user waiting on the bot (interactive), premium sweeps and
+standard sweeps share one pool of fetch slots. Waiting fetches are served
+by weighted fair queuing: each gets a virtual finish time of
+``max(virtual clock, lane's last finish) + 1 / weight`` and the smallest one goes
+next, so a backlogged lane gets slots in proportion to its weight and an
+idle lane loses nothing. A few slots are reserved for the interactive lane
+so a pasted link never waits for a sweep's fetches to finish.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Dict
+
+from metrics import registry, FETCH_QUEUE_SECONDS, FETCH_QUEUE_DEPTH
+
+INTERACTIVE = 'interactive'
+PREMIUM = 'premium'
+STANDARD = 'standard'
+LANES = (INTERACTIVE, PREMIUM, STANDARD)  # highest priority first
+
+
+class Ticket:
+    """One fetch's place in the lanes; kept across its retries"""
+
+    __slots__ = ('lane', 'tag', 'enqueued', 'future')
+
+    def __init__(self, lane: str):
+        if lane not in LANES:
+            raise ValueError(f"Unknown fetch lane: {lane}")
+        self.lane = lane
+        self.tag = 0.0
+        self.enqueued = 0.0
+        self.future = None
+
+
+class LaneScheduler:
+    """Weighted fair queuing of ``slots`` concurrent fetches between lanes.
+
+    ``reserved`` of the slots are only handed to the interactive lane.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, slots: int, weights: Dict[str, float], reserved: int = 0):
+        self.slots = slots
+        self.reserved = max(0, min(reserved, slots - 1))
+        self.weights = weights
+        self.busy = 0
+        self._virtual = 0.0
+        self._finish = {lane: 0.0 for lane in LANES}
+        self._queues = {lane: deque() for lane in LANES}
+        registry.add_collector(self.collect_metrics)
+
+    def collect_metrics(self):
+        for lane, waiting in self._queues.items():
+            FETCH_QUEUE_DEPTH.set(len(waiting), lane=lane)
+
+    def _limit(self, lane: str) -> int:
+        return self.slots if lane == INTERACTIVE else self.slots - self.reserved
+
+    def _enqueue(self, ticket: Ticket):
+        ticket.tag = max(self._virtual, self._finish[ticket.lane]) + 1.0 / self.weights[ticket.lane]
+        self._finish[ticket.lane] = ticket.tag
+        self._queues[ticket.lane].append(ticket)
+
+    async def acquire(self, ticket: Ticket):
+        """Wait for a fetch slot in the ticket's lane"""
+        ticket.future = asyncio.get_running_loop().create_future()
+        ticket.enqueued = time.monotonic()
+        self._enqueue(ticket)
+        self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                self.release()  # granted just before the cancellation arrived
+            elif ticket in self._queues[ticket.lane]:
+                self._queues[ticket.lane].remove(ticket)
+            raise
+
+    def try_acquire(self, lane: str) -> bool:
+        """Take a slot only if one is free right now and nobody in the lane is waiting"""
+        if self.busy >= self._limit(lane) or self._queues[lane]:
+            return False
+        self.busy += 1
+        return True
+
+    def release(self):
+        self.busy -= 1
+        self._dispatch()
+
+    def promote(self, ticket: Ticket, lane: str):
+        """Move a fetch to a higher priority lane, e.g. when a user asks for a URL a sweep is fetching"""
+        if LANES.index(lane) >= LANES.index(ticket.lane):
+            return
+        waiting = self._queues[ticket.lane]
+        queued = ticket.future is not None and not ticket.future.done() and ticket in waiting
+        if queued:
+            waiting.remove(ticket)
+        ticket.lane = lane
+        if queued:
+            self._enqueue(ticket)
+            self._dispatch()
+
+    def _dispatch(self):
+        while self.busy < self.slots:
+            ticket = None
+            for lane in LANES:
+                waiting = self._queues[lane]
+                if waiting and self.busy < self._limit(lane) and (ticket is None or waiting[0].tag < ticket.tag):
+                    ticket = waiting[0]
+            if ticket is None:
+                return
+            self._queues[ticket.lane].popleft()
+            if ticket.future.cancelled():
+                continue
+            self._virtual = max(self._virtual, ticket.tag)
+            self.busy += 1
+            FETCH_QUEUE_SECONDS.observe(time.monotonic() - ticket.enqueued, lane=ticket.lane)
+            ticket.future.set_result(None)
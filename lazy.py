@@ -0,0 +1,41 @@
+import threading
+from typing import Callable
+
+
+class Lazy:
+    """Module-level singleton that is only built on first attribute access.
+
+    ``db = Lazy(Database)`` can be imported everywhere as before; the
+    Database (and its DDL, connections, imports) is created the first time
+    anything touches ``db.<attr>``.
+    """
+
+    __slots__ = ('_factory', '_instance', '_lock')
+
+    def __init__(self, factory: Callable):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _resolve(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    object.__setattr__(self, '_instance', self._factory())
+                instance = self._instance
+        return instance
+
+    @property
+    def _created(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __repr__(self):
+        state = repr(self._instance) if self._instance is not None else 'not created'
+        return f"Lazy({state})"
@@ -0,0 +1,260 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, Prometheus style"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the wrapped block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        row = self._values.get(key)
+        return sum(row[:-1]) if row else 0
+
+    def total(self, **labels) -> float:
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        row = self._values.get(key)
+        return row[-1] if row else 0.0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(row)) for key, row in self._values.items()]
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            cumulative += row[len(self.buckets)]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {row[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    """Collection of metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def add_collector(self, collector):
+        """Register a callable that refreshes gauges right before each render"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Scraper
+FETCH_SECONDS = registry.histogram('dealfinder_fetch_seconds', 'Product page fetch latency', ['site'])
+PARSE_SECONDS = registry.histogram('dealfinder_parse_seconds', 'Product page parse time', ['site'])
+PARSE_SOURCE = registry.counter(
+    'dealfinder_parse_source_total', 'Pages parsed by source (ld_json, state or dom fallback)', ['site', 'source']
+)
+SELECTOR_HITS = registry.counter(
+    'dealfinder_selector_hits_total',
+    'Selector matches by position in the fallback chain (0 = primary, "none" = no match)',
+    ['site', 'field', 'position']
+)
+SELECTOR_EVALUATIONS = registry.counter(
+    'dealfinder_selector_evaluations_total', 'Selector lookups performed while parsing pages', ['site', 'field']
+)
+SELECTOR_DRIFT = registry.counter(
+    'dealfinder_selector_drift_total', 'Re-validations where the preferred selector stopped matching', ['site', 'field']
+)
+SCRAPE_FAILURES = registry.counter('dealfinder_scrape_failures_total', 'Scrape failures by cause', ['site', 'cause'])
+
+FETCH_RETRY_COUNT = registry.counter('dealfinder_fetch_retries_total', 'Fetch retries after transient failures', ['site', 'cause'])
+BREAKER_SKIPS = registry.counter('dealfinder_breaker_skips_total', 'Fetches skipped because the site breaker is open', ['site'])
+BREAKER_STATE = registry.gauge('dealfinder_breaker_state', 'Circuit breaker state (0 closed, 1 half-open, 2 open)', ['site'])
+FETCH_QUEUE_SECONDS = registry.histogram('dealfinder_fetch_queue_seconds', 'Time fetches wait for a slot, by priority lane', ['lane'])
+HEDGED_FETCHES = registry.counter(
+    'dealfinder_hedged_fetches_total', 'Interactive fetches that sent a hedge request, by which request answered first',
+    ['site', 'winner']
+)
+FETCH_QUEUE_DEPTH = registry.gauge('dealfinder_fetch_queue_depth', 'Fetches waiting for a slot, by priority lane', ['lane'])
+HTTP_POOL_CONNECTIONS = registry.gauge('dealfinder_http_pool_connections', 'Connections opened per host', ['host'])
+HTTP_POOL_REQUESTS = registry.gauge('dealfinder_http_pool_requests', 'Requests served per host', ['host'])
+HTTP_POOL_REUSE = registry.gauge('dealfinder_http_pool_reuse_ratio', 'Share of requests on a reused connection', ['host'])
+HTTP_REQUESTS_BY_VERSION = registry.gauge('dealfinder_http_requests_by_version', 'Requests by HTTP version', ['version'])
+EGRESS_REQUESTS = registry.counter('dealfinder_egress_requests_total', 'Page requests by egress and outcome', ['egress', 'outcome'])
+EGRESS_SCORE = registry.gauge('dealfinder_egress_score', 'Egress routing weight per site', ['egress', 'site'])
+EGRESS_QUARANTINED = registry.gauge('dealfinder_egress_quarantined', 'Whether an egress is quarantined for a site', ['egress', 'site'])
+DNS_CACHE_LOOKUPS = registry.gauge('dealfinder_dns_cache_lookups', 'In-process DNS cache lookups', ['result'])
+
+# Database
+DB_QUERY_SECONDS = registry.histogram(
+    'dealfinder_db_query_seconds', 'Database method latency', ['method'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+DB_QUEUE_DEPTH = registry.gauge('dealfinder_db_queue_depth', 'Queries waiting for a database thread')
+DB_BATCHED_WRITES = registry.counter('dealfinder_db_batched_writes_total', 'Price updates merged into batch transactions')
+
+HOT_SET_PRODUCTS = registry.gauge('dealfinder_hot_set_products', 'Products held in the in-memory index')
+
+# Scheduler
+SWEEP_SECONDS = registry.histogram(
+    'dealfinder_sweep_seconds', 'Price check sweep duration', ['tier'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+)
+PRODUCTS_CHECKED = registry.counter('dealfinder_products_checked_total', 'Products checked by sweeps', ['tier'])
+ALERTS_SENT = registry.counter('dealfinder_alerts_sent_total', 'Price alerts sent to users', ['kind'])
+SWEEP_FAILURES = registry.counter('dealfinder_sweep_failures_total', 'Sweep failures by cause', ['cause'])
+
+# Bot handlers
+HANDLER_SECONDS = registry.histogram('dealfinder_handler_seconds', 'Telegram update handler latency', ['handler'])
+HANDLER_ERRORS = registry.counter('dealfinder_handler_errors_total', 'Unhandled errors in update handlers', ['handler'])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = '127.0.0.1') -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics from a daemon thread; returns None when disabled"""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint disabled: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,182 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+from lazy import Lazy
+from config import (SWEEP_CONCURRENCY, FETCH_RETRIES, FETCH_LANE_WEIGHTS, INTERACTIVE_RESERVED_SLOTS, HEDGE_ENABLED,
+                    HEDGE_QUANTILE, HEDGE_DEFAULT_DELAY, HEDGE_MIN_DELAY, CURRENCY_USD_RATES)
+from lanes import LaneScheduler, Ticket, INTERACTIVE, STANDARD
+from metrics import registry, FETCH_RETRY_COUNT, BREAKER_SKIPS, BREAKER_STATE, HEDGED_FETCHES
+from resilience import ScrapeError, CircuitBreaker, CircuitOpenError, HedgeBudget, backoff_delays
+from scraper import scraper as default_scraper, ProductScraper
+from egress import Egress
+from sites import sites
+
+logger = logging.getLogger(__name__)
+
+BREAKER_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+
+class FetchPipeline:
+    """Shared async front end for ProductScraper.
+
+    Runs page fetches on worker threads, retries transient failures with
+    jittered backoff, keeps one circuit breaker per site and coalesces
+    concurrent requests for the same URL into a single fetch. Worker slots
+    are shared between priority lanes (see lanes.py); a user joining a
+    sweep's fetch of the same URL promotes it to the interactive lane.
+
+    Interactive fetches are hedged: if the page hasn't arrived by the
+    site's p90 latency, a second request goes out through another egress
+    and the first answer wins. Hedges are capped by a HedgeBudget and only take a free slot.
+    """
+
+    def __init__(self, product_scraper: ProductScraper, workers: int = SWEEP_CONCURRENCY,
+                 retries: int = FETCH_RETRIES, hedge: bool = HEDGE_ENABLED):
+        self.scraper = product_scraper
+        self.retries = retries
+        self.hedge = hedge
+        self.hedge_budget = HedgeBudget()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch')
+        self.lanes = LaneScheduler(workers, FETCH_LANE_WEIGHTS, INTERACTIVE_RESERVED_SLOTS)
+        self.breakers = {spec.name: CircuitBreaker(spec.name) for spec in sites}
+        self._inflight: Dict[str, Tuple[asyncio.Future, Ticket]] = {}
+        registry.add_collector(self.collect_metrics)
+
+    def collect_metrics(self):
+        for name, breaker in self.breakers.items():
+            BREAKER_STATE.set(BREAKER_STATE_VALUES[breaker.state], site=name)
+
+    async def fetch(self, url: str, lane: str = STANDARD) -> Dict:
+        """Scrape a product page in a priority lane; raises ScrapeError subclasses on failure"""
+        cached = self.scraper.get_cached(url)
+        if cached:
+            return cached
+        entry = self._inflight.get(url)
+        if entry is None:
+            ticket = Ticket(lane)
+            task = asyncio.ensure_future(self._fetch(url, ticket))
+            self._inflight[url] = (task, ticket)
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        else:
+            task, ticket = entry
+            self.lanes.promote(ticket, lane)
+        # Shield so one cancelled waiter doesn't cancel the shared fetch
+        return dict(await asyncio.shield(task))
+
+    async def fetch_many(self, urls: Iterable[str], lane: str = STANDARD) -> List:
+        """Fetch several URLs concurrently; each result is product info or the exception raised"""
+        return await asyncio.gather(*(self.fetch(url, lane) for url in urls), return_exceptions=True)
+
+    async def compare_marketplaces(self, url: str, domains: Iterable[str], lane: str = INTERACTIVE) -> List[Dict]:
+        """Fetch one product on several of its site's domains at once; the offers found, cheapest first.
+
+        Offers carry ``url``, ``domain`` and ``usd`` (the price in USD by
+        CURRENCY_USD_RATES, None for an unknown currency, ranked last).
+        """
+        spec, _ = sites.match(url)
+        if spec is None:
+            return []
+        urls = {domain: spec.on_domain(url, domain) for domain in domains if domain in spec.domains}
+        offers = []
+        for (domain, domain_url), info in zip(urls.items(), await self.fetch_many(urls.values(), lane)):
+            if isinstance(info, Exception):
+                logger.info(f"No offer on {domain}: {info}")
+                continue
+            rate = CURRENCY_USD_RATES.get(info['currency'])
+            offers.append({**info, 'url': domain_url, 'domain': domain, 'usd': info['price'] * rate if rate else None})
+        offers.sort(key=lambda offer: (offer['usd'] is None, offer['usd'] or 0.0))
+        return offers
+
+    async def _fetch(self, url: str, ticket: Ticket) -> Dict:
+        is_supported, site_name = self.scraper.is_supported_site(url)
+        if not is_supported:
+            return self.scraper.extract_product_info(url)  # raises the unsupported-site error
+        breaker = self.breakers[site_name]
+        delays = backoff_delays(self.retries)
+        while True:
+            if not breaker.allow():
+                BREAKER_SKIPS.inc(site=site_name)
+                raise CircuitOpenError(site_name, breaker.retry_at)
+            try:
+                egress = self.scraper.egress.choose(site_name)
+                # Like backoff, the rate limiter's wait happens before taking a lane slot
+                delay = egress.rate_limiter(url).reserve(ticket.lane == INTERACTIVE)
+                if delay:
+                    await asyncio.sleep(delay)
+                await self.lanes.acquire(ticket)
+                interactive = ticket.lane == INTERACTIVE
+                attempt = self._start(url, interactive, egress)
+                if interactive and self.hedge:
+                    info = await self._hedged(url, site_name, attempt, egress)
+                else:
+                    info = await attempt
+            except ScrapeError as e:
+                if e.cause in ('transient', 'blocked'):
+                    breaker.record_failure()
+                else:
+                    # The site answered; a parse or 404 failure says nothing about its health
+                    breaker.record_success()
+                delay = next(delays, None) if e.retryable else None
+                if delay is None:
+                    raise
+                FETCH_RETRY_COUNT.inc(site=site_name, cause=e.cause)
+                logger.debug(f"Retrying {url} in {delay:.1f}s after: {e}")
+            except asyncio.CancelledError:
+                # Every exit must settle the breaker, or a half-open probe would block the site for good
+                breaker.release()
+                raise
+            except Exception:
+                breaker.record_failure()  # an error the transport didn't wrap
+                raise
+            else:
+                breaker.record_success()
+                return info
+            # Backoff happens outside the lane so the slot goes to someone else meanwhile
+            await asyncio.sleep(delay)
+
+    def _start(self, url: str, interactive: bool, egress: Egress, use_cache: bool = True) -> asyncio.Future:
+        """Run one page fetch on a worker thread; its lane slot is released when the thread is done.
+
+        The caller has already taken the fetch's slot on the egress's rate limiter.
+        """
+        extract = functools.partial(self.scraper.extract_product_info, url, use_cache=use_cache,
+                                    interactive=interactive, egress=egress, rate_limited=True)
+        future = asyncio.get_running_loop().run_in_executor(self.executor, extract)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future: asyncio.Future):
+        self.lanes.release()
+        if not future.cancelled():
+            future.exception()  # a losing hedge's error is expected; don't log it as unretrieved
+
+    async def _hedged(self, url: str, site_name: str, primary: asyncio.Future, egress: Egress) -> Dict:
+        """Wait for ``primary``, racing it against a request through another egress if it is slower than usual"""
+        self.hedge_budget.earn()
+        delay = self.scraper.latency[site_name].quantile(HEDGE_QUANTILE)
+        delay = HEDGE_DEFAULT_DELAY if delay is None else max(HEDGE_MIN_DELAY, delay)
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self.lanes.try_acquire(INTERACTIVE):
+            return await primary
+        hedge_egress = self.scraper.egress.choose(site_name, avoid=egress)
+        # The hedge must not wait on its rate limiter while holding the slot: only send it if it can go now
+        if not self.hedge_budget.spend() or hedge_egress.rate_limiter(url).reserve(True, max_delay=0) is None:
+            self.lanes.release()
+            return await primary
+        hedge = self._start(url, True, hedge_egress, use_cache=False)
+        attempts = {primary: 'primary', hedge: 'hedge'}
+        while True:
+            done, _ = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                winner = attempts.pop(future)
+                # A failed attempt only counts if the other one failed too
+                if future.exception() is None or not attempts:
+                    HEDGED_FETCHES.inc(site=site_name, winner=winner)
+                    return future.result()
+
+
+# Global fetch pipeline
+pipeline = Lazy(lambda: FetchPipeline(default_scraper))
@@ -0,0 +1,172 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Iterator, Optional
+
+from config import (RETRY_BASE_DELAY, RETRY_MAX_DELAY, BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN,
+                    BLOCK_MARKERS, LATENCY_WINDOW, HEDGE_MIN_SAMPLES, HEDGE_BUDGET_RATIO, HEDGE_BUDGET_BURST)
+
+
+class ScrapeError(ValueError):
+    """A product could not be scraped; the message is safe to show to users"""
+
+    cause = 'error'
+    retryable = False
+
+
+class TransientError(ScrapeError):
+    """Network hiccup or 5xx: worth retrying within the sweep"""
+
+    cause = 'transient'
+    retryable = True
+
+
+class BlockedError(ScrapeError):
+    """The site refused us (403/429 or a CAPTCHA page): back off, don't retry"""
+
+    cause = 'blocked'
+
+
+class ParseError(ScrapeError):
+    """The page arrived but the product could not be extracted"""
+
+    cause = 'parse'
+
+
+class CircuitOpenError(ScrapeError):
+    """The site's circuit breaker is open; the check was skipped"""
+
+    cause = 'circuit_open'
+
+    def __init__(self, site_name: str, retry_at: float):
+        super().__init__(f"{site_name.title()} is temporarily unavailable. Please try again later.")
+        self.site_name = site_name
+        self.retry_at = retry_at
+
+
+BLOCK_STATUSES = {403, 429}
+TRANSIENT_STATUSES = {408, 425, 500, 502, 503, 504, 520, 521, 522, 524}
+
+
+def classify_status(status_code: int) -> type:
+    """Map an HTTP error status to the ScrapeError subclass to raise"""
+    if status_code in BLOCK_STATUSES:
+        return BlockedError
+    if status_code in TRANSIENT_STATUSES:
+        return TransientError
+    return ScrapeError
+
+
+def looks_blocked(content: bytes) -> bool:
+    """Whether a page that failed to parse is a CAPTCHA or bot wall"""
+    sample = content[:200000].lower()
+    return any(marker in sample for marker in BLOCK_MARKERS)
+
+
+def backoff_delays(retries: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> Iterator[float]:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))"""
+    for attempt in range(retries):
+        yield random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Per-site breaker: closed -> open after consecutive failures -> half-open probe after cooldown"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, site_name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 cooldown: float = BREAKER_COOLDOWN):
+        self.site_name = site_name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def retry_at(self) -> float:
+        """Wall-clock time when the next probe is allowed"""
+        return time.time() + max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a request may go out now; in half-open only one probe is let through"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def release(self):
+        """Give back a half-open probe that ended without saying anything about the site (e.g. cancelled)"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class LatencyWindow:
+    """Most recent fetch latencies of one site, for tail quantiles"""
+
+    def __init__(self, size: int = LATENCY_WINDOW, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The q-quantile of the window, or None until min_samples fetches were seen"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgeBudget:
+    """Caps hedged requests at ``ratio`` of eligible requests, with a small burst allowance"""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET_RATIO, burst: float = HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self._lock = threading.Lock()
+
+    def earn(self):
+        """Credit one eligible request"""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        """Take the budget for one hedge, if there is any left"""
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
@@ -1,71 +1,201 @@
 import asyncio
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from db import db
+import logging
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional
+from async_db import adb
 from scraper import scraper
-from config import STANDARD_CHECK_INTERVAL, PREMIUM_CHECK_INTERVAL
-from aiogram import Bot
+from pipeline import pipeline
+from resilience import ScrapeError, CircuitOpenError
+from adaptive import plan_next_checks, tier_bounds, next_check_at, format_timestamp, utcnow
+from config import (SWEEP_CONCURRENCY, ADAPTIVE_TICK_MINUTES, ADAPTIVE_HISTORY_DAYS, MAX_CHECKS_PER_TICK,
+                    ANALYTICS_INTERVAL_MINUTES)
+from metrics import SWEEP_SECONDS, PRODUCTS_CHECKED, ALERTS_SENT, SWEEP_FAILURES
 
-async def check_prices_and_notify(bot: Bot, premium_only: bool = False):
-    products = db.get_all_tracked_products()
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+
+async def send_alert(bot: 'Bot', user_id: int, text: str, kind: str):
+    """Send a price alert, counting successes and failures"""
+    try:
+        await bot.send_message(user_id, text, parse_mode="HTML", disable_web_page_preview=False)
+        ALERTS_SENT.inc(kind=kind)
+    except Exception as e:
+        SWEEP_FAILURES.inc(cause='notify')
+        logger.warning(f"Failed to send {kind} alert to {user_id}: {e}")
+
+def format_crossed_alert(alert: Dict, new_price: float) -> str:
+    """Alert text for a subscription returned by Database.claim_crossed_alerts"""
+    currency = alert['currency']
+    if alert['kind'] == 'drop_threshold':
+        headline = f"📉 <b>Down {alert['drop_percent']:g}%!</b>"
+        reference = f"alert at {currency}{alert['threshold']:,.2f}"
+    else:
+        headline = "🎯 <b>Target Price Reached!</b>"
+        reference = f"target: {currency}{alert['threshold']:,.2f}"
+    return (
+        f"{headline}\n"
+        f"<b>{alert['title']}</b> is now <b>{currency}{new_price:,.2f}</b> ({reference})\n"
+        f"<a href='{alert['affiliate_url']}'>View Product</a>"
+    )
+
+async def check_product(bot: 'Bot', products: List[Dict], tier: str, stats: Optional[Dict] = None) -> List[Dict]:
+    """Fetch one catalog product's current price once for all its tracked copies, send alerts and
+    store it; returns the updated products. ``stats`` is its product_stats row, if any"""
+    PRODUCTS_CHECKED.inc(len(products), tier=tier)
+    info = await pipeline.fetch(products[0]['url'], tier)  # tier names double as fetch lanes
+    new_price = info['price']
+    currency = info['currency']
+    title = info['title']
+    lowest = ""
+    if stats and stats['low_90d'] is not None and new_price <= stats['low_90d']:
+        lowest = "\n📉 Lowest price in 90 days"
     for product in products:
-        user_id = product['telegram_id']
-        url = product['url']
         old_price = product['current_price']
-        target_price = product['target_price']
-        premium = product['premium_features']
-        site_name = product['site_name']
-        # Only process users in the correct group
-        if premium_only and not premium:
-            continue
-        if not premium_only and premium:
-            continue
+        affiliate_url = product['affiliate_url'] or product['url']
+        # If price dropped
+        if new_price < old_price:
+            text = (
+                f"🔥 <b>Price Drop Alert!</b>\n"
+                f"<b>{title}</b> is now <b>{currency}{new_price:,.2f}</b> (was {currency}{old_price:,.2f}){lowest}\n"
+                f"<a href='{affiliate_url}'>View Product</a>"
+            )
+            await send_alert(bot, product['telegram_id'], text, 'price_drop')
+    # Every subscription to these URLs whose target or drop threshold was just crossed
+    for url in dict.fromkeys(product['url'] for product in products):
         try:
-            info = scraper.extract_product_info(url)
-            new_price = info['price']
-            currency = info['currency']
-            title = info['title']
-            affiliate_url = db.add_affiliate_tag(url, site_name)
-            # If price dropped
-            if new_price < old_price:
-                text = (
-                    f"🔥 <b>Price Drop Alert!</b>\n"
-                    f"<b>{title}</b> is now <b>{currency}{new_price:,.2f}</b> (was {currency}{old_price:,.2f})\n"
-                    f"<a href='{affiliate_url}'>View Product</a>"
-                )
-                await bot.send_message(user_id, text, parse_mode="HTML", disable_web_page_preview=False)
-            # If target price is set and reached
-            if target_price and new_price <= target_price:
-                text = (
-                    f"🎯 <b>Target Price Reached!</b>\n"
-                    f"<b>{title}</b> is now <b>{currency}{new_price:,.2f}</b> (target: {currency}{target_price:,.2f})\n"
-                    f"<a href='{affiliate_url}'>View Product</a>"
-                )
-                await bot.send_message(user_id, text, parse_mode="HTML", disable_web_page_preview=False)
-            # Update price in DB
-            db.update_product_price(product['id'], new_price, currency)
+            crossed = await adb.claim_crossed_alerts(url, new_price)
         except Exception as e:
-            # Optionally log or notify admin
-            continue
+            SWEEP_FAILURES.inc(cause='db')
+            logger.error(f"Failed to evaluate alerts for {url}: {e}")
+            crossed = []
+        for alert in crossed:
+            await send_alert(bot, alert['user_id'], format_crossed_alert(alert, new_price), alert['kind'])
+    # Update prices in DB; queued together, the facade writes them in one transaction
+    results = await asyncio.gather(
+        *(adb.update_product_price(product['id'], new_price, currency) for product in products),
+        return_exceptions=True
+    )
+    for product, result in zip(products, results):
+        if isinstance(result, Exception):
+            SWEEP_FAILURES.inc(cause='db')
+            logger.error(f"Failed to store price for product {product['id']}: {result}")
+    return [{**product, 'current_price': new_price, 'currency': currency} for product in products]
+
+async def run_checks(bot: 'Bot', products: List[Dict], label: str):
+    """Check products with SWEEP_CONCURRENCY parallel fetches, then schedule their next checks.
+
+    Products sharing a catalog key (the same real product under different URLs
+    or users) are fetched once.
+    """
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(SWEEP_CONCURRENCY * 4)
+    checked = []
+    schedules = []
+    now = utcnow()
+    groups: Dict[str, List[Dict]] = {}
+    for product in products:
+        groups.setdefault(product.get('catalog_key') or product['url'], []).append(product)
+    try:
+        stats = await adb.get_catalog_stats([key for key in groups if key])
+    except Exception as e:
+        logger.warning(f"Could not load product stats: {e}")
+        stats = {}
+
+    async def guarded(key, group):
+        premium = any(product['premium_features'] for product in group)
+        tier = 'premium' if premium else 'standard'
+        async with semaphore:
+            try:
+                checked.extend(await check_product(bot, group, tier, stats.get(key)))
+                return
+            except CircuitOpenError as e:
+                # Site is down: try again once its breaker allows a probe
+                SWEEP_FAILURES.inc(cause=e.cause)
+                retry_at = format_timestamp(datetime.utcfromtimestamp(e.retry_at))
+                schedules.extend({'id': product['id'], 'next_check_at': retry_at} for product in group)
+                return
+            except ScrapeError as e:
+                SWEEP_FAILURES.inc(cause=e.cause)
+                logger.info(f"Price check failed for {group[0]['url']}: {e}")
+            except Exception as e:
+                SWEEP_FAILURES.inc(cause='unexpected')
+                logger.exception(f"Unexpected error checking {group[0]['url']}: {e}")
+            # Failed checks retry after the tier's shortest interval
+            for product in group:
+                _, retry_hours, _ = tier_bounds(bool(product['premium_features']))
+                schedules.append({'id': product['id'], 'next_check_at': next_check_at(retry_hours, now)})
+
+    await asyncio.gather(*(guarded(key, group) for key, group in groups.items()))
+    SWEEP_SECONDS.observe(time.perf_counter() - started, tier=label)
+
+    try:
+        if checked:
+            history = await adb.get_recent_price_history([product['id'] for product in checked], ADAPTIVE_HISTORY_DAYS)
+            schedules.extend(plan_next_checks(checked, history, await adb.get_average_check_weight()))
+        await adb.schedule_checks(schedules)
+    except Exception as e:
+        SWEEP_FAILURES.inc(cause='db')
+        logger.error(f"Failed to schedule next checks: {e}")
+    # Persist what the scraper learned about selector hit rates
+    try:
+        await adb.save_selector_stats(scraper.selector_stats.drain())
+    except Exception as e:
+        SWEEP_FAILURES.inc(cause='db')
+        logger.error(f"Failed to save selector stats: {e}")
+
+async def check_due_products(bot: 'Bot'):
+    """Check the products whose adaptive next check time has passed"""
+    try:
+        products = await adb.get_due_products(MAX_CHECKS_PER_TICK)
+    except Exception as e:
+        SWEEP_FAILURES.inc(cause='db')
+        logger.error(f"Could not load due products: {e}")
+        return
+    if products:
+        await run_checks(bot, products, 'due')
+
+async def refresh_analytics():
+    """Rebuild product_stats from the whole price history"""
+    from analytics import rebuild_stats  # NumPy only loads with the first run
+    started = time.perf_counter()
+    try:
+        # Loading, computing and saving all run on a thread of their own: neither the event loop
+        # nor the AsyncDatabase workers that handlers' queries queue for wait on the rebuild
+        count = await asyncio.to_thread(rebuild_stats, adb.database)
+    except Exception as e:
+        logger.error(f"Price analytics failed: {e}")
+        return
+    logger.info(f"Price analytics: {count} products in {time.perf_counter() - started:.2f}s")
 
-def start_scheduler(bot: Bot):
+async def start_scheduler(bot: 'Bot'):
+    # Resume selector ordering from previous runs
+    scraper.selector_stats.load(await adb.get_selector_stats())
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
     scheduler = AsyncIOScheduler()
-    # Standard users: every STANDARD_CHECK_INTERVAL hours
+    # Every product has its own next_check_at, adapted to its price history
+    # within the tier bounds; the tick picks up whatever is due.
     scheduler.add_job(
-        check_prices_and_notify,
+        check_due_products,
         'interval',
-        hours=STANDARD_CHECK_INTERVAL,
-        args=[bot, False],
-        id='price_check_standard',
-        replace_existing=True
+        minutes=ADAPTIVE_TICK_MINUTES,
+        args=[bot],
+        id='price_check_due',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
     )
-    # Premium users: every PREMIUM_CHECK_INTERVAL hours
     scheduler.add_job(
-        check_prices_and_notify,
+        refresh_analytics,
         'interval',
-        hours=PREMIUM_CHECK_INTERVAL,
-        args=[bot, True],
-        id='price_check_premium',
-        replace_existing=True
+        minutes=ANALYTICS_INTERVAL_MINUTES,
+        id='price_analytics',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now()
     )
-    scheduler.start() 
-    
\ No newline at end of file
+    scheduler.start()
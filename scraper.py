@@ -1,336 +1,311 @@
-import requests
+import logging
 import re
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
-from typing import Dict, Optional, Tuple
-from config import SUPPORTED_SITES, USER_AGENT
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from lazy import Lazy
+from config import SELECTOR_STATS_DECAY, SELECTOR_REVALIDATE_EVERY, SCRAPE_CACHE_MAX_ENTRIES, ARCHIVE_ENABLED
+from metrics import (registry, FETCH_SECONDS, PARSE_SECONDS, PARSE_SOURCE, SELECTOR_HITS, SELECTOR_EVALUATIONS,
+                     SELECTOR_DRIFT, SCRAPE_FAILURES, HTTP_POOL_CONNECTIONS, HTTP_POOL_REQUESTS, HTTP_POOL_REUSE,
+                     HTTP_REQUESTS_BY_VERSION, DNS_CACHE_LOOKUPS)
+from sites import sites, SiteSpec
+from structured_data import extract_structured
+from transport import TransportError, HTTPStatusError, dns_cache
+from archive import archive
+from egress import EgressPool, Egress, OK, ERROR, BLOCKED
+from resilience import (ScrapeError, TransientError, BlockedError, ParseError, LatencyWindow, classify_status,
+                        looks_blocked)
+
+logger = logging.getLogger(__name__)
+
+PRICE_RE = re.compile(r'[\d,]+\.?\d*')
+
+
+class SelectorStats:
+    """Decayed hit rates per selector, keyed by (site, region, field).
+    
+    Selectors are tried in order of observed hit rate; every
+    ``revalidate_every`` pages a key is re-validated by evaluating the
+    whole chain, which keeps fallback rates fresh and exposes layout drift.
+    """
+    
+    def __init__(self, decay: float = SELECTOR_STATS_DECAY, revalidate_every: int = SELECTOR_REVALIDATE_EVERY):
+        self.decay = decay
+        self.revalidate_every = revalidate_every
+        self._stats = {}  # key -> {selector: [hits, evaluations]}
+        self._pages = {}  # key -> pages seen since start
+        self._dirty = set()
+        self._lock = threading.Lock()
+    
+    def plan(self, key: Tuple[str, str, str], selectors: list) -> Tuple[list, bool]:
+        """Return the evaluation order for a chain and whether this page re-validates it"""
+        with self._lock:
+            pages = self._pages.get(key, 0) + 1
+            self._pages[key] = pages
+            stats = self._stats.get(key)
+        revalidate = pages % self.revalidate_every == 0
+        if not stats:
+            return selectors, revalidate
+        
+        def rate(item):
+            position, selector = item
+            hits, evaluations = stats.get(selector, (0.0, 0.0))
+            # Laplace smoothing keeps unseen selectors in the middle of the pack
+            return (-(hits + 1) / (evaluations + 2), position)
+        
+        return [selector for _, selector in sorted(enumerate(selectors), key=rate)], revalidate
+    
+    def record(self, key: Tuple[str, str, str], selector: str, hit: bool):
+        with self._lock:
+            stats = self._stats.setdefault(key, {})
+            hits, evaluations = stats.get(selector, (0.0, 0.0))
+            stats[selector] = [hits * self.decay + (1 if hit else 0), evaluations * self.decay + 1]
+            self._dirty.add(key)
+    
+    def load(self, rows: List[Dict]):
+        """Seed stats from persisted rows"""
+        with self._lock:
+            for row in rows:
+                key = (row['site'], row['region'], row['field'])
+                self._stats.setdefault(key, {})[row['selector']] = [row['hits'], row['evaluations']]
+    
+    def drain(self) -> List[Dict]:
+        """Return rows changed since the last drain, for persisting"""
+        with self._lock:
+            rows = [
+                {'site': key[0], 'region': key[1], 'field': key[2], 'selector': selector,
+                 'hits': hits, 'evaluations': evaluations}
+                for key in self._dirty
+                for selector, (hits, evaluations) in self._stats.get(key, {}).items()
+            ]
+            self._dirty.clear()
+        return rows
+
 
 class ProductScraper:
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': USER_AGENT,
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
+        self.egress = EgressPool(pool_sizes={
+            domain: spec.pool_size for spec in sites if spec.pool_size for domain in spec.domains
         })
+        self.selector_stats = SelectorStats()
+        self.latency = {spec.name: LatencyWindow() for spec in sites}
+        self._cache = {}  # url -> (expires_at, product info)
+        self._cache_lock = threading.Lock()
+        registry.add_collector(self.collect_metrics)
+    
+    @property
+    def transport(self):
+        """The first egress's Transport (the direct connection unless EGRESS_DIRECT is off)"""
+        return self.egress.egresses[0].transport
+    
+    @property
+    def session(self):
+        """The first egress's requests.Session (None on the HTTP/2 backend)"""
+        return self.transport.session
+    
+    def pool_stats(self) -> Dict[str, Dict]:
+        """Connection pool stats per host, summed over all egresses"""
+        totals = {}
+        for egress in self.egress.egresses:
+            for host, stats in egress.transport.pool_stats().items():
+                total = totals.setdefault(host, {'connections': 0, 'requests': 0})
+                total['connections'] += stats['connections']
+                if stats['requests'] is None or total['requests'] is None:
+                    total['requests'] = None
+                else:
+                    total['requests'] += stats['requests']
+        for total in totals.values():
+            if total['requests']:
+                total['reuse_rate'] = 1 - total['connections'] / total['requests']
+        return totals
+    
+    def collect_metrics(self):
+        """Publish connection pool and DNS cache stats"""
+        for host, stats in self.pool_stats().items():
+            HTTP_POOL_CONNECTIONS.set(stats['connections'], host=host)
+            if stats['requests'] is not None:
+                HTTP_POOL_REQUESTS.set(stats['requests'], host=host)
+            if 'reuse_rate' in stats:
+                HTTP_POOL_REUSE.set(stats['reuse_rate'], host=host)
+        versions = {}
+        for egress in self.egress.egresses:
+            for version, count in egress.transport.requests_by_version.items():
+                versions[version] = versions.get(version, 0) + count
+        for version, count in versions.items():
+            HTTP_REQUESTS_BY_VERSION.set(count, version=version)
+        DNS_CACHE_LOOKUPS.set(dns_cache.hits, result='hit')
+        DNS_CACHE_LOOKUPS.set(dns_cache.misses, result='miss')
     
     def is_supported_site(self, url: str) -> Tuple[bool, str]:
         """Check if URL is from a supported site and return site name"""
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc.lower()
-        
-        for site_name, site_info in SUPPORTED_SITES.items():
-            if any(supported_domain in domain for supported_domain in site_info['domains']):
-                return True, site_name
-        
+        spec, _ = sites.match(url)
+        if spec:
+            return True, spec.name
         return False, None
     
-    def extract_product_info(self, url: str) -> Dict:
-        """Extract product information from URL"""
-        is_supported, site_name = self.is_supported_site(url)
-        if not is_supported:
-            raise ValueError("Unsupported website. Please use Amazon, AliExpress, Jumia, or Konga.")
+    def extract_product_info(self, url: str, use_cache: bool = True, interactive: bool = False,
+                             egress: Optional[Egress] = None, rate_limited: bool = False) -> Dict:
+        """Extract product information from URL.
+        
+        ``interactive`` fetches use the rate share kept for users; ``egress``
+        defaults to a health-weighted choice from the pool. ``rate_limited``
+        means the caller already waited for the egress's rate limiter.
+        """
+        spec, domain = sites.match(url)
+        if not spec:
+            raise ScrapeError("Unsupported website. Please use Amazon, AliExpress, Jumia, or Konga.")
+        
+        if use_cache:
+            cached = self.get_cached(url)
+            if cached:
+                return cached
         
+        egress = egress or self.egress.choose(spec.name)
+        if not rate_limited:
+            egress.rate_limiters[spec.rate_limit_key(domain)].wait(interactive)
+        started = time.perf_counter()
+        outcome = ERROR
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
+            try:
+                response = egress.transport.get(url)
+            except HTTPStatusError as e:
+                error = classify_status(e.status_code)
+                if error is BlockedError:
+                    outcome = BLOCKED
+                elif error is not TransientError:
+                    outcome = OK  # a 404 says nothing about the egress
+                SCRAPE_FAILURES.inc(site=spec.name, cause=f'http_{error.cause}')
+                raise error(f"Failed to fetch product page: {str(e)}")
+            except TransportError as e:
+                SCRAPE_FAILURES.inc(site=spec.name, cause='network')
+                raise TransientError(f"Failed to fetch product page: {str(e)}")
+            finally:
+                elapsed = time.perf_counter() - started
+                FETCH_SECONDS.observe(elapsed, site=spec.name)
+                self.latency[spec.name].record(elapsed)
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            if site_name == 'amazon':
-                return self._scrape_amazon(soup, url)
-            elif site_name == 'aliexpress':
-                return self._scrape_aliexpress(soup, url)
-            elif site_name == 'jumia':
-                return self._scrape_jumia(soup, url)
-            elif site_name == 'konga':
-                return self._scrape_konga(soup, url)
-            else:
-                raise ValueError(f"Scraper not implemented for {site_name}")
+            if ARCHIVE_ENABLED:
+                self._archive(url, spec.name, response.content)
+            try:
+                info = self.parse_product_page(response.content, url, spec.name)
+            except BlockedError:
+                outcome = BLOCKED
+                raise
+            except ParseError:
+                outcome = OK  # the page did arrive: a layout change or sold-out page isn't the egress's fault
+                raise
+            outcome = OK
+        finally:
+            self.egress.record(egress, spec.name, outcome, elapsed)
+        self._cache_put(url, info, spec.cache_ttl)
+        return dict(info)
+    
+    def _archive(self, url: str, site_name: str, content: bytes):
+        """Keep the raw page for offline re-extraction; a full disk must not fail the fetch"""
+        try:
+            archive.put(url, site_name, content)
+        except OSError as e:
+            logger.warning(f"Could not archive {url}: {e}")
+    
+    def parse_product_page(self, content: bytes, url: str, site_name: str) -> Dict:
+        """Extract product information from a fetched page"""
+        spec = sites.get(site_name)
+        _, domain = sites.match(url)
+        try:
+            with PARSE_SECONDS.time(site=site_name):
+                # Fast path: JSON-LD or embedded state, no DOM needed
+                info = extract_structured(content, spec.embedded_state)
+                if info:
+                    PARSE_SOURCE.inc(site=site_name, source=info.pop('source'))
+                    info['currency'] = info['currency'] or spec.currency_for(domain)
+                    info['site_name'] = site_name
+                    return info
                 
-        except requests.RequestException as e:
-            raise ValueError(f"Failed to fetch product page: {str(e)}")
+                PARSE_SOURCE.inc(site=site_name, source='dom')
+                from bs4 import BeautifulSoup  # only pages without structured data need it
+                soup = BeautifulSoup(content, 'html.parser')
+                return self._scrape_dom(soup, spec, domain or site_name)
         except Exception as e:
-            raise ValueError(f"Failed to parse product information: {str(e)}")
+            if looks_blocked(content):
+                SCRAPE_FAILURES.inc(site=site_name, cause='captcha')
+                raise BlockedError(f"Blocked by {site_name.title()} (CAPTCHA page)")
+            SCRAPE_FAILURES.inc(site=site_name, cause='parse')
+            raise ParseError(f"Failed to parse product information: {str(e)}")
     
-    def _scrape_amazon(self, soup: BeautifulSoup, url: str) -> Dict:
-        """Scrape Amazon product page"""
-        # Product title
-        title_selectors = [
-            '#productTitle',
-            'h1.a-size-large',
-            'h1.a-size-base-plus',
-            '.a-size-large.product-title-word-break'
-        ]
-        
-        title = None
-        for selector in title_selectors:
-            title_elem = soup.select_one(selector)
-            if title_elem:
-                title = title_elem.get_text(strip=True)
-                break
-        
-        # Price
-        price_selectors = [
-            '.a-price-whole',
-            '.a-price .a-offscreen',
-            '#priceblock_ourprice',
-            '#priceblock_dealprice',
-            '.a-price-range .a-offscreen'
-        ]
-        
-        price = None
-        currency = '$'
-        for selector in price_selectors:
-            price_elem = soup.select_one(selector)
-            if price_elem:
-                price_text = price_elem.get_text(strip=True)
-                # Extract price and currency
-                price_match = re.search(r'[\d,]+\.?\d*', price_text.replace(',', ''))
-                if price_match:
-                    price = float(price_match.group().replace(',', ''))
-                    # Detect currency
-                    if '€' in price_text:
-                        currency = '€'
-                    elif '£' in price_text:
-                        currency = '£'
-                    elif '₹' in price_text:
-                        currency = '₹'
-                    elif '¥' in price_text:
-                        currency = '¥'
-                    elif 'R$' in price_text:
-                        currency = 'R$'
-                    elif 'MX$' in price_text:
-                        currency = 'MX$'
-                    elif 'A$' in price_text:
-                        currency = 'A$'
-                    break
-        
-        # Image
-        image_selectors = [
-            '#landingImage',
-            '#imgBlkFront',
-            '.a-dynamic-image',
-            'img[data-old-hires]'
-        ]
-        
-        image_url = None
-        for selector in image_selectors:
-            img_elem = soup.select_one(selector)
-            if img_elem:
-                image_url = img_elem.get('src') or img_elem.get('data-src')
-                if image_url:
-                    break
-        
-        if not title:
-            raise ValueError("Could not extract product title")
-        if not price:
-            raise ValueError("Could not extract product price")
-        
-        return {
-            'title': title,
-            'price': price,
-            'currency': currency,
-            'image_url': image_url,
-            'site_name': 'amazon'
-        }
+    def get_cached(self, url: str) -> Optional[Dict]:
+        """Return a fresh cached result for a URL, if any"""
+        entry = self._cache.get(url)
+        if entry and entry[0] > time.monotonic():
+            return dict(entry[1])
+        return None
     
-    def _scrape_aliexpress(self, soup: BeautifulSoup, url: str) -> Dict:
-        """Scrape AliExpress product page"""
-        # Product title
-        title_selectors = [
-            '.product-title',
-            'h1.product-title-text',
-            '.product-title-text'
-        ]
-        
-        title = None
-        for selector in title_selectors:
-            title_elem = soup.select_one(selector)
-            if title_elem:
-                title = title_elem.get_text(strip=True)
-                break
-        
-        # Price
-        price_selectors = [
-            '.product-price-current',
-            '.product-price-value',
-            '.price-current'
-        ]
-        
-        price = None
-        currency = '$'
-        for selector in price_selectors:
-            price_elem = soup.select_one(selector)
-            if price_elem:
-                price_text = price_elem.get_text(strip=True)
-                price_match = re.search(r'[\d,]+\.?\d*', price_text.replace(',', ''))
-                if price_match:
-                    price = float(price_match.group().replace(',', ''))
-                    if '€' in price_text:
-                        currency = '€'
-                    elif '¥' in price_text:
-                        currency = '¥'
-                    break
-        
-        # Image
-        image_selectors = [
-            '.images-view-item img',
-            '.product-image img',
-            '.magnifier-image'
-        ]
-        
-        image_url = None
-        for selector in image_selectors:
-            img_elem = soup.select_one(selector)
-            if img_elem:
-                image_url = img_elem.get('src') or img_elem.get('data-src')
-                if image_url:
-                    break
-        
-        if not title:
-            raise ValueError("Could not extract product title")
-        if not price:
-            raise ValueError("Could not extract product price")
-        
-        return {
-            'title': title,
-            'price': price,
-            'currency': currency,
-            'image_url': image_url,
-            'site_name': 'aliexpress'
-        }
+    def _cache_put(self, url: str, info: Dict, ttl: float):
+        if ttl <= 0:
+            return
+        with self._cache_lock:
+            if len(self._cache) >= SCRAPE_CACHE_MAX_ENTRIES:
+                now = time.monotonic()
+                for key in [key for key, (expires_at, _) in self._cache.items() if expires_at <= now]:
+                    del self._cache[key]
+                # Still full: drop the oldest insertions
+                while len(self._cache) >= SCRAPE_CACHE_MAX_ENTRIES:
+                    del self._cache[next(iter(self._cache))]
+            self._cache[url] = (time.monotonic() + ttl, info)
     
-    def _scrape_jumia(self, soup: BeautifulSoup, url: str) -> Dict:
-        """Scrape Jumia product page"""
-        # Product title
-        title_selectors = [
-            'h1[data-name="product-title"]',
-            '.product-title',
-            'h1.title'
-        ]
-        
-        title = None
-        for selector in title_selectors:
-            title_elem = soup.select_one(selector)
-            if title_elem:
-                title = title_elem.get_text(strip=True)
-                break
-        
-        # Price
-        price_selectors = [
-            '.price',
-            '.product-price',
-            '.price-current',
-            '[data-price]'
-        ]
-        
-        price = None
-        currency = '₦'
-        for selector in price_selectors:
-            price_elem = soup.select_one(selector)
-            if price_elem:
-                price_text = price_elem.get_text(strip=True)
-                price_match = re.search(r'[\d,]+\.?\d*', price_text.replace(',', ''))
-                if price_match:
-                    price = float(price_match.group().replace(',', ''))
-                    # Detect currency based on domain
-                    if 'jumia.co.ke' in url:
-                        currency = 'KSh'
-                    elif 'jumia.com.gh' in url:
-                        currency = 'GH₵'
-                    elif 'jumia.co.ug' in url:
-                        currency = 'USh'
-                    elif 'jumia.com.tn' in url:
-                        currency = 'TND'
-                    elif 'jumia.dz' in url:
-                        currency = 'DZD'
-                    elif 'jumia.ma' in url:
-                        currency = 'MAD'
-                    elif 'jumia.com.eg' in url:
-                        currency = 'EGP'
-                    break
-        
-        # Image
-        image_selectors = [
-            '.image-gallery-slide img',
-            '.product-image img',
-            '.gallery-image'
-        ]
+    def _select(self, soup, spec: SiteSpec, region: str, field: str, extract):
+        """Try a field's selectors in order of observed hit rate and return the first extracted value.
         
-        image_url = None
-        for selector in image_selectors:
-            img_elem = soup.select_one(selector)
-            if img_elem:
-                image_url = img_elem.get('src') or img_elem.get('data-src')
-                if image_url:
+        ``extract`` turns a matched element into a value, or None when the element
+        is unusable. On re-validation passes every selector is evaluated so the
+        hit rates of fallbacks stay fresh.
+        """
+        selectors = spec.selectors.get(field, ())
+        compiled = spec.compiled_selectors.get(field, {})
+        key = (spec.name, region, field)
+        order, revalidate = self.selector_stats.plan(key, selectors)
+        result = None
+        winner = None
+        for selector in order:
+            SELECTOR_EVALUATIONS.inc(site=spec.name, field=field)
+            elem = compiled[selector].select_one(soup)
+            value = extract(elem) if elem else None
+            self.selector_stats.record(key, selector, value is not None)
+            if value is not None and result is None:
+                result, winner = value, selector
+                if not revalidate:
                     break
-        
-        if not title:
-            raise ValueError("Could not extract product title")
-        if not price:
-            raise ValueError("Could not extract product price")
-        
-        return {
-            'title': title,
-            'price': price,
-            'currency': currency,
-            'image_url': image_url,
-            'site_name': 'jumia'
-        }
+        if revalidate and winner is not None and winner != order[0]:
+            SELECTOR_DRIFT.inc(site=spec.name, field=field)
+            logger.warning(f"Selector drift on {key}: preferred {order[0]!r} no longer matches, {winner!r} does")
+        SELECTOR_HITS.inc(site=spec.name, field=field,
+                          position=selectors.index(winner) if winner is not None else 'none')
+        return result
     
-    def _scrape_konga(self, soup: BeautifulSoup, url: str) -> Dict:
-        """Scrape Konga product page"""
-        # Product title
-        title_selectors = [
-            '.product-name',
-            'h1.product-title',
-            '.product-details h1'
-        ]
-        
-        title = None
-        for selector in title_selectors:
-            title_elem = soup.select_one(selector)
-            if title_elem:
-                title = title_elem.get_text(strip=True)
-                break
-        
-        # Price
-        price_selectors = [
-            '.price',
-            '.product-price',
-            '.current-price',
-            '[data-price]'
-        ]
-        
-        price = None
-        currency = '₦'
-        for selector in price_selectors:
-            price_elem = soup.select_one(selector)
-            if price_elem:
-                price_text = price_elem.get_text(strip=True)
-                price_match = re.search(r'[\d,]+\.?\d*', price_text.replace(',', ''))
-                if price_match:
-                    price = float(price_match.group().replace(',', ''))
-                    break
-        
-        # Image
-        image_selectors = [
-            '.product-image img',
-            '.gallery-image img',
-            '.main-image'
-        ]
-        
-        image_url = None
-        for selector in image_selectors:
-            img_elem = soup.select_one(selector)
-            if img_elem:
-                image_url = img_elem.get('src') or img_elem.get('data-src')
-                if image_url:
-                    break
+    @staticmethod
+    def _text(elem) -> Optional[str]:
+        return elem.get_text(strip=True) or None
+    
+    @staticmethod
+    def _image(elem) -> Optional[str]:
+        return elem.get('src') or elem.get('data-src')
+    
+    @staticmethod
+    def _parse_price(price_text: str) -> Optional[float]:
+        price_match = PRICE_RE.search(price_text.replace(',', ''))
+        if price_match:
+            return float(price_match.group())
+        return None
+    
+    def _price(self, elem) -> Optional[Tuple[float, str]]:
+        price_text = elem.get_text(strip=True)
+        price = self._parse_price(price_text)
+        return (price, price_text) if price is not None else None
+    
+    def _scrape_dom(self, soup, spec: SiteSpec, region: str) -> Dict:
+        """Scrape a product page with the site's selector chains"""
+        title = self._select(soup, spec, region, 'title', self._text)
+        price, price_text = self._select(soup, spec, region, 'price', self._price) or (None, '')
+        image_url = self._select(soup, spec, region, 'image', self._image)
         
         if not title:
             raise ValueError("Could not extract product title")
@@ -340,49 +315,16 @@ class ProductScraper:
         return {
             'title': title,
             'price': price,
-            'currency': currency,
+            'currency': spec.currency_for(region, price_text),
             'image_url': image_url,
-            'site_name': 'konga'
+            'site_name': spec.name
         }
 
 def clean_product_url(url: str, site_name: str) -> str:
-    from urllib.parse import urlparse, parse_qs, urlunparse, unquote
-    if site_name == 'amazon':
-        # Try to extract /dp/ASIN from any Amazon URL
-        import re
-        match = re.search(r"/dp/([A-Z0-9]{10})", url)
-        if match:
-            asin = match.group(1)
-            return f"https://www.amazon.com/dp/{asin}"
-        # Sometimes ASIN is in /gp/product/ASIN
-        match = re.search(r"/gp/product/([A-Z0-9]{10})", url)
-        if match:
-            asin = match.group(1)
-            return f"https://www.amazon.com/dp/{asin}"
-        # If url is a redirect (e.g., /sspa/click?...&url=%2Fdp%2FB09VVDYM7N%2F...)
-        parsed = urlparse(url)
-        qs = parse_qs(parsed.query)
-        if 'url' in qs:
-            decoded = unquote(qs['url'][0])
-            return clean_product_url(decoded, 'amazon')
-        return url.split('?')[0]
-    elif site_name == 'aliexpress':
-        # Remove query params, keep only main product URL
-        parsed = urlparse(url)
-        clean_url = urlunparse(parsed._replace(query="", fragment=""))
-        return clean_url
-    elif site_name == 'jumia':
-        # Remove query params, keep only main product URL
-        parsed = urlparse(url)
-        clean_url = urlunparse(parsed._replace(query="", fragment=""))
-        return clean_url
-    elif site_name == 'konga':
-        # Remove query params, keep only main product URL
-        parsed = urlparse(url)
-        clean_url = urlunparse(parsed._replace(query="", fragment=""))
-        return clean_url
-    else:
-        return url
+    spec = sites.get(site_name)
+    if spec:
+        return spec.canonicalize(url)
+    return url
 
 # Global scraper instance
-scraper = ProductScraper() 
+scraper = Lazy(ProductScraper)
\ No newline at end of file
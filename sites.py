@@ -0,0 +1,174 @@
+import re
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs, urlunparse, unquote
+
+from config import SUPPORTED_SITES
+
+ASIN_PATTERNS = (
+    re.compile(r"/dp/([A-Z0-9]{10})"),
+    # Sometimes ASIN is in /gp/product/ASIN
+    re.compile(r"/gp/product/([A-Z0-9]{10})"),
+)
+
+
+def canonical_asin(url: str, host: Optional[str] = None) -> str:
+    """Reduce an Amazon URL to https://www.<marketplace>/dp/<ASIN>, keeping its marketplace"""
+    host = (urlparse(url).hostname or host or '').lower()
+    # smile.amazon.co.uk, www.amazon.de... -> amazon.co.uk, amazon.de
+    marketplace = host[host.index('amazon.'):] if 'amazon.' in host else 'amazon.com'
+    for pattern in ASIN_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return f"https://www.{marketplace}/dp/{match.group(1)}"
+    # If url is a redirect (e.g., /sspa/click?...&url=%2Fdp%2FB09VVDYM7N%2F...)
+    parsed = urlparse(url)
+    qs = parse_qs(parsed.query)
+    if 'url' in qs:
+        return canonical_asin(unquote(qs['url'][0]), host)
+    return url.split('?')[0]
+
+
+def canonical_strip_query(url: str) -> str:
+    """Remove query params, keep only main product URL"""
+    parsed = urlparse(url)
+    return urlunparse(parsed._replace(query="", fragment=""))
+
+
+CANONICALIZERS = {
+    'asin': canonical_asin,
+    'strip_query': canonical_strip_query,
+}
+
+
+class EmbeddedStateSpec:
+    """Where a site's embedded JSON state starts and which key paths hold each field"""
+
+    __slots__ = ('pattern', 'title', 'price', 'currency', 'image')
+
+    def __init__(self, config: Dict):
+        self.pattern = re.compile(config['pattern'].encode())  # matched on raw bytes
+        self.title = [tuple(path) for path in config.get('title', [])]
+        self.price = [tuple(path) for path in config.get('price', [])]
+        self.currency = [tuple(path) for path in config.get('currency', [])]
+        self.image = [tuple(path) for path in config.get('image', [])]
+
+
+class SiteSpec:
+    """Compiled, immutable description of one supported shop"""
+
+    __slots__ = (
+        'name', 'domains', 'affiliate_tag', 'selectors', '_compiled_selectors', 'currency',
+        'currency_by_domain', 'currency_symbols', 'canonicalize', 'rate_limit', 'pool_size',
+        'cache_ttl', 'embedded_state', 'product_id', 'product_id_scope', 'rate_limit_scope',
+    )
+
+    def __init__(self, name: str, config: Dict):
+        self.name = name
+        self.domains = tuple(dict.fromkeys(domain.lower() for domain in config['domains']))
+        self.affiliate_tag = config.get('affiliate_tag', '')
+        self.selectors = {field: tuple(chain) for field, chain in config.get('selectors', {}).items()}
+        self._compiled_selectors = None
+        self.currency = config.get('currency', '$')
+        self.currency_by_domain = dict(config.get('currency_by_domain', {}))
+        # Longest first so 'MX$' wins over '$'
+        self.currency_symbols = tuple(sorted(set(config.get('currency_symbols', [])), key=len, reverse=True))
+        self.canonicalize = CANONICALIZERS[config.get('canonical_url', 'strip_query')]
+        self.rate_limit = float(config.get('rate_limit', 0))
+        self.rate_limit_scope = config.get('rate_limit_scope', 'site')
+        self.pool_size = config.get('pool_size')
+        self.cache_ttl = float(config.get('cache_ttl', 0))
+        state = config.get('embedded_state')
+        self.embedded_state = EmbeddedStateSpec(state) if state else None
+        self.product_id = re.compile(config['product_id']) if config.get('product_id') else None
+        self.product_id_scope = config.get('product_id_scope', 'site')
+
+    @property
+    def compiled_selectors(self) -> Dict[str, Dict]:
+        """soupsieve-compiled selector chains, built the first time a page needs the DOM"""
+        if self._compiled_selectors is None:
+            import soupsieve
+            self._compiled_selectors = {
+                field: {selector: soupsieve.compile(selector) for selector in chain}
+                for field, chain in self.selectors.items()
+            }
+        return self._compiled_selectors
+
+    def currency_for(self, domain: str, price_text: str = '') -> str:
+        """Currency for a marketplace domain, falling back to symbols in the price text"""
+        currency = self.currency_by_domain.get(domain)
+        if currency:
+            return currency
+        for symbol in self.currency_symbols:
+            if symbol in price_text:
+                return symbol
+        return self.currency
+
+    def rate_limit_keys(self) -> Tuple[str, ...]:
+        """Keys of this site's rate limiters: the site, or each of its domains"""
+        return self.domains if self.rate_limit_scope == 'domain' else (self.name,)
+
+    def rate_limit_key(self, domain: str) -> str:
+        return domain if self.rate_limit_scope == 'domain' else self.name
+
+    def on_domain(self, url: str, domain: str) -> str:
+        """The canonical URL of the same product on another of the site's domains"""
+        parsed = urlparse(self.canonicalize(url))
+        return urlunparse(parsed._replace(netloc=f'www.{domain}'))
+
+    def affiliate_url(self, url: str) -> str:
+        """URL with the site's affiliate tag appended"""
+        if '?' in url:
+            return url + self.affiliate_tag
+        return url + self.affiliate_tag.replace('&', '?')
+
+    def product_key(self, url: str, domain: Optional[str] = None) -> Optional[str]:
+        """Catalog key from the shop's product ID in the URL, e.g. 'aliexpress:1005001234'"""
+        if self.product_id is None:
+            return None
+        match = self.product_id.search(urlparse(url).path)
+        if not match:
+            return None
+        if self.product_id_scope == 'domain':
+            return f"{self.name}:{domain or urlparse(url).hostname}:{match.group(1)}"
+        return f"{self.name}:{match.group(1)}"
+
+
+class SiteRegistry:
+    """Supported sites with an O(1) host-suffix index"""
+
+    def __init__(self, sites_config: Dict):
+        self._specs: Dict[str, SiteSpec] = {}
+        self._by_domain: Dict[str, SiteSpec] = {}
+        for name, config in sites_config.items():
+            spec = SiteSpec(name, config)
+            self._specs[name] = spec
+            for domain in spec.domains:
+                self._by_domain[domain] = spec
+
+    def __iter__(self):
+        return iter(self._specs.values())
+
+    def get(self, site_name: str) -> Optional[SiteSpec]:
+        return self._specs.get(site_name)
+
+    def match_host(self, host: str) -> Tuple[Optional[SiteSpec], Optional[str]]:
+        """Return the site spec and the supported domain for a hostname"""
+        host = host.lower().rstrip('.')
+        # Walk suffixes longest first: www.amazon.com.au -> amazon.com.au -> com.au -> au
+        while host:
+            spec = self._by_domain.get(host)
+            if spec:
+                return spec, host
+            _, _, host = host.partition('.')
+        return None, None
+
+    def match(self, url: str) -> Tuple[Optional[SiteSpec], Optional[str]]:
+        """Return the site spec and the supported domain for a URL"""
+        return self.match_host(urlparse(url).hostname or '')
+
+    def domains(self) -> List[str]:
+        return list(self._by_domain)
+
+
+# Global site registry
+sites = SiteRegistry(SUPPORTED_SITES)
@@ -0,0 +1,188 @@
+import json
+import re
+from typing import Dict, Optional
+
+from config import CURRENCY_SYMBOLS
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _JSONError = (orjson.JSONDecodeError, ValueError)
+except ImportError:  # orjson is optional, fall back to the stdlib parser
+    _loads = json.loads
+    _JSONError = ValueError
+
+# <script type="application/ld+json"> ... </script> blocks, matched on raw bytes
+LD_JSON_RE = re.compile(
+    rb'<script[^>]+type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL
+)
+
+# Brackets and quotes delimit a JSON value; inside a string only its closing quote matters
+_JSON_STRUCTURE_RE = re.compile(rb'[\[\]{}"]')
+_JSON_STRING_TAIL_RE = re.compile(rb'(?:[^"\\]|\\.)*"', re.DOTALL)
+_PRICE_RE = re.compile(r'\d+(?:\.\d+)?')
+
+
+def _to_price(value) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value) if value > 0 else None
+    if isinstance(value, str):
+        match = _PRICE_RE.search(value.replace(',', ''))
+        if match:
+            price = float(match.group())
+            return price if price > 0 else None
+    return None
+
+
+def _to_currency(code) -> Optional[str]:
+    if not isinstance(code, str) or not code:
+        return None
+    return CURRENCY_SYMBOLS.get(code.upper(), code)
+
+
+def _dig(data, path):
+    for key in path:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return data
+
+
+def _first(data, paths):
+    for path in paths:
+        value = _dig(data, path)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def _json_value_end(content: bytes, start: int) -> Optional[int]:
+    """Return the offset just past the JSON object or array at start, None if unterminated"""
+    if content[start:start + 1] not in (b'{', b'['):
+        return None
+    depth = 0
+    position = start
+    while True:
+        match = _JSON_STRUCTURE_RE.search(content, position)
+        if not match:
+            return None
+        position = match.end()
+        char = match.group()
+        if char == b'"':
+            tail = _JSON_STRING_TAIL_RE.match(content, position)
+            if not tail:
+                return None
+            position = tail.end()
+        elif char in (b'{', b'['):
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return position
+
+
+def _iter_ld_nodes(node):
+    """Yield every JSON-LD object, flattening lists and @graph containers"""
+    if isinstance(node, list):
+        for item in node:
+            yield from _iter_ld_nodes(item)
+    elif isinstance(node, dict):
+        yield node
+        if '@graph' in node:
+            yield from _iter_ld_nodes(node['@graph'])
+
+
+def _is_product(node: Dict) -> bool:
+    node_type = node.get('@type')
+    if isinstance(node_type, list):
+        return 'Product' in node_type
+    return node_type == 'Product'
+
+
+def _offer_price(offers):
+    """Return (price, currency code) from an Offer, AggregateOffer or list of offers"""
+    best = (None, None)
+    for offer in offers if isinstance(offers, list) else [offers]:
+        if not isinstance(offer, dict):
+            continue
+        price = _to_price(offer.get('price'))
+        if price is None:
+            price = _to_price(offer.get('lowPrice'))
+        if price is None and isinstance(offer.get('priceSpecification'), dict):
+            price = _to_price(offer['priceSpecification'].get('price'))
+        if price is not None and (best[0] is None or price < best[0]):
+            best = (price, offer.get('priceCurrency'))
+    return best
+
+
+def _image_url(image) -> Optional[str]:
+    if isinstance(image, list):
+        image = image[0] if image else None
+    if isinstance(image, dict):
+        image = image.get('url') or image.get('contentUrl')
+    return image if isinstance(image, str) else None
+
+
+def extract_ld_json(content: bytes) -> Optional[Dict]:
+    """Extract title/price/currency from a schema.org Product block"""
+    if b'application/ld+json' not in content:
+        return None
+    for match in LD_JSON_RE.finditer(content):
+        try:
+            document = _loads(match.group(1).strip())
+        except _JSONError:
+            continue
+        for node in _iter_ld_nodes(document):
+            if not _is_product(node):
+                continue
+            price, currency = _offer_price(node.get('offers'))
+            title = node.get('name')
+            if price is None or not isinstance(title, str) or not title.strip():
+                continue
+            return {
+                'title': title.strip(),
+                'price': price,
+                'currency': _to_currency(currency),
+                'image_url': _image_url(node.get('image')),
+            }
+    return None
+
+
+def extract_embedded_state(content: bytes, spec) -> Optional[Dict]:
+    """Extract product fields from a site's embedded JSON state blob (an EmbeddedStateSpec)"""
+    if spec is None:
+        return None
+    match = spec.pattern.search(content)
+    if not match:
+        return None
+    # Slice the blob out by bytes so trailing JS is left behind and the page is never decoded
+    end = _json_value_end(content, match.end())
+    if end is None:
+        return None
+    try:
+        data = _loads(content[match.end():end])
+    except _JSONError:
+        return None
+    title = _first(data, spec.title)
+    price = _to_price(_first(data, spec.price))
+    if price is None or not isinstance(title, str) or not title.strip():
+        return None
+    return {
+        'title': title.strip(),
+        'price': price,
+        'currency': _to_currency(_first(data, spec.currency)),
+        'image_url': _image_url(_first(data, spec.image)),
+    }
+
+
+def extract_structured(content: bytes, state_spec=None) -> Optional[Dict]:
+    """Try JSON-LD and embedded state blobs; return None when the DOM is needed"""
+    for source, extract in (('ld_json', lambda: extract_ld_json(content)),
+                            ('state', lambda: extract_embedded_state(content, state_spec))):
+        info = extract()
+        if info:
+            info['source'] = source
+            return info
+    return None
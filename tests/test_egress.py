@@ -0,0 +1,120 @@
+"""Egress pool routing: quarantine of bad egresses, probation afterwards, and what counts as a failure"""
+import random
+
+import pytest
+
+import egress as egress_module
+from config import EGRESS_QUARANTINE_SECONDS
+from egress import EgressPool, RateLimiter, OK, ERROR, BLOCKED
+from resilience import ParseError
+from scraper import ProductScraper
+from transport import FetchResponse
+
+SITE = 'amazon'
+URL = 'https://www.amazon.com/dp/B000000001'
+# Egress names are host:port; nothing here opens a connection
+HEALTHY, DEAD, BLOCKING = 'http://10.0.0.1:3128', 'http://10.0.0.2:3128', 'http://10.0.0.3:3128'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(egress_module.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def pool(clock):
+    return EgressPool([HEALTHY, DEAD, BLOCKING], direct=False)
+
+
+def by_proxy(pool):
+    return {egress.proxy: egress for egress in pool.egresses}
+
+
+def route(pool, requests: int, block_rate: float = 0.6, seed: int = 1):
+    """Send requests through the pool: the healthy egress always succeeds, the dead one always
+    errors and the blocking one is blocked ``block_rate`` of the time; returns requests per proxy"""
+    rng = random.Random(seed)
+    sent = {HEALTHY: 0, DEAD: 0, BLOCKING: 0}
+    quarantined = {HEALTHY: 0, DEAD: 0, BLOCKING: 0}
+    for _ in range(requests):
+        egress = pool.choose(SITE)
+        sent[egress.proxy] += 1
+        if egress.proxy == DEAD:
+            outcome = ERROR
+        elif egress.proxy == BLOCKING and rng.random() < block_rate:
+            outcome = BLOCKED
+        else:
+            outcome = OK
+        before = egress.health[SITE].quarantined_until
+        pool.record(egress, SITE, outcome, 0.05)
+        if egress.health[SITE].quarantined_until != before and egress.health[SITE].quarantined_until:
+            quarantined[egress.proxy] += 1
+    return sent, quarantined
+
+
+def test_bad_egresses_are_quarantined_and_healthy_one_is_not(pool):
+    sent, quarantined = route(pool, 300)
+    assert quarantined[HEALTHY] == 0
+    assert quarantined[DEAD] >= 1
+    assert quarantined[BLOCKING] >= 1
+    assert sent[HEALTHY] > sent[DEAD] + sent[BLOCKING]
+    egresses = by_proxy(pool)
+    assert egresses[HEALTHY].health[SITE].quarantined_until == 0.0
+
+
+def test_quarantined_egress_is_probed_again_and_held_longer_on_repeat(pool, clock):
+    dead = by_proxy(pool)[DEAD]
+    for _ in range(3):
+        pool.record(dead, SITE, ERROR, 0.05)
+    health = dead.health[SITE]
+    first_hold = health.quarantined_until - clock.now
+    assert first_hold == pytest.approx(EGRESS_QUARANTINE_SECONDS)
+    assert all(pool.choose(SITE) is not dead for _ in range(200))
+
+    clock.now += first_hold + 1
+    pool.choose(SITE)  # the expired quarantine is lifted: back on probation with a clean record
+    assert health.quarantined_until == 0.0 and health.failures == 0
+    assert any(pool.choose(SITE) is dead for _ in range(500))
+
+    for _ in range(3):
+        pool.record(dead, SITE, ERROR, 0.05)
+    assert health.quarantined_until - clock.now == pytest.approx(2 * first_hold)
+
+
+def test_quarantine_is_per_site(pool):
+    dead = by_proxy(pool)[DEAD]
+    for _ in range(3):
+        pool.record(dead, SITE, ERROR, 0.05)
+    assert dead.health[SITE].quarantined_until
+    assert not dead.health['jumia'].quarantined_until
+
+
+class UnparseablePages:
+    """Transport stand-in: the page arrives, but there is no product on it"""
+
+    def get(self, url):
+        return FetchResponse(url, 200, {}, b'<html><body><h1>This item is sold out</h1></body></html>', 'HTTP/1.1', 0.01)
+
+
+def test_parse_failures_do_not_count_against_the_egress(clock):
+    scraper = ProductScraper()
+    scraper.egress = EgressPool([HEALTHY, DEAD], direct=False)
+    healthy = by_proxy(scraper.egress)[HEALTHY]
+    healthy.transport = UnparseablePages()
+    healthy.rate_limiters = {key: RateLimiter(0) for key in healthy.rate_limiters}
+    for _ in range(10):
+        with pytest.raises(ParseError):
+            scraper.extract_product_info(URL, use_cache=False, egress=healthy)
+    health = healthy.health[SITE]
+    assert health.quarantined_until == 0.0
+    assert health.failures == 0
@@ -0,0 +1,82 @@
+"""max_products holds when many threads add products for the same users at once"""
+import sqlite3
+import threading
+
+import pytest
+
+import db as db_module
+
+USERS = 8
+THREADS = 16
+ATTEMPTS = 25  # per thread, far more than the users' slots
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_module, 'DATABASE_PATH', str(tmp_path / 'deal_finder.db'))
+    database = db_module.Database()
+    for user_id in range(1, USERS + 1):
+        database.create_user(user_id, f"user{user_id}")
+    return database
+
+
+def add_concurrently(database, remove_every: int = 0):
+    """Add products from THREADS threads released together; returns the exceptions that weren't quota rejections"""
+    barrier = threading.Barrier(THREADS)
+    errors = []
+
+    def worker(worker_id: int):
+        barrier.wait()
+        for attempt in range(ATTEMPTS):
+            user_id = (worker_id + attempt) % USERS + 1
+            try:
+                product_id = database.add_product(user_id, f"https://www.amazon.com/dp/Q{worker_id:03d}{attempt:05d}",
+                                                  'Quota product', 10.0, '$', site_name='amazon')
+                if remove_every and attempt % remove_every == 0:
+                    database.remove_product(product_id, user_id)
+            except ValueError:
+                pass  # over the limit: the expected rejection
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def audit(database):
+    """(max_products, product_count, actual products) per user"""
+    conn = sqlite3.connect(database.db_path)
+    rows = conn.execute('''
+        SELECT u.max_products, u.product_count, COUNT(p.id)
+        FROM users u LEFT JOIN products p ON p.user_id = u.telegram_id
+        GROUP BY u.telegram_id
+    ''').fetchall()
+    conn.close()
+    return rows
+
+
+def test_concurrent_adds_fill_quotas_exactly(database):
+    assert add_concurrently(database) == []
+    rows = audit(database)
+    assert len(rows) == USERS
+    for limit, counter, actual in rows:
+        assert actual == limit  # never over, and the rejections didn't leave slots unused
+        assert counter == actual
+
+
+def test_quota_survives_interleaved_removals(database):
+    assert add_concurrently(database, remove_every=3) == []
+    for limit, counter, actual in audit(database):
+        assert actual <= limit
+        assert counter == actual
+
+
+def test_hot_set_count_matches_table(database):
+    add_concurrently(database)
+    for user_id in range(1, USERS + 1):
+        assert database.get_user_product_count(user_id) == len(database.get_user_products(user_id))
+        assert database.get_user_product_count(user_id) == database.get_user(user_id)['max_products']
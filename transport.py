@@ -0,0 +1,304 @@
+import functools
+import logging
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import (USER_AGENT, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_HOSTS, HTTP_POOL_MAXSIZE,
+                    HTTP2_ENABLED, DNS_CACHE_TTL)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import httpx
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    HAS_HTTP2 = True
+except ImportError:  # httpx[http2] is optional
+    httpx = None
+    HAS_HTTP2 = False
+
+try:
+    import brotli  # noqa: F401  (urllib3 and httpx decode br when it is importable)
+    HAS_BROTLI = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        HAS_BROTLI = True
+    except ImportError:
+        HAS_BROTLI = False
+
+DEFAULT_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate, br' if HAS_BROTLI else 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+
+class TransportError(Exception):
+    """Network-level failure: DNS, connect, TLS, timeout or reset"""
+
+
+class HTTPStatusError(TransportError):
+    """The server answered with a 4xx/5xx status"""
+
+    def __init__(self, status_code: int, url: str):
+        super().__init__(f"{status_code} error for url: {url}")
+        self.status_code = status_code
+        self.url = url
+
+
+class FetchResponse:
+    """Backend-neutral response"""
+
+    __slots__ = ('url', 'status_code', 'headers', 'content', 'http_version', 'elapsed')
+
+    def __init__(self, url: str, status_code: int, headers, content: bytes, http_version: str, elapsed: float):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.http_version = http_version
+        self.elapsed = elapsed
+
+
+class DNSCache:
+    """TTL cache of host name lookups for the scraper's own connections.
+
+    Only Transport's connections resolve through it (see CachedDNSAdapter and
+    CachedDNSBackend); socket.getaddrinfo itself is left alone, so the bot's
+    Telegram client and every other library resolve as usual.
+    """
+
+    def __init__(self, ttl: float = DNS_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def resolve(self, host: str, port: int) -> List[str]:
+        """Addresses of ``host`` to connect to, in getaddrinfo order; raises socket.gaierror"""
+        key = (host, port)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (now + self.ttl, addresses)
+        return addresses
+
+
+dns_cache = DNSCache()
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_dns_pool_classes() -> Dict[str, type]:
+    """urllib3 connection pools whose connections resolve through dns_cache"""
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+    from urllib3.util.connection import create_connection
+
+    class CachedDNSConnection:
+        def _new_conn(self) -> socket.socket:
+            # Same errors as urllib3's own _new_conn; TLS still verifies and sends SNI for self.host
+            try:
+                addresses = dns_cache.resolve(self._dns_host, self.port)
+            except socket.gaierror as e:
+                raise NameResolutionError(self.host, self, e) from e
+            error = None
+            for address in addresses:
+                try:
+                    return create_connection((address, self.port), self.timeout,
+                                             source_address=self.source_address, socket_options=self.socket_options)
+                except socket.timeout as e:
+                    error = ConnectTimeoutError(
+                        self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})")
+                    error.__cause__ = e
+                except OSError as e:
+                    error = NewConnectionError(self, f"Failed to establish a new connection: {e}")
+                    error.__cause__ = e
+            raise error
+
+    class CachedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = type('CachedHTTPConnection', (CachedDNSConnection, HTTPConnection), {})
+
+    class CachedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = type('CachedHTTPSConnection', (CachedDNSConnection, HTTPSConnection), {})
+
+    return {'http': CachedHTTPConnectionPool, 'https': CachedHTTPSConnectionPool}
+
+
+def cached_dns_adapter(**kwargs):
+    """A requests HTTPAdapter whose pools (proxied ones included) resolve through dns_cache"""
+    from requests.adapters import HTTPAdapter
+    pool_classes = _cached_dns_pool_classes()
+
+    class CachedDNSAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **pool_kwargs):
+            super().init_poolmanager(*args, **pool_kwargs)
+            self.poolmanager.pool_classes_by_scheme = pool_classes
+
+        def proxy_manager_for(self, proxy, **proxy_kwargs):
+            manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+            manager.pool_classes_by_scheme = pool_classes
+            return manager
+
+    return CachedDNSAdapter(**kwargs)
+
+
+def cached_dns_backend():
+    """An httpcore network backend that resolves through dns_cache"""
+    import httpcore
+
+    class CachedDNSBackend(httpcore.SyncBackend):
+        def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+            # httpcore passes the origin host to start_tls separately, so SNI and verification are unchanged
+            try:
+                address = dns_cache.resolve(host, port)[0]
+            except socket.gaierror as e:
+                raise httpcore.ConnectError(str(e)) from e
+            return super().connect_tcp(address, port, timeout, local_address, socket_options)
+
+    return CachedDNSBackend()
+
+
+class Transport:
+    """HTTP client for product pages.
+
+    Uses httpx with HTTP/2 multiplexing when httpx[http2] is installed and
+    HTTP2_ENABLED is set, otherwise a requests.Session. Either way the
+    shops in pool_sizes get a connection cap of their own. Both keep
+    connections alive, split connect and read timeouts, decode Brotli when
+    available and share the DNS cache, which only these transports use.
+    """
+
+    def __init__(self, pool_sizes: Optional[Dict[str, int]] = None, proxy: Optional[str] = None,
+                 http2: bool = HTTP2_ENABLED, connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = HTTP_READ_TIMEOUT, pool_maxsize: int = HTTP_POOL_MAXSIZE):
+        self.proxy = proxy
+        self.timeout = (connect_timeout, read_timeout)
+        self.requests_by_version: Dict[str, int] = {}
+        self._stats_lock = threading.Lock()
+        if http2 and HAS_HTTP2:
+            self.backend = 'httpx'
+            self.session = None
+            # Like the requests pools below: busy shops get a connection cap of their own
+            mounts = {}
+            for domain, size in (pool_sizes or {}).items():
+                shop_transport = self._httpx_transport(proxy, size)
+                for pattern in (f'all://{domain}', f'all://*.{domain}'):
+                    mounts[pattern] = shop_transport
+            self.client = httpx.Client(
+                transport=self._httpx_transport(proxy, HTTP_POOL_HOSTS * pool_maxsize),
+                mounts=mounts,
+                headers=DEFAULT_HEADERS,
+                follow_redirects=True,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            )
+        else:
+            # requests is only imported once a Transport is actually built
+            import requests
+            from requests.adapters import HTTPAdapter
+            self.backend = 'requests'
+            self.client = None
+            self._request_error = requests.RequestException
+            self.session = requests.Session()
+            self.session.headers.update(DEFAULT_HEADERS)
+            if proxy:
+                self.session.proxies = {'http': proxy, 'https': proxy}
+            adapter_class = cached_dns_adapter if dns_cache.enabled else HTTPAdapter
+            default = adapter_class(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=pool_maxsize, max_retries=0)
+            self.session.mount('http://', default)
+            self.session.mount('https://', default)
+            # Longest prefix wins, so busy shops get their own, larger pools
+            for domain, size in (pool_sizes or {}).items():
+                adapter = adapter_class(pool_connections=4, pool_maxsize=size, max_retries=0)
+                for prefix in (f'https://{domain}', f'https://www.{domain}'):
+                    self.session.mount(prefix, adapter)
+
+    @staticmethod
+    def _httpx_transport(proxy: Optional[str], max_connections: int):
+        transport = httpx.HTTPTransport(
+            http2=True,
+            proxy=proxy,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        # httpx has no option for a network backend; its pool (plain or proxy) takes one
+        if dns_cache.enabled and hasattr(transport._pool, '_network_backend'):
+            transport._pool._network_backend = cached_dns_backend()
+        return transport
+
+    def get(self, url: str) -> FetchResponse:
+        """GET a page; raises HTTPStatusError for error statuses, TransportError otherwise"""
+        started = time.perf_counter()
+        if self.backend == 'httpx':
+            try:
+                response = self.client.get(url)
+            except httpx.HTTPError as e:
+                raise TransportError(str(e)) from e
+            result = FetchResponse(str(response.url), response.status_code, response.headers,
+                                   response.content, response.http_version, time.perf_counter() - started)
+        else:
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                content = response.content
+            except self._request_error as e:
+                raise TransportError(str(e)) from e
+            version = {10: 'HTTP/1.0', 11: 'HTTP/1.1'}.get(getattr(response.raw, 'version', 11), 'HTTP/1.1')
+            result = FetchResponse(response.url, response.status_code, response.headers,
+                                   content, version, time.perf_counter() - started)
+        with self._stats_lock:
+            self.requests_by_version[result.http_version] = self.requests_by_version.get(result.http_version, 0) + 1
+        if result.status_code >= 400:
+            raise HTTPStatusError(result.status_code, url)
+        return result
+
+    def pool_stats(self) -> Dict[str, Dict]:
+        """Connections opened vs requests served per host, for reuse rates"""
+        stats = {}
+        if self.backend == 'requests':
+            adapters = {id(adapter): adapter for adapter in self.session.adapters.values()}
+            for adapter in adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    host = stats.setdefault(pool.host, {'connections': 0, 'requests': 0})
+                    host['connections'] += pool.num_connections
+                    host['requests'] += pool.num_requests
+        else:
+            transports = {id(transport): transport
+                          for transport in [self.client._transport, *self.client._mounts.values()] if transport}
+            for transport in transports.values():
+                pool = getattr(transport, '_pool', None)
+                for connection in getattr(pool, 'connections', []):
+                    origin = getattr(connection, '_origin', None)
+                    host_name = origin.host.decode() if origin else 'unknown'
+                    host = stats.setdefault(host_name, {'connections': 0, 'requests': 0})
+                    host['connections'] += 1
+            for host in stats.values():
+                host['requests'] = None  # httpcore does not count requests per connection
+        for host in stats.values():
+            if host['requests']:
+                host['reuse_rate'] = 1 - host['connections'] / host['requests']
+        return stats
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        if self.session is not None:
+            self.session.close()